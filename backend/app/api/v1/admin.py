@@ -24,8 +24,13 @@ from app.domain.services.user_service import get_user_by_id
 from app.domain.services.portfolio_service import refresh_portfolio_assets_and_daily_values
 from app.domain.services.broker_connections_service import get_user_portfolio_connections
 from app.domain.services.task_service import create_import_task
-from app.infrastructure.database.database_service import table_select_async, rpc_async
+from app.infrastructure.database.database_service import table_select_async, rpc_async, use_primary
+from app.infrastructure.database.postgres_async import get_pool_stats
+from app.infrastructure.database.query_metrics import get_query_metrics, reset_query_metrics
+from app.infrastructure.database.plan_capture import get_captured_plans, clear_captured_plans
 from app.infrastructure.cache import invalidate_cache
+from app.infrastructure.cache.cache_metrics import get_cache_metrics, reset_cache_metrics
+from app.infrastructure.cache.codec import get_codec_stats, reset_codec_stats
 from app.utils.response import success_response
 
 logger = get_logger(__name__)
@@ -50,6 +55,63 @@ async def admin_support_messages(_: dict = Depends(get_current_admin_user)):
     return success_response(data={"support_messages": messages}, message="OK")
 
 
+@router.get("/db-metrics")
+async def admin_db_metrics(
+    sort: str = "total_ms",
+    reset: bool = False,
+    _: dict = Depends(get_current_admin_user),
+):
+    """
+    Метрики запросов к БД этого процесса: ожидание пула, время выполнения, строки, байты JSON
+    по RPC-функциям и таблицам. sort: total_ms | p95_ms | calls | acquire_ms; reset=true — сбросить после чтения.
+    """
+    payload = get_query_metrics(sort_by=sort)
+    payload["pools"] = get_pool_stats()
+    if reset:
+        reset_query_metrics()
+    return success_response(data=payload, message="OK")
+
+
+@router.get("/cache-metrics")
+async def admin_cache_metrics(
+    reset: bool = False,
+    _: dict = Depends(get_current_admin_user),
+):
+    """
+    Метрики кэша этого процесса: попадания (L1 / Redis / устаревшие), промахи, время заполнения,
+    размеры записей и степень сжатия по шаблонам ключей; инвалидации по источникам; ошибки Redis.
+    reset=true — сбросить после чтения. Крупнейшие ключи в Redis — python -m scripts.cache_top_keys.
+    """
+    payload = get_cache_metrics()
+    payload["sizes"] = get_codec_stats()
+    if reset:
+        reset_cache_metrics()
+        reset_codec_stats()
+    return success_response(data=payload, message="OK")
+
+
+@router.get("/db-plans")
+async def admin_db_plans(
+    download: bool = False,
+    clear: bool = False,
+    _: dict = Depends(get_current_admin_user),
+):
+    """
+    Планы медленных RPC этого процесса (EXPLAIN ANALYZE, BUFFERS), параметры и время вызова.
+    download=true — JSON-файлом; clear=true — очистить буфер после чтения.
+    """
+    plans = get_captured_plans()
+    if clear:
+        clear_captured_plans()
+    if download:
+        filename = f"db-plans-{int(time.time())}.json"
+        return ORJSONResponse(
+            content=plans,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+    return success_response(data={"plans": plans}, message="OK")
+
+
 @router.post("/support-messages/reply", status_code=201)
 async def admin_support_reply(
     body: AdminSupportReplyBody,
@@ -101,7 +163,7 @@ async def _admin_assert_portfolio_owned_by_user(portfolio_id: int, user_id: str)
 
 
 async def _admin_invalidate_user_dashboard(user_id: str) -> None:
-    await invalidate_cache("dashboard:{user_id}", user_id=str(user_id))
+    await invalidate_cache("dashboard:{user_id}", source="admin", tags=("user:{user_id}",), user_id=str(user_id))
 
 
 @router.post("/users/{user_id}/portfolios/{portfolio_id}/refresh", status_code=HTTPStatus.ACCEPTED)
@@ -112,11 +174,12 @@ async def admin_user_portfolio_refresh(
 ):
     """Пересчёт портфеля (как POST /portfolios/{id}/refresh) — для выбранного пользователя."""
     uid = str(user_id)
-    target = await get_user_by_id(uid)
-    if not target:
-        raise NotFoundError("Пользователь")
-    await _admin_assert_portfolio_owned_by_user(portfolio_id, uid)
-    result = await refresh_portfolio_assets_and_daily_values(portfolio_id)
+    with use_primary():
+        target = await get_user_by_id(uid)
+        if not target:
+            raise NotFoundError("Пользователь")
+        await _admin_assert_portfolio_owned_by_user(portfolio_id, uid)
+        result = await refresh_portfolio_assets_and_daily_values(portfolio_id)
     await _admin_invalidate_user_dashboard(uid)
     return success_response(
         data={"result": result},
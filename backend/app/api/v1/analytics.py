@@ -3,14 +3,14 @@ API endpoints для аналитики.
 Версия 1.
 """
 from fastapi import APIRouter, Depends
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, db_connection_scope
 from app.utils.response import success_response
 from app.domain.services.analytics_service import get_user_portfolios_analytics
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
 
-router = APIRouter(prefix="/analytics", tags=["analytics"])
+router = APIRouter(prefix="/analytics", tags=["analytics"], dependencies=[Depends(db_connection_scope)])
 
 
 @router.get("/portfolios")
@@ -16,7 +16,7 @@ from app.domain.services.access_control_service import (
 )
 from app.domain.models.asset_models import AddAssetPriceRequest, MoveAssetRequest, BatchAddPriceRequest
 from app.constants import HTTPStatus
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, db_connection_scope
 from app.infrastructure.cache import invalidate
 from app.utils.response import success_response
 from app.core.logging import get_logger
@@ -24,11 +24,17 @@ from typing import Optional, Dict, Any
 
 logger = get_logger(__name__)
 
-router = APIRouter(prefix="/assets", tags=["assets"])
+router = APIRouter(prefix="/assets", tags=["assets"], dependencies=[Depends(db_connection_scope)])
+
+
+def _create_asset_fragment_tags(args: dict) -> list:
+    """Фрагмент дашборда портфеля новой позиции; портфель не указан — все фрагменты."""
+    portfolio_id = args["data"].get("portfolio_id")
+    return [f"portfolio:{portfolio_id}" if portfolio_id else f"user:{args['user']['id']}"]
 
 
 @router.post("/", status_code=HTTPStatus.CREATED)
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags_from=_create_asset_fragment_tags)
 async def create_asset_route(
     data: Dict[str, Any],
     user: dict = Depends(get_current_user)
@@ -50,7 +56,7 @@ async def create_asset_route(
 
 
 @router.delete("/{asset_id}")
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags=("portfolio_asset:{asset_id}",))
 async def delete_asset_route(
     asset_id: int,
     user: dict = Depends(get_current_user)
@@ -75,7 +81,7 @@ async def delete_asset_route(
 
 
 @router.post("/price", status_code=HTTPStatus.CREATED)
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags=("asset:{data.asset_id}",))
 async def add_asset_price_route(
     data: AddAssetPriceRequest,
     user: dict = Depends(get_current_user)
@@ -115,7 +121,7 @@ async def add_asset_price_route(
 
 
 @router.post("/prices/batch", status_code=HTTPStatus.CREATED)
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags=("asset:{data.asset_id}",))
 async def add_asset_prices_batch_route(
     data: BatchAddPriceRequest,
     user: dict = Depends(get_current_user)
@@ -242,7 +248,10 @@ async def get_portfolio_asset_info_route(
 
 
 @router.post("/portfolio/{portfolio_asset_id}/move")
-@invalidate("dashboard:{user.id}")
+@invalidate(
+    "dashboard:{user.id}",
+    tags=("portfolio_asset:{portfolio_asset_id}", "portfolio:{data.target_portfolio_id}"),
+)
 async def move_asset_route(
     portfolio_asset_id: int,
     data: MoveAssetRequest,
@@ -2,12 +2,27 @@
 API endpoints для дашборда.
 Версия 1.
 """
-from fastapi import APIRouter, Depends
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import ORJSONResponse
 import time
-from app.domain.services.dashboard_service import get_dashboard_data
+from app.constants import HTTPStatus
+from app.domain.services.dashboard_service import (
+    HistoryView,
+    get_dashboard_view,
+    get_dashboard_view_etag,
+    touch_dashboard_user,
+)
 from app.core.dependencies import get_current_user
-from app.utils.response import success_response
+from app.utils.response import (
+    etag_headers,
+    etag_matches,
+    make_etag,
+    not_modified_response,
+    success_response,
+)
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
@@ -16,13 +31,47 @@ router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
 
 @router.get("/")
-async def dashboard(user: dict = Depends(get_current_user)):
-    """Получение данных дашборда пользователя."""
+async def dashboard(
+    request: Request,
+    user: dict = Depends(get_current_user),
+    history_range: str = Query("ALL", alias="range"),
+    resolution: str = Query("daily"),
+    points: Optional[int] = Query(None, ge=3, le=5000),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+):
+    """
+    Получение данных дашборда пользователя.
+
+    История портфелей (history.series): range — 1M/6M/1Y/ALL от последней даты истории,
+    или свои date_from/date_to; resolution — daily/weekly/monthly (последняя точка периода);
+    points — не больше points точек (LTTB). Без параметров — полная ежедневная история.
+
+    ETag — штамп содержимого кэша дашборда (и вида истории); при совпадении If-None-Match
+    со свежей записью — 304 без обращения к БД и разбора закэшированных данных.
+    """
     start = time.time()
-    
-    dashboard = await get_dashboard_data(user["id"])
+
+    try:
+        view = HistoryView(history_range, resolution, points, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etag = make_etag(await get_dashboard_view_etag(user["id"], view))
+        if etag_matches(if_none_match, etag):
+            await touch_dashboard_user(str(user["id"]))
+            logger.info(f"Dashboard user={user['id']}: 304 ({time.time() - start:.3f}s)")
+            return not_modified_response(etag)
+
+    dashboard, stamp = await get_dashboard_view(user["id"], view)
+    await touch_dashboard_user(str(user["id"]))
 
     elapsed = time.time() - start
     logger.info(f"Dashboard user={user['id']}: {elapsed:.2f}s")
 
-    return ORJSONResponse(content=success_response(data={"dashboard": dashboard}))
+    return ORJSONResponse(
+        content=success_response(data={"dashboard": dashboard}),
+        headers=etag_headers(make_etag(stamp)),
+    )
@@ -7,7 +7,7 @@ from typing import List, Optional, Set, Tuple
 
 from pydantic import BaseModel, Field
 
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, db_connection_scope
 from app.utils.response import success_response
 from app.infrastructure.database.repositories.missed_payout_repository import MissedPayoutRepository
 from app.domain.services.access_control_service import check_portfolio_asset_access, check_portfolio_access
@@ -16,7 +16,7 @@ from app.domain.services.operations_service import apply_operations
 from app.infrastructure.cache import invalidate
 from app.utils.date import normalize_date_to_string
 
-router = APIRouter(prefix="/missed-payouts", tags=["missed-payouts"])
+router = APIRouter(prefix="/missed-payouts", tags=["missed-payouts"], dependencies=[Depends(db_connection_scope)])
 
 _missed_payout_repository = MissedPayoutRepository()
 
@@ -31,6 +31,11 @@ def _missed_payout_row_key(row: dict) -> Tuple[int, int]:
     return (int(row["portfolio_asset_id"]), int(row["payout_id"]))
 
 
+def _missed_payout_fragment_tags(args: dict) -> list:
+    """Фрагменты дашборда портфелей позиций выплат."""
+    return sorted({f"portfolio_asset:{k.portfolio_asset_id}" for k in args["keys"]})
+
+
 @router.get("/")
 async def get_missed_payouts_route(
     portfolio_id: Optional[int] = None,
@@ -135,8 +140,12 @@ async def check_missed_payouts_for_portfolio_route(
         await check_portfolio_access(portfolio_id, user["id"])
 
         import asyncio
+        import contextvars
+        # Пустой контекст: задача переживает запрос и не должна занимать его соединение
+        # (db_connection_scope)
         asyncio.create_task(
-            _missed_payout_repository.check_missed_payouts_for_portfolio(portfolio_id)
+            _missed_payout_repository.check_missed_payouts_for_portfolio(portfolio_id),
+            context=contextvars.Context(),
         )
 
         return success_response(
@@ -158,8 +167,12 @@ async def check_missed_payouts_for_user_route(
     """Запускает проверку неполученных выплат для всех активов пользователя."""
     try:
         import asyncio
+        import contextvars
+        # Пустой контекст: задача переживает запрос и не должна занимать его соединение
+        # (db_connection_scope)
         asyncio.create_task(
-            _missed_payout_repository.check_missed_payouts_for_user(user["id"])
+            _missed_payout_repository.check_missed_payouts_for_user(user["id"]),
+            context=contextvars.Context(),
         )
 
         return success_response(
@@ -175,7 +188,7 @@ async def check_missed_payouts_for_user_route(
 
 
 @router.post("/add-operations-batch")
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags_from=_missed_payout_fragment_tags)
 async def add_operations_from_missed_payouts_batch_route(
     keys: List[MissedPayoutKey] = Body(...),
     user: dict = Depends(get_current_user)
@@ -18,7 +18,7 @@ from app.domain.models.operation_models import (
     UpdateOperationsBatchRequest,
 )
 from app.constants import HTTPStatus, SuccessMessages
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, db_connection_scope
 from app.infrastructure.cache import invalidate
 from app.utils.response import success_response
 from app.utils.date import parse_date_range
@@ -27,7 +27,7 @@ from typing import Optional
 
 logger = get_logger(__name__)
 
-router = APIRouter(prefix="/operations", tags=["operations"])
+router = APIRouter(prefix="/operations", tags=["operations"], dependencies=[Depends(db_connection_scope)])
 
 
 @router.get("/")
@@ -55,8 +55,21 @@ async def get_operations_route(
     return success_response(data={"operations": data})
 
 
+def _apply_fragment_tags(args: dict) -> list:
+    """Фрагменты дашборда портфелей операций; операция без портфеля и позиции — все фрагменты."""
+    tags = []
+    for op in args["data"].operations:
+        if op.portfolio_id:
+            tags.append(f"portfolio:{op.portfolio_id}")
+        elif op.portfolio_asset_id:
+            tags.append(f"portfolio_asset:{op.portfolio_asset_id}")
+        else:
+            return [f"user:{args['user']['id']}"]
+    return tags
+
+
 @router.post("/apply", status_code=HTTPStatus.CREATED)
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags_from=_apply_fragment_tags)
 async def apply_operations_route(
     data: ApplyOperationsRequest,
     user: dict = Depends(get_current_user),
@@ -93,7 +106,7 @@ async def apply_operations_route(
         )
 
 @router.patch("/apply-updates", status_code=HTTPStatus.OK)
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags=("user:{user.id}",))
 async def apply_operations_updates_route(
     request: UpdateOperationsBatchRequest,
     user: dict = Depends(get_current_user)
@@ -126,7 +139,7 @@ async def apply_operations_updates_route(
 
 
 @router.delete("/", status_code=HTTPStatus.OK)
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags=("user:{user.id}",))
 async def delete_operations_route(
     request: DeleteOperationsRequest,
     user: dict = Depends(get_current_user)
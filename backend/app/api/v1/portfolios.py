@@ -3,9 +3,9 @@ API endpoints для работы с портфелями.
 Версия 1.
 """
 from fastapi import APIRouter, Depends, HTTPException
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, db_connection_scope
 from app.utils.response import success_response
-from app.infrastructure.database.database_service import table_select_async, table_insert_async, rpc_async
+from app.infrastructure.database.database_service import table_select_async, table_insert_async, rpc_async, use_primary
 from app.domain.services.portfolio_service import (
     get_user_portfolios,
     get_portfolio_assets,
@@ -31,7 +31,7 @@ from app.core.logging import get_logger
 
 logger = get_logger(__name__)
 
-router = APIRouter(prefix="/portfolios", tags=["portfolios"])
+router = APIRouter(prefix="/portfolios", tags=["portfolios"], dependencies=[Depends(db_connection_scope)])
 
 
 @router.get("/brokers")
@@ -136,7 +136,7 @@ async def get_portfolio_route(
 
 
 @router.delete("/{portfolio_id}")
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags=("user:{user.id}",))
 async def delete_portfolio_route(
     portfolio_id: int,
     user: dict = Depends(get_current_user)
@@ -154,7 +154,7 @@ async def delete_portfolio_route(
 
 
 @router.post("/{portfolio_id}/clear")
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags=("user:{user.id}",))
 async def portfolio_clear_route(
     portfolio_id: int,
     user: dict = Depends(get_current_user)
@@ -168,14 +168,16 @@ async def portfolio_clear_route(
 
 
 @router.post("/{portfolio_id}/refresh", status_code=HTTPStatus.ACCEPTED)
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags=("portfolio:{portfolio_id}",))
 async def portfolio_refresh_route(
     portfolio_id: int,
     user: dict = Depends(get_current_user),
 ):
     """Полный пересчёт portfolio_assets и portfolio_daily_* для активов портфеля."""
-    await check_portfolio_access(portfolio_id, user["id"])
-    result = await refresh_portfolio_assets_and_daily_values(portfolio_id)
+    # Read-after-write: проверка доступа и пересчёт — только на основной БД
+    with use_primary():
+        await check_portfolio_access(portfolio_id, user["id"])
+        result = await refresh_portfolio_assets_and_daily_values(portfolio_id)
     return success_response(
         data={"result": result},
         message="Портфель успешно обновлен",
@@ -1,7 +1,7 @@
 """
 Справочник (типы, валюты, currency_rates_to_rub; список активов клиенту пустой) и поиск/мета активов.
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import ORJSONResponse
 
 from app.core.dependencies import get_current_user
@@ -9,11 +9,18 @@ from app.constants import HTTPStatus
 from app.domain.services.reference_service import (
     get_reference_data_cached,
     get_reference_fingerprint_str,
+    get_reference_version,
     search_reference_assets,
     get_reference_asset_meta,
     get_reference_asset_splits,
 )
-from app.utils.response import success_response
+from app.utils.response import (
+    etag_headers,
+    etag_matches,
+    make_etag,
+    not_modified_response,
+    success_response,
+)
 
 router = APIRouter(prefix="/reference", tags=["reference"])
 
@@ -61,7 +68,14 @@ async def reference_version(_user: dict = Depends(get_current_user)):
 
 
 @router.get("/")
-async def reference_data(_user: dict = Depends(get_current_user)):
+async def reference_data(request: Request, _user: dict = Depends(get_current_user)):
+    """Справочник; ETag — fingerprint, при совпадении If-None-Match — 304 без разбора bundle."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etag = make_etag(await get_reference_version())
+        if etag_matches(if_none_match, etag):
+            return not_modified_response(etag)
+
     payload = await get_reference_data_cached()
     fp = get_reference_fingerprint_str()
     return ORJSONResponse(
@@ -70,5 +84,6 @@ async def reference_data(_user: dict = Depends(get_current_user)):
                 "reference": payload,
                 "reference_version": fp,
             }
-        )
+        ),
+        headers=etag_headers(make_etag(fp)),
     )
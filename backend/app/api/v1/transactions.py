@@ -6,7 +6,7 @@ from fastapi import APIRouter, Query, HTTPException, Depends
 from app.domain.services.transactions_service import get_transactions, delete_transactions_batch
 from app.domain.services.access_control_service import check_multiple_transactions_access
 from app.constants import HTTPStatus
-from app.core.dependencies import get_current_user
+from app.core.dependencies import get_current_user, db_connection_scope
 from app.infrastructure.cache import invalidate
 from app.utils.response import success_response
 from app.utils.date import parse_date_range
@@ -16,7 +16,7 @@ from pydantic import BaseModel
 
 logger = get_logger(__name__)
 
-router = APIRouter(prefix="/transactions", tags=["transactions"])
+router = APIRouter(prefix="/transactions", tags=["transactions"], dependencies=[Depends(db_connection_scope)])
 
 
 class DeleteTransactionsRequest(BaseModel):
@@ -53,7 +53,7 @@ async def get_transactions_route(
 
 
 @router.delete("/")
-@invalidate("dashboard:{user.id}")
+@invalidate("dashboard:{user.id}", tags=("user:{user.id}",))
 async def delete_transactions_route(
     request: DeleteTransactionsRequest,
     user: dict = Depends(get_current_user)
@@ -44,6 +44,9 @@ def _parse_db_pool_bounds(
 _DB_ASYNC_MIN, _DB_ASYNC_MAX = _parse_db_pool_bounds(
     "DB_POOL_ASYNC_MIN", "DB_POOL_ASYNC_MAX", 1, 6
 )
+_DB_READ_MIN, _DB_READ_MAX = _parse_db_pool_bounds(
+    "DB_POOL_READ_MIN", "DB_POOL_READ_MAX", 1, 6
+)
 
 
 class Config:
@@ -67,6 +70,37 @@ class Config:
     # asyncpg пул на процесс; см. _parse_db_pool_bounds
     DB_POOL_ASYNC_MIN = _DB_ASYNC_MIN
     DB_POOL_ASYNC_MAX = _DB_ASYNC_MAX
+
+    # Реплика для чтения (опционально): read-only RPC и table_select_async.
+    # Пустой DB_READ_HOST — всё идёт на основную БД; остальные параметры по умолчанию как у неё.
+    DB_READ_HOST = os.getenv("DB_READ_HOST", "")
+    DB_READ_PORT = int(os.getenv("DB_READ_PORT", str(DB_PORT)))
+    DB_READ_NAME = os.getenv("DB_READ_NAME", DB_NAME)
+    DB_READ_USER = os.getenv("DB_READ_USER", DB_USER)
+    DB_READ_PASSWORD = os.getenv("DB_READ_PASSWORD", DB_PASSWORD)
+    DB_POOL_READ_MIN = _DB_READ_MIN
+    DB_POOL_READ_MAX = _DB_READ_MAX
+    # Отставание реплики (сек), при превышении чтения уходят на основную БД
+    DB_READ_MAX_LAG_SECONDS = float(os.getenv("DB_READ_MAX_LAG_SECONDS", "5"))
+
+    # Запросы к БД дольше порога (мс) пишутся в лог как slow_query; 0 — отключено
+    DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+
+    # Захват планов медленных RPC (см. plan_capture): доля вызовов из DB_EXPLAIN_RPCS,
+    # 0 — выключено (для dev/стенда — 1). Вызовы дольше DB_EXPLAIN_MIN_MS попадают в буфер.
+    DB_EXPLAIN_SAMPLE_RATE = float(os.getenv("DB_EXPLAIN_SAMPLE_RATE", "0"))
+    DB_EXPLAIN_MIN_MS = float(os.getenv("DB_EXPLAIN_MIN_MS", "1000"))
+    DB_EXPLAIN_RPCS = frozenset(
+        name.strip()
+        for name in os.getenv(
+            "DB_EXPLAIN_RPCS",
+            "apply_operations_batch,get_dashboard_data_complete,update_portfolio_asset",
+        ).split(",")
+        if name.strip()
+    )
+    DB_EXPLAIN_BUFFER_SIZE = int(os.getenv("DB_EXPLAIN_BUFFER_SIZE", "50"))
+    # Без auto_explain: повторить read-only вызов под EXPLAIN ANALYZE (удваивает его стоимость)
+    DB_EXPLAIN_RERUN = os.getenv("DB_EXPLAIN_RERUN", "").strip().lower() in ("1", "true", "yes")
     
     # Тестовая база данных (для pytest)
     TEST_DB_NAME = os.getenv("TEST_DB_NAME", f"{DB_NAME}_test")
@@ -76,8 +110,34 @@ class Config:
     CORS_SUPPORTS_CREDENTIALS = True
     CORS_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
     
-    # Redis: желателен при нескольких воркерах uvicorn/gunicorn — общий кэш справочника и брокеров
+    # Redis: желателен при нескольких воркерах uvicorn/gunicorn — общий кэш справочника и брокеров.
+    # Только одиночный Redis, не Cluster (скрипты кэша, см. infrastructure/cache/redis_client)
     REDIS_URL = os.getenv("REDIS_URL", "")
+    # L1-кэш процесса перед Redis для @cache(..., local=True); 0 — выключен
+    CACHE_L1_MAX_ITEMS = int(os.getenv("CACHE_L1_MAX_ITEMS", "500"))
+    CACHE_L1_MAX_BYTES = int(os.getenv("CACHE_L1_MAX_BYTES", str(64 * 1024 * 1024)))
+    CACHE_L1_MAX_TTL = int(os.getenv("CACHE_L1_MAX_TTL", "60"))
+    # Схлопывание промахов @cache между процессами: TTL блокировки заполнения и
+    # сколько ждать чужого заполнения, прежде чем считать самому (мс)
+    CACHE_LOCK_TTL_MS = int(os.getenv("CACHE_LOCK_TTL_MS", "15000"))
+    CACHE_LOCK_WAIT_MS = int(os.getenv("CACHE_LOCK_WAIT_MS", "10000"))
+    # Значения @cache от этого размера (байт JSON) сжимаются (zstd, без zstandard — zlib); 0 — не сжимать
+    CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024"))
+    # Как часто процесс сверяет fingerprint справочника в Redis (сек); столько же после
+    # invalidate_reference_cache() другие процессы могут отдавать предыдущую версию
+    REFERENCE_CHECK_SECONDS = float(os.getenv("REFERENCE_CHECK_SECONDS", "5"))
+    # Прогрев кэша дашбордов после циклов price-воркеров: пользователи, открывавшие дашборд
+    # за последние DASHBOARD_WARM_ACTIVE_HOURS; за цикл не больше MAX_USERS, CONCURRENCY
+    # пересчётов параллельно, новые не начинаются после BUDGET_SECONDS. MAX_USERS=0 — выключен
+    DASHBOARD_WARM_ACTIVE_HOURS = float(os.getenv("DASHBOARD_WARM_ACTIVE_HOURS", "24"))
+    DASHBOARD_WARM_MAX_USERS = int(os.getenv("DASHBOARD_WARM_MAX_USERS", "200"))
+    DASHBOARD_WARM_CONCURRENCY = int(os.getenv("DASHBOARD_WARM_CONCURRENCY", "2"))
+    DASHBOARD_WARM_BUDGET_SECONDS = float(os.getenv("DASHBOARD_WARM_BUDGET_SECONDS", "120"))
+    # Фрагменты дашборда по портфелям (свои позиции, история, аналитика): срок жизни (сек);
+    # сбрасываются по тегам портфеля/позиции/актива. Часть аналитики (future_payouts,
+    # dividend_yield_year_pct) зависит от выплат и текущей даты без инвалидации — поэтому
+    # срок как у кэша дашборда. 0 — без фрагментов, дашборд целиком из одного запроса
+    DASHBOARD_FRAGMENT_TTL = int(os.getenv("DASHBOARD_FRAGMENT_TTL", "300"))
     
     # Google OAuth
     GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
@@ -16,6 +16,7 @@ class HTTPStatus:
     OK = 200
     CREATED = 201
     ACCEPTED = 202
+    NOT_MODIFIED = 304
     BAD_REQUEST = 400
     UNAUTHORIZED = 401
     FORBIDDEN = 403
@@ -11,6 +11,7 @@ from app.config import Config
 from app.core.logging import get_logger
 from app.core.exceptions import UnauthorizedError, NotFoundError, ForbiddenError
 from app.core.platform_admin import is_platform_admin_user
+from app.infrastructure.database.database_service import connection_scope
 from app.domain.services.user_service import get_user_by_email
 from app.constants import ErrorMessages
 
@@ -113,3 +114,12 @@ def invalidate_cached_user(email: Optional[str]) -> None:
         _user_cache.pop(email, None)
 
 
+async def db_connection_scope():
+    """
+    Одно соединение пула на запрос: все вызовы rpc_async / table_*_async в обработчике
+    (проверка доступа, выборки, запись) идут через него вместо acquire/release на каждый.
+    Соединение берётся лениво — запросы, отданные из кэша, пул не трогают.
+    Подключается на уровне роутера: APIRouter(dependencies=[Depends(db_connection_scope)]).
+    """
+    async with connection_scope():
+        yield
@@ -1,16 +1,33 @@
 from collections import defaultdict
-from datetime import datetime, timedelta
-from time import time
-import copy
+from datetime import date
+from time import monotonic, time
+from typing import Dict, Iterable, Optional, Tuple
+import asyncio
+
+import numpy as np
+
+from app.config import Config
+from app.domain.services.history_series import HistorySeries
 from app.domain.services.portfolio_aggregation import (
     create_empty_analytics_maps,
     merge_analytics_arrays_into_maps,
     convert_analytics_maps_to_lists,
 )
-from app.infrastructure.database.database_service import rpc_async
+from app.infrastructure.database.database_service import rpc_async, use_primary
 from app.infrastructure.cache import cache
+from app.infrastructure.cache.cache_metrics import stats_for
+from app.infrastructure.cache.codec import CodecError, decode, encode
+from app.infrastructure.cache.redis_client import (
+    redis_available,
+    redis_mget,
+    redis_set_entry,
+    redis_tag_members,
+    redis_time_ms,
+    redis_zadd,
+    redis_zremrangebyscore,
+    redis_zrevrangebyscore,
+)
 from app.core.logging import get_logger
-from app.utils.date import normalize_date_to_day_string
 
 logger = get_logger(__name__)
 
@@ -34,460 +51,207 @@ def _portfolio_accrued_coupon_rub(assets: list) -> float:
     )
 
 
-def _get_aggregated_history(portfolio_map, portfolio_id, fallback_history=None):
-    """Получает агрегированную историю из портфеля или возвращает fallback"""
-    portfolio = portfolio_map.get(portfolio_id)
-    return (portfolio.get("history") if portfolio else None) or fallback_history or []
+class _Subtree:
+    """Итог агрегации поддерева: позиции, суммы аналитики и история."""
+
+    __slots__ = ("assets", "analytics", "history")
+
+    def __init__(self, assets: list, analytics: dict, history: HistorySeries):
+        self.assets = assets
+        self.analytics = analytics
+        self.history = history
 
 
-def forward_fill_history(history_list):
+class PortfolioTree:
     """
-    Заполняет пропущенные даты последним известным значением (forward fill).
-    Это необходимо для корректного объединения истории дочерних портфелей,
-    у которых могут быть разные диапазоны дат.
+    Дерево портфелей пользователя: индекс parent -> children строится один раз,
+    агрегация идёт снизу вверх (post-order) за один проход по узлам.
+
+    Позиции не копируются: в combined_assets лежат исходные словари позиций (копия
+    делается только при редком дополнении дубля по portfolio_asset_id). История —
+    HistorySeries: даты нормализуются один раз на портфель, forward fill и суммирование
+    с дочерними — над массивами. portfolio["history"] после агрегации — HistorySeries,
+    в формат series для клиента его переводит get_dashboard_data.
+
+    Если SQL вернул tree_history (итоги поддерева из portfolio_tree_daily_values), история
+    родителя берётся из него без суммирования детей; иначе — сумма по дереву в Python.
+    refresh_portfolio_tree_values_batch считает итоги по тем же правилам, что и _aggregate_node
+    (тест — tests/integration/test_portfolio_tree_values.py).
     """
-    if not history_list:
-        return []
-    
-    # Сортируем по датам
-    sorted_history = sorted(
-        history_list,
-        key=lambda h: normalize_date_to_day_string(h.get("date") or h.get("report_date")) or ""
-    )
-    
-    if not sorted_history:
-        return []
-    
-    # Находим диапазон дат: от первой до последней
-    first_date_str = normalize_date_to_day_string(
-        sorted_history[0].get("date") or sorted_history[0].get("report_date")
-    )
-    last_date_str = normalize_date_to_day_string(
-        sorted_history[-1].get("date") or sorted_history[-1].get("report_date")
-    )
-    
-    if not first_date_str or not last_date_str:
-        return sorted_history
-    
-    first_date = datetime.strptime(first_date_str, "%Y-%m-%d").date()
-    last_date = datetime.strptime(last_date_str, "%Y-%m-%d").date()
-    
-    # Создаем словарь для быстрого доступа по датам
-    history_by_date = {}
-    for h in sorted_history:
-        date_str = normalize_date_to_day_string(h.get("date") or h.get("report_date"))
-        if date_str:
-            history_by_date[date_str] = h
-    
-    # Заполняем пропущенные даты
-    filled_history = []
-    current_values = {
-        "value": 0.0,
-        "invested": 0.0,
-        "payouts": 0.0,
-        "pnl": 0.0,
-        "balance": 0.0
-    }
-    
-    current_date = first_date
-    while current_date <= last_date:
-        date_str = current_date.isoformat()
-        
-        if date_str in history_by_date:
-            # Есть запись на эту дату - обновляем текущие значения
-            h = history_by_date[date_str]
-            current_values = {
-                "value": float(h.get("value") or 0),
-                "invested": float(h.get("invested") or 0),
-                "payouts": float(h.get("payouts") or 0),
-                "pnl": float(h.get("pnl") or 0),
-                "balance": float(h.get("balance") or 0)
-            }
-        # Иначе используем последние известные значения (forward fill)
-        
-        filled_history.append({
-            "date": date_str,
-            "value": current_values["value"],
-            "invested": current_values["invested"],
-            "payouts": current_values["payouts"],
-            "pnl": current_values["pnl"],
-            "balance": current_values["balance"]
-        })
-        
-        current_date += timedelta(days=1)
-    
-    return filled_history
-
-
-def aggregate_and_sort_history_list(history_list):
-    """Агрегирует историю по датам: стоимость + инвестиции, и сортирует"""
-    combined = defaultdict(lambda: {
-        "value": 0.0, 
-        "invested": 0.0, 
-        "payouts": 0.0, 
-        "pnl": 0.0,
-        "balance": 0.0
-    })
-
-    for h in history_list or []:
-        date_raw = h.get("date") or h.get("report_date")
-        if not date_raw:
-            continue
-        
-        date = normalize_date_to_day_string(date_raw)
-        if not date:
-            logger.warning(f"Не удалось нормализовать дату: {date_raw} (тип: {type(date_raw)})")
-            continue
 
-        combined[date]["value"] += float(h.get("value") or 0)
-        combined[date]["invested"] += float(h.get("invested") or 0)
-        combined[date]["payouts"] += float(h.get("payouts") or 0)
-        combined[date]["pnl"] += float(h.get("pnl") or 0)
-        combined[date]["balance"] += float(h.get("balance") or 0)
-
-    return [
-        {
-            "date": d, 
-            "value": round(v["value"], 2), 
-            "invested": round(v["invested"], 2), 
-            "payouts": round(v["payouts"], 2), 
-            "pnl": round(v["pnl"], 2),
-            "balance": round(v["balance"], 2)
+    def __init__(self, portfolios: list):
+        self.by_id = {p["id"]: p for p in portfolios}
+        self.children: Dict[int, list] = defaultdict(list)
+        self.roots = []
+        for p in self.by_id.values():
+            parent_id = p.get("parent_portfolio_id")
+            if parent_id:
+                self.children[parent_id].append(p)
+            else:
+                self.roots.append(p)
+        self._subtrees: Dict[int, _Subtree] = {}
+
+    def post_order(self) -> list:
+        """Портфели, достижимые от корней, — дочерние раньше родителя (без рекурсии)."""
+        order, visited = [], set()
+        for root in self.roots:
+            stack = [(root, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if expanded:
+                    order.append(node)
+                    continue
+                if node["id"] in visited:
+                    continue
+                visited.add(node["id"])
+                stack.append((node, True))
+                for child in reversed(self.children.get(node["id"], ())):
+                    stack.append((child, False))
+        return order
+
+    def aggregate(self) -> list:
+        """Пересчитывает итоги, историю и аналитику каждого портфеля по его поддереву."""
+        for portfolio in self.post_order():
+            self._aggregate_node(portfolio)
+        return list(self.by_id.values())
+
+    def _aggregate_node(self, portfolio: dict) -> None:
+        portfolio_id = portfolio["id"]
+        children = [c for c in self.children.get(portfolio_id, ()) if c["id"] in self._subtrees]
+
+        # 1️⃣ Собственные позиции, история и аналитика
+        combined_assets = list(portfolio.get("assets") or [])
+        own_history = portfolio.get("history")
+        if not isinstance(own_history, HistorySeries):
+            own_history = HistorySeries.from_rows(own_history)
+        tree_history = portfolio.pop("tree_history", None)
+
+        analytics = portfolio.get("analytics") or {}
+        totals = analytics.get("totals") or {}
+        combined_analytics = {
+            "realized_pl": float(totals.get("realized_pl", analytics.get("realized_pl", 0))),
+            "unrealized_pl": float(totals.get("unrealized_pl", analytics.get("unrealized_pl", 0))),
+            "dividends": float(totals.get("dividends", analytics.get("dividends", 0))),
+            "coupons": float(totals.get("coupons", analytics.get("coupons", 0))),
+            "commissions": float(totals.get("commissions", analytics.get("commissions", 0))),
+            "taxes": float(totals.get("taxes", analytics.get("taxes", 0))),
+            "inflow": float(totals.get("inflow", (analytics.get("cash_flow") or {}).get("inflow", 0))),
+            "outflow": float(totals.get("outflow", (analytics.get("cash_flow") or {}).get("outflow", 0))),
+            "balance": float(portfolio.get("balance", totals.get("balance", 0)) or 0),
         }
-        for d, v in sorted(combined.items())
-    ]
-
 
+        maps = create_empty_analytics_maps()
+        merge_analytics_arrays_into_maps(maps, analytics)
+
+        # 2️⃣ История детей доводится forward fill до самой поздней даты среди детей и родителя
+        last_days = [self._subtrees[c["id"]].history.last_day for c in children]
+        last_days.append(own_history.last_day)
+        max_day = max((d for d in last_days if d is not None), default=None)
+        history_parts = [own_history]
+        use_tree_history = bool(children and tree_history)
+
+        # Позиции: portfolio_asset_id уникален в пределах портфеля, позиции разных портфелей
+        # остаются отдельными записями; повтор того же portfolio_asset_id только дополняет данные
+        position_index = {
+            a.get("portfolio_asset_id"): i
+            for i, a in enumerate(combined_assets)
+            if a.get("portfolio_asset_id")
+        }
 
-def sum_portfolio_totals_bottom_up(portfolio_id, portfolio_map):
-    portfolio = portfolio_map[portfolio_id]
-
-    # 1️⃣ Активы + история
-    # Создаем глубокие копии, чтобы не модифицировать оригинальные данные
-    combined_assets = [copy.deepcopy(a) for a in (portfolio.get("assets") or [])]
-    combined_history = list(portfolio.get("history") or [])
-    portfolio_name = portfolio.get("name", "N/A")
-
-    # 2️⃣ Аналитика текущего портфеля (если есть)
-    # Агрегация массивов аналитики будет сделана здесь
-    analytics = portfolio.get("analytics") or {}
-    totals = analytics.get("totals") or {}
-    combined_analytics = {
-        "realized_pl": float(totals.get("realized_pl", analytics.get("realized_pl", 0))),
-        "unrealized_pl": float(totals.get("unrealized_pl", analytics.get("unrealized_pl", 0))),
-        "dividends": float(totals.get("dividends", analytics.get("dividends", 0))),
-        "coupons": float(totals.get("coupons", analytics.get("coupons", 0))),
-        "commissions": float(totals.get("commissions", analytics.get("commissions", 0))),
-        "taxes": float(totals.get("taxes", analytics.get("taxes", 0))),
-        "inflow": float(totals.get("inflow", (analytics.get("cash_flow") or {}).get("inflow", 0))),
-        "outflow": float(totals.get("outflow", (analytics.get("cash_flow") or {}).get("outflow", 0))),
-        "balance": float(portfolio.get("balance", totals.get("balance", 0)) or 0),
-    }
-    
-    maps = create_empty_analytics_maps()
-    merge_analytics_arrays_into_maps(maps, analytics)
+        for child in children:
+            subtree = self._subtrees[child["id"]]
+            if len(subtree.history) and not use_tree_history:
+                history_parts.append(subtree.history.forward_filled(max_day))
+
+            for ca in subtree.assets:
+                portfolio_asset_id = ca.get("portfolio_asset_id")
+                if portfolio_asset_id and portfolio_asset_id in position_index:
+                    i = position_index[portfolio_asset_id]
+                    old = combined_assets[i]
+                    patch = {}
+                    if ca.get("last_price") and not old.get("last_price"):
+                        patch["last_price"] = ca["last_price"]
+                    if ca.get("accrued_coupon") is not None and old.get("accrued_coupon") is None:
+                        patch["accrued_coupon"] = ca["accrued_coupon"]
+                    if patch:
+                        combined_assets[i] = {**old, **patch}
+                else:
+                    combined_assets.append(ca)
+                    if portfolio_asset_id:
+                        position_index[portfolio_asset_id] = len(combined_assets) - 1
+
+            # 3️⃣ Аналитика — суммирование (итоги поддерева ребёнка)
+            child_totals = subtree.analytics
+            for field in ("realized_pl", "unrealized_pl", "dividends", "coupons",
+                          "commissions", "taxes", "inflow", "outflow"):
+                combined_analytics[field] += float(child_totals.get(field, 0) or 0)
+            combined_analytics["balance"] += float(child.get("balance", child_totals.get("balance", 0)) or 0)
+            merge_analytics_arrays_into_maps(maps, child.get("analytics", {}))
+
+        # 4️⃣ Стоимость по объединённым позициям: total_value = позиции + баланс (total_capital)
+        total_value = sum(
+            float(a.get("quantity") or 0)
+            * _asset_unit_dirty_price(a)
+            * float(a.get("currency_rate_to_rub") or 1)
+            / float(a.get("leverage") or 1)
+            for a in combined_assets
+        ) + combined_analytics["balance"]
 
-    # 3️⃣ Рекурсивно добавляем данные дочерних портфелей
-    children = [
-        p for p in portfolio_map.values()
-        if p.get("parent_portfolio_id") == portfolio_id
-    ]
-    
-    # Собираем данные дочерних портфелей и находим максимальную дату
-    child_data_list = []
-    max_child_date = None
-    
-    def _get_max_date_from_history(history_list):
-        """Вспомогательная функция для поиска максимальной даты в истории"""
-        max_date = None
-        for h in history_list or []:
-            date_str = normalize_date_to_day_string(h.get("date") or h.get("report_date"))
-            if date_str and (max_date is None or date_str > max_date):
-                max_date = date_str
-        return max_date
-    
-    for child in children:
-        (
-            child_value,
-            child_invested,
-            child_assets,
-            child_history,
-            child_analytics
-        ) = sum_portfolio_totals_bottom_up(child["id"], portfolio_map)
-        
-        child_data_list.append({
-            "child": child,
-            "value": child_value,
-            "invested": child_invested,
-            "assets": child_assets,
-            "history": child_history,
-            "analytics": child_analytics
-        })
-        
-        # Находим максимальную дату в агрегированной истории дочернего портфеля
-        child_history_agg = _get_aggregated_history(portfolio_map, child["id"], child_history)
-        child_max_date = _get_max_date_from_history(child_history_agg)
-        if child_max_date and (max_child_date is None or child_max_date > max_child_date):
-            max_child_date = child_max_date
-
-    # Проверяем максимальную дату в собственной истории родителя
-    parent_max_date = _get_max_date_from_history(combined_history)
-    if parent_max_date and (max_child_date is None or parent_max_date > max_child_date):
-        max_child_date = parent_max_date
-
-    # Обрабатываем каждый дочерний портфель с учетом максимальной даты
-    for child_data in child_data_list:
-        child = child_data["child"]
-        child_value = child_data["value"]
-        child_invested = child_data["invested"]
-        child_assets = child_data["assets"]
-        child_analytics = child_data["analytics"]
-        
-        # Используем агрегированную историю из портфеля (уже обработана рекурсивно)
-        child_history_aggregated = _get_aggregated_history(portfolio_map, child["id"], child_data["history"])
-
-        if child_history_aggregated:
-            # Применяем forward fill для дочернего портфеля до максимальной даты
-            child_history_filled = forward_fill_history(child_history_aggregated)
-            
-            # Если есть максимальная дата среди всех портфелей, заполняем до неё
-            if max_child_date and child_history_filled:
-                last_filled_date_str = child_history_filled[-1].get("date")
-                if last_filled_date_str and last_filled_date_str < max_child_date:
-                    last_filled_date = datetime.strptime(last_filled_date_str, "%Y-%m-%d").date()
-                    max_date = datetime.strptime(max_child_date, "%Y-%m-%d").date()
-                    last_values = child_history_filled[-1]
-                    
-                    # Добавляем записи до максимальной даты
-                    current_date = last_filled_date + timedelta(days=1)
-                    while current_date <= max_date:
-                        child_history_filled.append({
-                            "date": current_date.isoformat(),
-                            "value": last_values["value"],
-                            "invested": last_values["invested"],
-                            "payouts": last_values["payouts"],
-                            "pnl": last_values["pnl"],
-                            "balance": last_values.get("balance", 0)  # ВАЖНО: переносим balance при forward fill
-                        })
-                        current_date += timedelta(days=1)
-            
-            combined_history.extend(child_history_filled)
-
-        # Активы — объединение
-        # Используем portfolio_asset_id как уникальный ключ, так как один и тот же asset_id
-        # может быть в разных портфелях с разными количествами
-        # portfolio_asset_id уникален для каждого портфеля, поэтому активы из разных портфелей
-        # должны оставаться отдельными записями
-        existing_by_portfolio_asset = {a.get("portfolio_asset_id"): a for a in combined_assets if a.get("portfolio_asset_id")}
-        
-        for ca in child_assets:
-            # Создаем копию актива, чтобы не модифицировать оригинал
-            ca_copy = copy.deepcopy(ca)
-            portfolio_asset_id = ca_copy.get("portfolio_asset_id")
-            
-            # Если есть portfolio_asset_id, проверяем, не добавлен ли уже этот актив
-            if portfolio_asset_id and portfolio_asset_id in existing_by_portfolio_asset:
-                # Актив с таким portfolio_asset_id уже есть - это тот же актив из того же портфеля
-                # Обновляем данные, но не суммируем количество (это один и тот же актив)
-                old = existing_by_portfolio_asset[portfolio_asset_id]
-                # Обновляем только если данные изменились
-                if ca_copy.get("last_price") and not old.get("last_price"):
-                    old["last_price"] = ca_copy["last_price"]
-                if ca_copy.get("accrued_coupon") is not None and old.get("accrued_coupon") is None:
-                    old["accrued_coupon"] = ca_copy["accrued_coupon"]
-            else:
-                # Новый актив (с другим portfolio_asset_id) - добавляем как отдельную запись
-                # Это позволяет иметь один и тот же asset_id в разных портфелях с разными количествами
-                combined_assets.append(ca_copy)
-                if portfolio_asset_id:
-                    existing_by_portfolio_asset[portfolio_asset_id] = ca_copy
-
-        # 4️⃣ Аналитика — суммирование
-        # child_analytics может быть dict (старый формат) или содержать totals (новый формат)
-        child_totals = child_analytics.get("totals", {}) if isinstance(child_analytics, dict) else {}
-        if not child_totals and isinstance(child_analytics, dict):
-            # Если totals нет, используем прямые поля (старый формат)
-            child_totals = child_analytics
-        
-        combined_analytics["realized_pl"] += float(child_totals.get("realized_pl", 0) or 0)
-        combined_analytics["unrealized_pl"] += float(child_totals.get("unrealized_pl", 0) or 0)
-        combined_analytics["dividends"] += float(child_totals.get("dividends", 0) or 0)
-        combined_analytics["coupons"] += float(child_totals.get("coupons", 0) or 0)
-        combined_analytics["commissions"] += float(child_totals.get("commissions", 0) or 0)
-        combined_analytics["taxes"] += float(child_totals.get("taxes", 0) or 0)
-        combined_analytics["inflow"] += float(child_totals.get("inflow", 0) or 0)
-        combined_analytics["outflow"] += float(child_totals.get("outflow", 0) or 0)
-        # Агрегируем баланс дочерних портфелей
-        child_balance = float(child.get("balance", child_totals.get("balance", 0)) or 0)
-        combined_analytics["balance"] += child_balance
-        
-        child_id = child["id"]
-        child_portfolio = portfolio_map.get(child_id)
-        child_analytics_for_arrays = child_portfolio.get("analytics", {}) if child_portfolio else child_analytics
-        merge_analytics_arrays_into_maps(maps, child_analytics_for_arrays)
-
-    # 5️⃣ После объединения активов — пересчёт общей стоимости
-    # total_value = стоимость активов + баланс (total_capital)
-    total_value = sum(
-        float(a.get("quantity") or 0)
-        * _asset_unit_dirty_price(a)
-        * float(a.get("currency_rate_to_rub") or 1)
-        / float(a.get("leverage") or 1)
-        for a in combined_assets
-    ) + combined_analytics["balance"]
-
-    total_invested = sum(
-        float(a.get("quantity") or 0)
-        * float(a.get("average_price") or 0)
-        * float(a.get("currency_rate_to_rub") or 1)
-        / float(a.get("leverage") or 1)
-        for a in combined_assets
-    )
+        total_invested = sum(
+            float(a.get("quantity") or 0)
+            * float(a.get("average_price") or 0)
+            * float(a.get("currency_rate_to_rub") or 1)
+            / float(a.get("leverage") or 1)
+            for a in combined_assets
+        )
 
-    # 6️⃣ total_profit уже рассчитан в SQL функции get_user_portfolios_analytics из total_pnl
-    # НЕ пересчитываем его здесь, используем значение из SQL функции
-    # Для агрегации дочерних портфелей суммируем total_profit из их totals
-    total_profit = float(totals.get("total_profit", 0) or 0)
-    # Суммируем total_profit из дочерних портфелей
-    for child_data in child_data_list:
-        child_id = child_data["child"]["id"]
-        child_portfolio = portfolio_map.get(child_id)
-        if child_portfolio and child_portfolio.get("analytics"):
-            child_totals = child_portfolio["analytics"].get("totals", {})
+        # 5️⃣ total_profit рассчитан в SQL (get_user_portfolios_analytics) из total_pnl —
+        # не пересчитываем, а суммируем с total_profit дочерних поддеревьев
+        total_profit = float(totals.get("total_profit", 0) or 0)
+        for child in children:
+            child_totals = (child.get("analytics") or {}).get("totals", {})
             total_profit += float(child_totals.get("total_profit", 0) or 0)
 
-    # 6️⃣ Пересчёт доходностей для родительских портфелей
-    # Для портфелей без дочерних используем значения из аналитики напрямую
-    # Для родительских портфелей доходности должны быть средневзвешенными значениями дочерних портфелей
-    if len(child_data_list) == 0:
-        # Портфель без дочерних - используем значения из аналитики
-        return_percent = float(totals.get("return_percent", 0) or 0)
-        return_percent_on_invested = float(totals.get("return_percent_on_invested", 0) or 0)
-    else:
-        # Портфель с дочерними - пересчитываем как средневзвешенную
-        # return_percent - взвешенная по текущей стоимости
-        # return_percent_on_invested - взвешенная по вложенному капиталу
-        total_weighted_return = 0.0
-        total_value_for_return = 0.0
-        total_weighted_return_on_invested = 0.0
-        total_invested_for_return = 0.0
-        
-        # Добавляем данные текущего портфеля (если есть активы в самом портфеле)
-        current_portfolio_return = float(totals.get("return_percent", 0) or 0)
-        current_portfolio_return_on_invested = float(totals.get("return_percent_on_invested", 0) or 0)
-        
-        # Вычитаем инвестированную сумму дочерних портфелей, чтобы получить только собственные активы
-        # Используем данные из portfolio_map, которые уже обновлены рекурсивно
-        children_invested_sum = 0.0
-        children_value_sum = 0.0
-        for child_data in child_data_list:
-            child_id = child_data["child"]["id"]
-            child_portfolio = portfolio_map.get(child_id)
-            if child_portfolio:
-                children_invested_sum += float(child_portfolio.get("total_invested", child_data["invested"]) or 0)
-                children_value_sum += float(child_portfolio.get("total_value", child_data["value"]) or 0)
-            else:
-                children_invested_sum += float(child_data["invested"])
-                children_value_sum += float(child_data["value"])
-        
-        own_invested = max(0, total_invested - children_invested_sum)
-        own_value = max(0, total_value - children_value_sum)
-        
-        if own_value > 0:
-            total_weighted_return += current_portfolio_return * own_value
-            total_value_for_return += own_value
-        
-        if own_invested > 0:
-            total_weighted_return_on_invested += current_portfolio_return_on_invested * own_invested
-            total_invested_for_return += own_invested
-        
-        # Собираем данные из дочерних портфелей для расчета средневзвешенной доходности
-        # Используем данные из portfolio_map, которые уже обновлены рекурсивно
-        for child_data in child_data_list:
-            child_id = child_data["child"]["id"]
-            child_portfolio = portfolio_map.get(child_id)
-            
-            # Используем аналитику из portfolio_map, которая уже обновлена рекурсивно
-            if child_portfolio and child_portfolio.get("analytics"):
-                child_analytics = child_portfolio["analytics"]
-                child_totals = child_analytics.get("totals", {}) if isinstance(child_analytics, dict) else {}
-            else:
-                # Fallback на данные из child_data
-                child_analytics = child_data["analytics"]
-                child_totals = child_analytics.get("totals", {}) if isinstance(child_analytics, dict) else {}
-                if not child_totals and isinstance(child_analytics, dict):
-                    child_totals = child_analytics
-            
-            # Используем значения из portfolio_map, которые уже обновлены
-            if child_portfolio:
-                child_value = float(child_portfolio.get("total_value", child_data["value"]) or 0)
-                child_invested = float(child_portfolio.get("total_invested", child_data["invested"]) or 0)
-            else:
-                child_value = float(child_data["value"])
-                child_invested = float(child_data["invested"])
-            
-            child_return = float(child_totals.get("return_percent", 0) or 0)
-            child_return_on_invested = float(child_totals.get("return_percent_on_invested", 0) or 0)
-            
-            if child_value > 0:
-                total_weighted_return += child_return * child_value
-                total_value_for_return += child_value
-            
-            if child_invested > 0:
-                total_weighted_return_on_invested += child_return_on_invested * child_invested
-                total_invested_for_return += child_invested
-        
-        # Пересчитываем средневзвешенную доходность
-        if total_value_for_return > 0:
-            return_percent = total_weighted_return / total_value_for_return
-        else:
-            return_percent = 0
-        
-        if total_invested_for_return > 0:
-            return_percent_on_invested = total_weighted_return_on_invested / total_invested_for_return
-        else:
-            return_percent_on_invested = 0
+        return_percent, return_percent_on_invested = self._weighted_returns(
+            totals, children, total_value, total_invested
+        )
 
-    # 7️⃣ Сохраняем результат в текущем портфеле
-    portfolio["total_value"] = round(total_value, 2)  # total_value уже включает баланс
-    portfolio["total_invested"] = round(total_invested, 2)
-    portfolio["balance"] = round(combined_analytics["balance"], 2)  # Сохраняем баланс отдельно
-    portfolio["combined_assets"] = combined_assets
-    
-    # Агрегируем историю
-    aggregated_history = aggregate_and_sort_history_list(combined_history)
-    
-    # Проверяем аномалии в последних записях (только критичные случаи)
-    if len(aggregated_history) >= 4:
-        prev_value = aggregated_history[-4]['value']
-        last_value = aggregated_history[-1]['value']
-        if prev_value > 0:
-            diff_percent = ((last_value - prev_value) / prev_value) * 100
-            if diff_percent < -5:  # Если разница больше 5% в меньшую сторону
-                logger.error(
-                    f"Портфель {portfolio_id} ({portfolio_name}): "
-                    f"последняя запись на {abs(diff_percent):.1f}% меньше предыдущей "
-                    f"({prev_value} -> {last_value})"
-                )
-    
-    portfolio["history"] = aggregated_history
-
-    analytics_lists = convert_analytics_maps_to_lists(maps)
-
-    # Нереализованная по открытым позициям должна совпадать с отображаемым капиталом:
-    # total_value = стоимость позиций + balance, total_invested — только позиции (без кэша).
-    _bal = float(combined_analytics.get("balance") or 0)
-    implied_unrealized_pl = round(float(total_value) - float(total_invested) - _bal, 2)
-    accrued_coupon_rub = _portfolio_accrued_coupon_rub(combined_assets)
-
-    # Сохраняем аналитику из SQL (полная структура с totals, monthly_flow, etc.)
-    # Если аналитика уже есть в портфеле (из get_user_portfolios_analytics), используем её
-    # Иначе создаем базовую структуру
-    if portfolio.get("analytics") and isinstance(portfolio.get("analytics"), dict):
-        # Обновляем totals в существующей аналитике
-        if "totals" not in portfolio["analytics"]:
-            portfolio["analytics"]["totals"] = {}
-        portfolio["analytics"]["totals"].update({
+        # 6️⃣ Сохраняем результат в текущем портфеле
+        portfolio["total_value"] = round(total_value, 2)  # total_value уже включает баланс
+        portfolio["total_invested"] = round(total_invested, 2)
+        portfolio["balance"] = round(combined_analytics["balance"], 2)  # Сохраняем баланс отдельно
+        portfolio["combined_assets"] = combined_assets
+
+        if use_tree_history:
+            aggregated_history = HistorySeries.from_series(tree_history)
+        else:
+            aggregated_history = HistorySeries.sum(history_parts).rounded()
+
+        # Проверяем аномалии в последних записях (только критичные случаи)
+        if len(aggregated_history) >= 4:
+            values = aggregated_history.column("value")
+            prev_value = float(values[-4])
+            last_value = float(values[-1])
+            if prev_value > 0:
+                diff_percent = ((last_value - prev_value) / prev_value) * 100
+                if diff_percent < -5:  # Если разница больше 5% в меньшую сторону
+                    logger.error(
+                        f"Портфель {portfolio_id} ({portfolio.get('name', 'N/A')}): "
+                        f"последняя запись на {abs(diff_percent):.1f}% меньше предыдущей "
+                        f"({prev_value} -> {last_value})"
+                    )
+
+        portfolio["history"] = aggregated_history
+        self._subtrees[portfolio_id] = _Subtree(combined_assets, combined_analytics, aggregated_history)
+
+        analytics_lists = convert_analytics_maps_to_lists(maps)
+
+        # Нереализованная по открытым позициям должна совпадать с отображаемым капиталом:
+        # total_value = стоимость позиций + balance, total_invested — только позиции (без кэша).
+        _bal = float(combined_analytics.get("balance") or 0)
+        implied_unrealized_pl = round(float(total_value) - float(total_invested) - _bal, 2)
+
+        new_totals = {
             "total_value": total_value,
             "total_invested": total_invested,
             "realized_pl": combined_analytics["realized_pl"],
@@ -502,85 +266,73 @@ def sum_portfolio_totals_bottom_up(portfolio_id, portfolio_map):
             "inflow": combined_analytics["inflow"],
             "outflow": combined_analytics["outflow"],
             "balance": combined_analytics["balance"],
-            "accrued_coupon_rub": accrued_coupon_rub,
-        })
-        
-        portfolio["analytics"]["operations_breakdown"] = analytics_lists["operations_breakdown"]
-        portfolio["analytics"]["monthly_flow"] = analytics_lists["monthly_flow"]
-        portfolio["analytics"]["monthly_payouts"] = analytics_lists["monthly_payouts"]
-        portfolio["analytics"]["asset_distribution"] = analytics_lists["asset_distribution"]
-        portfolio["analytics"]["payouts_by_asset"] = analytics_lists["payouts_by_asset"]
-        portfolio["analytics"]["future_payouts"] = analytics_lists["future_payouts"]
-        portfolio["analytics"]["asset_returns"] = analytics_lists["asset_returns"]
-    else:
-        portfolio["analytics"] = {
-            "totals": {
-                "total_value": total_value,
-                "total_invested": total_invested,
-                "realized_pl": combined_analytics["realized_pl"],
-                "unrealized_pl": implied_unrealized_pl,
-                "dividends": combined_analytics["dividends"],
-                "coupons": combined_analytics["coupons"],
-                "commissions": combined_analytics["commissions"],
-                "taxes": combined_analytics["taxes"],
-                "total_profit": total_profit,
-                "return_percent": return_percent,
-                "return_percent_on_invested": return_percent_on_invested,
-                "inflow": combined_analytics["inflow"],
-                "outflow": combined_analytics["outflow"],
-                "balance": combined_analytics["balance"],
-                "accrued_coupon_rub": accrued_coupon_rub,
-            },
-            "monthly_flow": analytics_lists["monthly_flow"],
-            "monthly_payouts": analytics_lists["monthly_payouts"],
-            "asset_distribution": analytics_lists["asset_distribution"],
-            "payouts_by_asset": analytics_lists["payouts_by_asset"],
-            "future_payouts": analytics_lists["future_payouts"],
-            "asset_returns": analytics_lists["asset_returns"],
-            "operations_breakdown": analytics_lists["operations_breakdown"]
+            "accrued_coupon_rub": _portfolio_accrued_coupon_rub(combined_assets),
         }
 
-    # Возвращаем combined_history (неагрегированную) для родительского портфеля
-    return total_value, total_invested, combined_assets, combined_history, combined_analytics
+        # Аналитика из SQL (totals, monthly_flow, ...) обновляется на месте; нет — создаётся
+        if portfolio.get("analytics") and isinstance(portfolio.get("analytics"), dict):
+            portfolio["analytics"].setdefault("totals", {}).update(new_totals)
+            portfolio["analytics"].update(analytics_lists)
+        else:
+            portfolio["analytics"] = {"totals": new_totals, **analytics_lists}
+
+    @staticmethod
+    def _weighted_returns(totals: dict, children: list, total_value: float, total_invested: float):
+        """
+        Доходности портфеля: без дочерних — из аналитики SQL; с дочерними — средневзвешенные:
+        return_percent по текущей стоимости, return_percent_on_invested по вложенному капиталу
+        (собственные позиции родителя — разница с итогами детей).
+        """
+        if not children:
+            return (
+                float(totals.get("return_percent", 0) or 0),
+                float(totals.get("return_percent_on_invested", 0) or 0),
+            )
+
+        children_value_sum = sum(float(c.get("total_value") or 0) for c in children)
+        children_invested_sum = sum(float(c.get("total_invested") or 0) for c in children)
+        own_value = max(0, total_value - children_value_sum)
+        own_invested = max(0, total_invested - children_invested_sum)
+
+        weighted = [(float(totals.get("return_percent", 0) or 0), own_value)]
+        weighted_on_invested = [(float(totals.get("return_percent_on_invested", 0) or 0), own_invested)]
+        for child in children:
+            child_totals = (child.get("analytics") or {}).get("totals", {})
+            weighted.append((float(child_totals.get("return_percent", 0) or 0), float(child.get("total_value") or 0)))
+            weighted_on_invested.append((
+                float(child_totals.get("return_percent_on_invested", 0) or 0),
+                float(child.get("total_invested") or 0),
+            ))
+
+        def _average(pairs):
+            weight_sum = sum(w for _, w in pairs if w > 0)
+            if weight_sum <= 0:
+                return 0
+            return sum(r * w for r, w in pairs if w > 0) / weight_sum
+
+        return _average(weighted), _average(weighted_on_invested)
 
 
 def build_portfolio_hierarchy(portfolios):
     """
-    Запускает рекурсивное суммирование для всех портфелей.
+    Агрегирует итоги, историю и аналитику портфелей по дереву (см. PortfolioTree).
     """
-    portfolio_map = {p["id"]: p for p in portfolios}
-    root_portfolios = [p for p in portfolios if not p.get("parent_portfolio_id")]
-
-    for root in root_portfolios:
-        sum_portfolio_totals_bottom_up(root["id"], portfolio_map)
-
-    return list(portfolio_map.values())
+    return PortfolioTree(portfolios).aggregate()
 
 
-def calculate_monthly_change(history):
+def calculate_monthly_change(history: HistorySeries):
     """
     Вычисляет прибыль за месяц как разницу между текущей прибылью и прибылью месяц назад.
     Прибыль за месяц = текущая прибыль (pnl) - прибыль месяц назад (pnl)
     """
-    if len(history) >= 2:
-        try:
-            # Получаем текущую прибыль (последняя запись)
-            current_pnl = history[-1].get('pnl', 0) or 0
-            
-            # Получаем прибыль месяц назад (примерно 30 дней назад)
-            # Ищем запись примерно месяц назад
-            month_ago_index = max(0, len(history) - 30)
-            month_ago_pnl = history[month_ago_index].get('pnl', 0) or 0
-            
-            # Прибыль за месяц = текущая прибыль - прибыль месяц назад
-            monthly_profit = current_pnl - month_ago_pnl
-            return monthly_profit
-        except (KeyError, IndexError, TypeError):
-            # Если нет данных о прибыли, возвращаем 0
-            return 0
-    elif len(history) == 1:
+    pnl = history.column("pnl")
+    if len(pnl) >= 2:
+        # Месяц назад — примерно 30 записей от конца
+        month_ago_index = max(0, len(pnl) - 30)
+        return float(pnl[-1] - pnl[month_ago_index])
+    elif len(pnl) == 1:
         # Если только одна запись, возвращаем текущую прибыль
-        return history[0].get('pnl', 0) or 0
+        return float(pnl[0])
     else:
         return 0
 
@@ -604,20 +356,170 @@ def _normalize_analytics(analytics):
     return analytics
 
 
-def _history_row_date(h: dict) -> str:
-    raw = h.get("date") or ""
-    return str(raw).split("T")[0]
+def _dashboard_cache_tags(result: dict) -> list:
+    """Теги кэша дашборда: активы позиций и их валюты котировки (для инвалидации price-воркерами)."""
+    asset_ids = set()
+    for p in result.get("portfolios") or []:
+        for a in p.get("assets") or []:
+            for field in ("asset_id", "quote_asset_id"):
+                if a.get(field) is not None:
+                    asset_ids.add(a[field])
+    return [f"asset:{asset_id}" for asset_id in sorted(asset_ids)]
+
+
+# Фрагменты дашборда: собственные данные портфеля (позиции, история, аналитика, баланс)
+# по ключу с версией формата. Теги: user:<id> (он же список фрагментов пользователя),
+# portfolio:<id>, portfolio_asset:<id>, asset:<id> (активы позиций и валюты котировки)
+FRAGMENT_VERSION = 1
+FRAGMENT_KEY = "dashboard_portfolio:{user_id}:{portfolio_id}"
+_FRAGMENT_PREFIX = f"dashboard_portfolio:v{FRAGMENT_VERSION}:"
+
+
+def _fragment_key(user_id: str, portfolio_id: int) -> str:
+    return f"{_FRAGMENT_PREFIX}{user_id}:{portfolio_id}"
+
+
+def _fragment_tags(user_id: str, portfolio_id: int, fragment: dict) -> list:
+    tags = {f"user:{user_id}", f"portfolio:{portfolio_id}"}
+    for a in fragment.get("assets") or []:
+        if a.get("portfolio_asset_id") is not None:
+            tags.add(f"portfolio_asset:{a['portfolio_asset_id']}")
+        for field in ("asset_id", "quote_asset_id"):
+            if a.get(field) is not None:
+                tags.add(f"asset:{a[field]}")
+    return sorted(tags)
+
+
+_FRAGMENT_FIELDS = ("assets", "analytics", "balance")
 
 
-@cache("dashboard:{user_id}", ttl=300)
+def _make_fragment(portfolio: dict) -> dict:
+    """Фрагмент из строки портфеля SQL; история — в компактном формате series."""
+    fragment = {field: portfolio[field] for field in _FRAGMENT_FIELDS if field in portfolio}
+    if fragment.get("analytics"):
+        fragment["analytics"] = _normalize_analytics(fragment["analytics"])
+    fragment["history"] = HistorySeries.from_rows(portfolio.get("history")).to_series()
+    return fragment
+
+
+async def _load_fragments(user_id: str) -> Tuple[Dict[int, dict], set]:
+    """
+    (фрагменты из кэша по id портфеля, id портфелей, чьи фрагменты сброшены или истекли).
+    Ключи берутся из тега user:<id>, значения — одним MGET.
+    """
+    prefix = f"{_FRAGMENT_PREFIX}{user_id}:"
+    keys = [k for k in await redis_tag_members(f"user:{user_id}") if k.startswith(prefix)]
+    if not keys:
+        return {}, set()
+    fragments, dirty = {}, set()
+    for key, blob in zip(keys, await redis_mget(*keys)):
+        portfolio_id = int(key[len(prefix):])
+        if blob is None:
+            dirty.add(portfolio_id)
+            continue
+        try:
+            fragments[portfolio_id] = decode(blob)[0]
+        except (CodecError, ValueError) as e:
+            logger.debug(f"Фрагмент {key} не прочитан: {e}")
+            dirty.add(portfolio_id)
+    return fragments, dirty
+
+
+async def _store_fragments(user_id: str, fragments: Dict[int, dict], started: int) -> int:
+    """
+    Сохраняет фрагменты, посчитанные запросом с началом в started (мс, redis_time_ms).
+    Фрагмент, чей тег сброшен после started, не сохраняется: запись, которую он не видел,
+    иначе осталась бы в кэше на DASHBOARD_FRAGMENT_TTL. Возвращает число сохранённых.
+    """
+    async def _store(portfolio_id: int, fragment: dict) -> bool:
+        blob, _ = encode(fragment, FRAGMENT_KEY)
+        return await redis_set_entry(
+            _fragment_key(user_id, portfolio_id),
+            blob,
+            Config.DASHBOARD_FRAGMENT_TTL,
+            tags=_fragment_tags(user_id, portfolio_id, fragment),
+            not_invalidated_since=started,
+        )
+
+    return sum(await asyncio.gather(*(_store(pid, fragment) for pid, fragment in fragments.items())))
+
+
+async def _fetch_dashboard_data(user_id: str) -> Optional[dict]:
+    """
+    Данные get_dashboard_data_complete с собственными данными портфелей из фрагментов.
+
+    Список портфелей, последние сделки и пропущенные выплаты запрашиваются всегда, тяжёлая
+    часть (позиции, история, аналитика) — только для портфелей без фрагмента в кэше:
+    после операции в одном портфеле пересчитывается только его фрагмент, а итоги
+    родителей — в build_portfolio_hierarchy. Новые портфели (их нет в теге пользователя)
+    дозапрашиваются вторым вызовом. Без Redis или при DASHBOARD_FRAGMENT_TTL=0 — один
+    запрос за всеми портфелями.
+
+    Фрагменты живут дольше кэша дашборда, поэтому их данные читаются с основной БД (реплика
+    может ещё не видеть недавнюю запись), а фрагмент, сброшенный во время запроса, не сохраняется.
+    """
+    use_fragments = Config.DASHBOARD_FRAGMENT_TTL > 0 and redis_available()
+    cached, dirty = await _load_fragments(user_id) if use_fragments else ({}, set())
+    requested = sorted(dirty) if cached or dirty else None
+    started = await redis_time_ms() if use_fragments else None
+
+    async def _rpc(portfolio_ids: Optional[list]) -> Optional[dict]:
+        params = {"p_user_id": user_id, "p_portfolio_ids": portfolio_ids}
+        if not use_fragments:
+            return await rpc_async("get_dashboard_data_complete", params)
+        with use_primary():
+            return await rpc_async("get_dashboard_data_complete", params)
+
+    data = await _rpc(requested)
+    if not data:
+        return data
+    portfolios = data.get("portfolios", []) or []
+
+    computed = {
+        p["id"]: _make_fragment(p)
+        for p in portfolios
+        if requested is None or p["id"] in dirty
+    }
+    missing = [p["id"] for p in portfolios if p["id"] not in computed and p["id"] not in cached]
+    if missing:
+        extra = await _rpc(missing)
+        for p in (extra or {}).get("portfolios", []) or []:
+            if p["id"] in missing:
+                computed[p["id"]] = _make_fragment(p)
+
+    if use_fragments:
+        stats = stats_for(FRAGMENT_KEY)
+        stats.hits += sum(1 for p in portfolios if p["id"] in cached)
+        stats.misses += len(computed)
+        if computed and started is not None:
+            stored = await _store_fragments(user_id, computed, started)
+            if stored < len(computed):
+                logger.debug(f"Фрагменты дашборда: {len(computed) - stored} не сохранено (сброшены во время запроса)")
+    logger.debug(f"Фрагменты дашборда: {len(portfolios) - len(computed)} из кэша, {len(computed)} пересчитано")
+
+    merged = []
+    for p in portfolios:
+        fragment = computed.get(p["id"]) or cached.get(p["id"])
+        if fragment is None:
+            # Портфель удалён между запросами — без собственных данных
+            fragment = _make_fragment({})
+        # В строке портфеля без запрошенных данных поля фрагмента — пустые заглушки SQL
+        row = {k: v for k, v in p.items() if k not in _FRAGMENT_FIELDS}
+        merged.append({**row, **fragment, "history": HistorySeries.from_series(fragment["history"])})
+    data["portfolios"] = merged
+    return data
+
+
+@cache("dashboard:{user_id}", ttl=300, local=True, stale_ttl=3600, result_tags=_dashboard_cache_tags)
 async def get_dashboard_data(user_id: str):
     """
     Данные дашборда: портфели (агрегированные позиции в assets), компактная история, последние сделки.
     Справочники — отдельный GET /reference. История: history.series — [[date, value, invested, payouts, pnl, balance], ...].
+    Собственные данные портфелей собираются из фрагментов (_fetch_dashboard_data).
     """
     time1 = time()
 
-    data = await rpc_async("get_dashboard_data_complete", {"p_user_id": user_id})
+    data = await _fetch_dashboard_data(user_id)
     logger.debug(f'SQL RPC (complete): {time() - time1:.2f} сек')
 
     if not data:
@@ -630,10 +532,6 @@ async def get_dashboard_data(user_id: str):
     portfolios = data.get("portfolios", []) or []
     recent_transactions = data.get("transactions", []) or []
 
-    for portfolio in portfolios:
-        if portfolio.get("analytics"):
-            portfolio["analytics"] = _normalize_analytics(portfolio["analytics"])
-
     time1 = time()
     portfolios = build_portfolio_hierarchy(portfolios)
     logger.debug(f'Иерархия: {time() - time1:.2f} сек')
@@ -646,56 +544,10 @@ async def get_dashboard_data(user_id: str):
     time1 = time()
     for p in portfolios:
         hist = p.get("history")
-        if not isinstance(hist, list):
-            hist = []
-
-        sorted_hist = sorted(
-            [h for h in hist if isinstance(h, dict) and "date" in h and "value" in h],
-            key=lambda x: x["date"],
-        )
-
-        zero_point = None
-        if sorted_hist:
-            first_date_str = _history_row_date(sorted_hist[0])
-            try:
-                first_date = datetime.strptime(first_date_str, "%Y-%m-%d").date()
-                zero_point = {
-                    "date": (first_date - timedelta(days=1)).isoformat(),
-                    "value": 0.0,
-                    "invested": 0.0,
-                    "payouts": 0.0,
-                    "pnl": 0.0,
-                    "balance": 0.0,
-                }
-            except Exception:
-                zero_point = None
-
-        series = []
-        if zero_point:
-            series.append(
-                [
-                    zero_point["date"],
-                    zero_point["value"],
-                    zero_point["invested"],
-                    zero_point["payouts"],
-                    zero_point["pnl"],
-                    zero_point["balance"],
-                ]
-            )
-        for h in sorted_hist:
-            series.append(
-                [
-                    _history_row_date(h),
-                    float(h.get("value") or 0),
-                    float(h.get("invested") or 0),
-                    float(h.get("payouts") or 0),
-                    float(h.get("pnl") or 0),
-                    float(h.get("balance") or 0),
-                ]
-            )
-
-        p["history"] = {"series": series}
-        p["monthly_change"] = calculate_monthly_change(sorted_hist)
+        if not isinstance(hist, HistorySeries):
+            hist = HistorySeries.from_rows(hist if isinstance(hist, list) else [])
+        p["history"] = {"series": hist.to_series(zero_point=True)}
+        p["monthly_change"] = calculate_monthly_change(hist)
     logger.debug(f'Форматирование: {time() - time1:.2f} сек')
 
     portfolios = sorted(portfolios, key=lambda x: x.get("total_value", 0), reverse=True)
@@ -705,3 +557,206 @@ async def get_dashboard_data(user_id: str):
         "recent_transactions": recent_transactions,
         "missed_payouts_count": data.get("missed_payouts_count", 0) if data else 0,
     }
+
+
+# Диапазоны графика истории: число месяцев до последней даты истории (None — вся история)
+HISTORY_RANGES = {"1M": 1, "6M": 6, "1Y": 12, "ALL": None}
+# Разрешения графика: period для HistorySeries.resampled (None — по дням)
+HISTORY_RESOLUTIONS = {"daily": None, "weekly": "W", "monthly": "M"}
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _months_before(day: int, months: int) -> int:
+    """День (номер от 1970-01-01) за months календарных месяцев до day, с поправкой на длину месяца."""
+    month = np.datetime64(day, "D").astype("datetime64[M]")
+    day_of_month = day - int(month.astype("datetime64[D]").astype(np.int64))
+    target = month - months
+    target_start = int(target.astype("datetime64[D]").astype(np.int64))
+    next_start = int((target + 1).astype("datetime64[D]").astype(np.int64))
+    return min(target_start + day_of_month, next_start - 1)
+
+
+class HistoryView:
+    """
+    Вид графика истории в ответе дашборда: диапазон (history_range или date_from/date_to),
+    разрешение (resolution) и предел числа точек (points, LTTB по стоимости).
+    Вид по умолчанию (ALL, daily, без предела) — полная ежедневная история.
+    """
+
+    __slots__ = ("history_range", "resolution", "points", "date_from", "date_to")
+
+    def __init__(
+        self,
+        history_range: str = "ALL",
+        resolution: str = "daily",
+        points: Optional[int] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ):
+        if history_range not in HISTORY_RANGES:
+            raise ValueError(f"Неизвестный диапазон истории: {history_range}")
+        if resolution not in HISTORY_RESOLUTIONS:
+            raise ValueError(f"Неизвестное разрешение истории: {resolution}")
+        if date_from and date_to and date_from > date_to:
+            raise ValueError("date_from позже date_to")
+        self.history_range = history_range
+        self.resolution = resolution
+        self.points = points
+        self.date_from = date_from
+        self.date_to = date_to
+
+    @property
+    def is_default(self) -> bool:
+        return (
+            self.history_range == "ALL"
+            and self.resolution == "daily"
+            and not self.points
+            and self.date_from is None
+            and self.date_to is None
+        )
+
+    @property
+    def key(self) -> str:
+        """Часть ключа кэша и ETag вида."""
+        dates = "" if self.date_from is None else self.date_from.isoformat()
+        dates += "." if self.date_to is None else f".{self.date_to.isoformat()}"
+        return f"{self.history_range}.{self.resolution}.{self.points or ''}.{dates}"
+
+    def bounds(self, last_day: int) -> Tuple[Optional[int], Optional[int]]:
+        """Границы по дням: свои даты важнее диапазона, диапазон — от last_day."""
+        if self.date_from is not None or self.date_to is not None:
+            return (
+                None if self.date_from is None else self.date_from.toordinal() - _EPOCH_ORDINAL,
+                None if self.date_to is None else self.date_to.toordinal() - _EPOCH_ORDINAL,
+            )
+        months = HISTORY_RANGES[self.history_range]
+        return (None if months is None else _months_before(last_day, months)), None
+
+    def apply(self, series: list, last_day: int) -> list:
+        history = HistorySeries.from_series(series)
+        if not len(history):
+            return series
+        history = history.between(*self.bounds(last_day))
+        period = HISTORY_RESOLUTIONS[self.resolution]
+        if period:
+            history = history.resampled(period)
+        if self.points:
+            history = history.downsampled(self.points)
+        return history.to_series()
+
+
+def apply_history_view(dashboard: dict, view: HistoryView) -> dict:
+    """
+    Копия данных дашборда с историей портфелей в виде view. Исходные данные (общий объект
+    кэша) не меняются: копируются только словари портфелей. Диапазоны отсчитываются
+    от последней даты истории среди всех портфелей.
+    """
+    portfolios = dashboard.get("portfolios") or []
+    last_days = [
+        p["history"]["series"][-1][0]
+        for p in portfolios
+        if isinstance(p.get("history"), dict) and p["history"].get("series")
+    ]
+    if not last_days:
+        return dashboard
+    last_day = int(np.datetime64(max(last_days), "D").astype(np.int64))
+    return {
+        **dashboard,
+        "portfolios": [
+            {**p, "history": {"series": view.apply(p["history"]["series"], last_day)}}
+            if isinstance(p.get("history"), dict) and p["history"].get("series")
+            else p
+            for p in portfolios
+        ],
+    }
+
+
+@cache("dashboard:{user_id}:{stamp}:{view.key}", ttl=300, local=True)
+async def _get_dashboard_view(user_id: str, stamp: str, view: HistoryView, dashboard: dict):
+    """Вид истории для записи дашборда со штампом stamp (новое содержимое — новый ключ)."""
+    return apply_history_view(dashboard, view)
+
+
+def _view_stamp(stamp: Optional[str], view: HistoryView) -> Optional[str]:
+    if not stamp or view.is_default:
+        return stamp
+    return f"{stamp}.{view.key}"
+
+
+async def get_dashboard_view(user_id: str, view: HistoryView) -> Tuple[dict, Optional[str]]:
+    """
+    (данные дашборда с историей в виде view, штамп для ETag). Виды строятся из записи
+    get_dashboard_data и кэшируются по её штампу: инвалидация dashboard:{user_id} делает
+    недоступными и все виды, отдельный сброс не нужен.
+    """
+    dashboard, stamp = await get_dashboard_data.with_etag(user_id)
+    if view.is_default:
+        return dashboard, stamp
+    if not stamp:
+        return apply_history_view(dashboard, view), None
+    return await _get_dashboard_view(user_id, stamp, view, dashboard), _view_stamp(stamp, view)
+
+
+async def get_dashboard_view_etag(user_id: str, view: HistoryView) -> Optional[str]:
+    """Штамп вида view для свежей записи дашборда (см. get_dashboard_data.etag)."""
+    return _view_stamp(await get_dashboard_data.etag(user_id), view)
+
+
+# Недавно открывавшие дашборд: ZSET user_id -> unix-время последнего запроса
+# (не под dashboard:*, чтобы не попадать под инвалидации по шаблону)
+DASHBOARD_SEEN_KEY = "seen:dashboard"
+
+# Не чаще раза в минуту на пользователя в процессе
+_SEEN_TOUCH_SECONDS = 60
+_seen_touched: Dict[str, float] = {}
+
+
+async def touch_dashboard_user(user_id: str) -> None:
+    """Отмечает пользователя как активного (для прогрева кэша после обновления цен)."""
+    now = time()
+    if now - _seen_touched.get(user_id, 0) < _SEEN_TOUCH_SECONDS:
+        return
+    if len(_seen_touched) > 10000:
+        _seen_touched.clear()
+    _seen_touched[user_id] = now
+    await redis_zadd(DASHBOARD_SEEN_KEY, {user_id: now})
+
+
+async def warm_dashboards(user_ids: Iterable[str]) -> int:
+    """
+    Пересчитывает кэш дашбордов недавно активных пользователей из user_ids (сначала
+    самых недавних) в пределах Config.DASHBOARD_WARM_*. Возвращает число прогретых.
+    """
+    if Config.DASHBOARD_WARM_MAX_USERS <= 0:
+        return 0
+    candidates = set(user_ids)
+    if not candidates:
+        return 0
+
+    active_since = time() - Config.DASHBOARD_WARM_ACTIVE_HOURS * 3600
+    await redis_zremrangebyscore(DASHBOARD_SEEN_KEY, active_since)
+    recent = await redis_zrevrangebyscore(DASHBOARD_SEEN_KEY, active_since)
+    targets = [user_id for user_id in recent if user_id in candidates][:Config.DASHBOARD_WARM_MAX_USERS]
+    if not targets:
+        return 0
+
+    started = monotonic()
+    deadline = started + Config.DASHBOARD_WARM_BUDGET_SECONDS
+    semaphore = asyncio.Semaphore(max(1, Config.DASHBOARD_WARM_CONCURRENCY))
+    warmed = 0
+
+    async def _warm(user_id: str) -> None:
+        nonlocal warmed
+        async with semaphore:
+            if monotonic() > deadline:
+                return
+            if await get_dashboard_data.refresh(user_id):
+                warmed += 1
+
+    await asyncio.gather(*(_warm(user_id) for user_id in targets))
+    logger.info(
+        f"Прогрев дашбордов: {warmed} из {len(targets)} активных "
+        f"({len(candidates)} затронуто), {monotonic() - started:.1f} сек"
+    )
+    return warmed
@@ -0,0 +1,169 @@
+"""
+История стоимости портфеля в виде выровненных массивов numpy.
+
+HistorySeries: days — номера дней от 1970-01-01 (int64, по возрастанию, без повторов),
+values — float64 формы (len(days), 5), столбцы HISTORY_FIELDS. Forward fill, объединение
+дат и суммирование — векторные операции без словаря на каждый день; в компактный формат
+series ([[date, value, invested, payouts, pnl, balance], ...]) история переводится
+только при отдаче клиенту (to_series). Диапазон и разрешение графика (between, resampled,
+downsampled) — тоже над массивами.
+"""
+from typing import Iterable, Optional
+
+import numpy as np
+
+from app.core.logging import get_logger
+from app.utils.date import normalize_date_to_day_string
+
+logger = get_logger(__name__)
+
+HISTORY_FIELDS = ("value", "invested", "payouts", "pnl", "balance")
+
+
+class HistorySeries:
+    """Ежедневные (или разреженные) значения истории по дням."""
+
+    __slots__ = ("days", "values")
+
+    def __init__(self, days: np.ndarray, values: np.ndarray):
+        self.days = days
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    @classmethod
+    def empty(cls) -> "HistorySeries":
+        return cls(np.empty(0, dtype=np.int64), np.empty((0, len(HISTORY_FIELDS))))
+
+    @classmethod
+    def from_rows(cls, history_list: Optional[Iterable[dict]]) -> "HistorySeries":
+        """
+        История из SQL (строки с date/report_date и полями HISTORY_FIELDS). Даты нормализуются
+        один раз; строки без даты пропускаются, значения на одну дату суммируются.
+        """
+        day_strings, rows = [], []
+        for h in history_list or []:
+            if not isinstance(h, dict):
+                continue
+            date_raw = h.get("date") or h.get("report_date")
+            if not date_raw:
+                continue
+            day = normalize_date_to_day_string(date_raw)
+            if not day:
+                logger.warning(f"Не удалось нормализовать дату: {date_raw} (тип: {type(date_raw)})")
+                continue
+            day_strings.append(day)
+            rows.append([float(h.get(field) or 0) for field in HISTORY_FIELDS])
+        if not rows:
+            return cls.empty()
+
+        days = np.array(day_strings, dtype="datetime64[D]").astype(np.int64)
+        unique_days, positions = np.unique(days, return_inverse=True)
+        values = np.zeros((len(unique_days), len(HISTORY_FIELDS)))
+        np.add.at(values, positions, np.array(rows))
+        return cls(unique_days, values)
+
+    @classmethod
+    def from_series(cls, series: Optional[list]) -> "HistorySeries":
+        """Обратно из компактного формата to_series (даты уже нормализованы и по возрастанию)."""
+        if not series:
+            return cls.empty()
+        days = np.array([row[0] for row in series], dtype="datetime64[D]").astype(np.int64)
+        return cls(days, np.array([row[1:] for row in series], dtype=np.float64))
+
+    @property
+    def last_day(self) -> Optional[int]:
+        return int(self.days[-1]) if len(self.days) else None
+
+    def column(self, field: str) -> np.ndarray:
+        return self.values[:, HISTORY_FIELDS.index(field)]
+
+    def forward_filled(self, until: Optional[int] = None) -> "HistorySeries":
+        """
+        Ежедневный ряд от первого дня до последнего (или до until, если он позже):
+        пропущенные дни — последним известным значением.
+        """
+        if not len(self):
+            return self
+        last = self.days[-1] if until is None else max(int(self.days[-1]), until)
+        days = np.arange(self.days[0], last + 1, dtype=np.int64)
+        return HistorySeries(days, self.values[np.searchsorted(self.days, days, side="right") - 1])
+
+    def between(self, start: Optional[int] = None, end: Optional[int] = None) -> "HistorySeries":
+        """Дни из [start, end] (None — без границы)."""
+        lo = 0 if start is None else int(np.searchsorted(self.days, start, side="left"))
+        hi = len(self) if end is None else int(np.searchsorted(self.days, end, side="right"))
+        return HistorySeries(self.days[lo:hi], self.values[lo:hi])
+
+    def resampled(self, period: str) -> "HistorySeries":
+        """
+        Последняя точка каждой недели ("W", с понедельника) или месяца ("M") и первая точка
+        ряда (начало графика). Значения истории — остатки на дату, поэтому берётся последняя,
+        а не сумма или среднее.
+        """
+        if len(self) < 2:
+            return self
+        if period == "W":
+            # 1970-01-01 — четверг: +3 выравнивает недели по понедельнику
+            buckets = (self.days + 3) // 7
+        else:
+            buckets = self.days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        keep = np.flatnonzero(np.diff(buckets))
+        keep = np.concatenate(([0], keep[keep > 0], [len(self) - 1]))
+        return HistorySeries(self.days[keep], self.values[keep])
+
+    def downsampled(self, points: int) -> "HistorySeries":
+        """
+        Не больше points точек по стоимости (value) алгоритмом Largest-Triangle-Three-Buckets:
+        первая и последняя точки сохраняются, из каждой корзины берётся точка, дающая
+        наибольший треугольник с предыдущей выбранной и средним следующей корзины.
+        """
+        n = len(self)
+        if points < 3 or n <= points:
+            return self
+        x = self.days.astype(np.float64)
+        y = self.values[:, 0]
+        bucket = (n - 2) / (points - 2)
+        selected = np.empty(points, dtype=np.int64)
+        selected[0], selected[-1] = 0, n - 1
+        a = 0
+        for i in range(points - 2):
+            start = int(i * bucket) + 1
+            end = int((i + 1) * bucket) + 1
+            next_end = min(int((i + 2) * bucket) + 1, n)
+            avg_x = x[end:next_end].mean()
+            avg_y = y[end:next_end].mean()
+            area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+            a = start + int(area.argmax())
+            selected[i + 1] = a
+        return HistorySeries(self.days[selected], self.values[selected])
+
+    @classmethod
+    def sum(cls, parts: Iterable["HistorySeries"]) -> "HistorySeries":
+        """Сумма рядов по объединению дат (день, которого нет в ряду, даёт ему 0)."""
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.empty()
+        days = np.unique(np.concatenate([p.days for p in parts]))
+        values = np.zeros((len(days), len(HISTORY_FIELDS)))
+        for p in parts:
+            values[np.searchsorted(days, p.days)] += p.values
+        return cls(days, values)
+
+    def rounded(self, decimals: int = 2) -> "HistorySeries":
+        return HistorySeries(self.days, np.round(self.values, decimals))
+
+    def to_series(self, zero_point: bool = False) -> list:
+        """
+        Компактный формат для клиента: [[date, value, invested, payouts, pnl, balance], ...].
+        zero_point — нулевая строка за день до первой даты (график начинается с нуля).
+        """
+        if not len(self):
+            return []
+        dates = self.days.astype("datetime64[D]").astype(str).tolist()
+        series = [[day, *row] for day, row in zip(dates, self.values.tolist())]
+        if zero_point:
+            day_before = str((self.days[0] - 1).astype("datetime64[D]"))
+            series.insert(0, [day_before] + [0.0] * len(HISTORY_FIELDS))
+        return series
@@ -225,5 +225,5 @@ async def table_insert_bulk_async(table: str, rows: list[dict]):
     """Батчевая вставка данных в таблицу."""
     if not rows:
         return True
-    await table_insert_async(table, rows)
+    await table_insert_async(table, rows, returning=False)
     return True
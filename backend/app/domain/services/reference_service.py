@@ -1,36 +1,51 @@
 """
 Справочные данные: общий кэш в Redis (все воркеры/инстансы), иначе — память процесса.
 
-Брокеры и payload справочника (reference + assets_index) хранятся в Redis без TTL;
-инвалидация — invalidate_reference_cache() (после обновления MOEX и т.п.).
+Брокеры и payload справочника (reference + assets_index) хранятся в Redis без TTL
+в формате codec; инвалидация — invalidate_reference_cache() (после обновления MOEX и т.п.).
+
+Redis — асинхронный клиент. Разобранный bundle держится в памяти воркера; fingerprint
+в Redis сверяется не чаще Config.REFERENCE_CHECK_SECONDS (до этого времени другие процессы
+могут отдавать предыдущую версию). Разбор и сериализация bundle — в потоке, не в event loop.
 """
 import asyncio
 import hashlib
 import json
+import time
+from typing import Optional
+
+from app.infrastructure.cache.codec import decode, encode
 from app.infrastructure.database.database_service import rpc_async, table_select_async
+from app.config import Config
 from app.core.logging import get_logger
-from app.infrastructure.cache.redis_client_sync import (
-    redis_sync_available,
-    redis_sync_delete,
-    redis_sync_get,
-    redis_sync_set,
+from app.infrastructure.cache.redis_client import (
+    redis_available,
+    redis_get,
+    redis_mset_with_ttl,
+    redis_set,
+    redis_unlink_many,
 )
 
 logger = get_logger(__name__)
 
-# Ключи Redis (префикс — redis_client.CACHE_PREFIX, тот же у redis_client_sync)
+# Ключи Redis (префикс — redis_client.CACHE_PREFIX)
 REF_FINGERPRINT_KEY = "reference:fingerprint"
 REF_BUNDLE_KEY = "reference:bundle"
 REF_BROKERS_KEY = "reference:brokers"
 
-# Локальный снимок после парсинга bundle (на воркере), синхронизируется по fingerprint с Redis
+# Локальный снимок после парсинга bundle (на воркере), синхронизируется по fingerprint с Redis;
+# checked_at — time.monotonic() последней сверки fingerprint
 _worker_bundle: dict = {
     "fingerprint": None,
     "reference": None,
     "assets_list": None,
     "assets_by_id": None,
+    "checked_at": 0.0,
 }
 
+# Текущая синхронизация bundle: параллельные запросы ждут её, а не идут в Redis/БД сами
+_sync_task: Optional[asyncio.Task] = None
+
 # Fallback, если REDIS_URL не задан или Redis недоступен
 _memory_fallback: dict = {
     "reference": None,
@@ -85,11 +100,12 @@ def _build_assets_by_id(items: list) -> dict[int, dict]:
     return by_id
 
 
-def _set_worker_bundle(ref: dict, items: list, fp: str) -> None:
+def _set_worker_bundle(ref: dict, items: list, fp: str, by_id: dict[int, dict]) -> None:
     _worker_bundle["fingerprint"] = fp
     _worker_bundle["reference"] = ref
     _worker_bundle["assets_list"] = items
-    _worker_bundle["assets_by_id"] = _build_assets_by_id(items)
+    _worker_bundle["assets_by_id"] = by_id
+    _worker_bundle["checked_at"] = time.monotonic()
 
 
 def _clear_worker_bundle() -> None:
@@ -97,11 +113,12 @@ def _clear_worker_bundle() -> None:
     _worker_bundle["reference"] = None
     _worker_bundle["assets_list"] = None
     _worker_bundle["assets_by_id"] = None
+    _worker_bundle["checked_at"] = 0.0
 
 
-def _apply_memory_assets(items: list) -> None:
+def _apply_memory_assets(items: list, by_id: dict[int, dict]) -> None:
     _memory_fallback["assets_search_list"] = items
-    _memory_fallback["assets_search_by_id"] = _build_assets_by_id(items)
+    _memory_fallback["assets_search_by_id"] = by_id
 
 
 def _reset_memory_reference() -> None:
@@ -111,103 +128,148 @@ def _reset_memory_reference() -> None:
     _memory_fallback["assets_search_by_id"] = None
 
 
-def _sync_worker_bundle_from_redis() -> bool:
+def _prepare_bundle(raw, serialize: bool) -> tuple:
+    """Ответ get_reference_cache_payload -> (reference, активы, индекс по id, fingerprint, запись для Redis)."""
+    bundle = _parse_rpc_dict(raw)
+    ref = bundle.get("reference") or {}
+    if not isinstance(ref, dict):
+        ref = {}
+    items = _parse_jsonb_asset_list(bundle.get("assets_index"))
+    fp = _reference_fingerprint_for(ref)
+    blob = None
+    if serialize:
+        blob, _ = encode({"reference": ref, "assets_index": items, "fingerprint": fp}, REF_BUNDLE_KEY)
+    return ref, items, _build_assets_by_id(items), fp, blob
+
+
+def _parse_bundle(blob: bytes) -> tuple:
+    """Запись bundle из Redis -> (reference, активы, индекс по id, fingerprint или None)."""
+    obj, _ = decode(blob)
+    ref = obj.get("reference") or {}
+    if not isinstance(ref, dict):
+        ref = {}
+    items = _parse_jsonb_asset_list(obj.get("assets_index"))
+    return ref, items, _build_assets_by_id(items), obj.get("fingerprint")
+
+
+async def _sync_worker_bundle_from_redis() -> bool:
     """Подтянуть bundle с Redis в память воркера. False — нет данных или ошибка."""
-    if not redis_sync_available():
-        return False
-    fp = redis_sync_get(REF_FINGERPRINT_KEY)
-    if not fp:
+    raw_fp = await redis_get(REF_FINGERPRINT_KEY)
+    if not raw_fp:
         _clear_worker_bundle()
         return False
+    fp = raw_fp.decode("utf-8")
     if _worker_bundle.get("fingerprint") == fp:
+        _worker_bundle["checked_at"] = time.monotonic()
         return True
-    blob = redis_sync_get(REF_BUNDLE_KEY)
+    blob = await redis_get(REF_BUNDLE_KEY)
     if not blob:
         _clear_worker_bundle()
         return False
     try:
-        obj = json.loads(blob)
-    except json.JSONDecodeError:
-        logger.warning("reference:bundle — битый JSON, ключи удалены")
-        redis_sync_delete(REF_FINGERPRINT_KEY, REF_BUNDLE_KEY)
+        ref, items, by_id, bundle_fp = await asyncio.to_thread(_parse_bundle, blob)
+    except Exception as e:
+        logger.warning("reference:bundle — не удалось разобрать (%s), ключи удалены", e)
+        await redis_unlink_many([REF_FINGERPRINT_KEY, REF_BUNDLE_KEY])
         _clear_worker_bundle()
         return False
-    ref = obj.get("reference") or {}
-    if not isinstance(ref, dict):
-        ref = {}
-    items = _parse_jsonb_asset_list(obj.get("assets_index"))
-    _set_worker_bundle(ref, items, fp)
+    # Fingerprint мог смениться между чтениями — данные описывает тот, что внутри bundle
+    _set_worker_bundle(ref, items, bundle_fp or fp, by_id)
     return True
 
 
+async def _sync_worker_bundle() -> None:
+    if await _sync_worker_bundle_from_redis():
+        return
+    try:
+        await _load_reference_into_cache()
+    except Exception as e:
+        logger.error("Не удалось загрузить справочник по требованию: %s", e, exc_info=True)
+        await _reset_reference_after_load_failure()
+
+
+async def _ensure_worker_bundle() -> None:
+    """Актуализировать bundle воркера (режим Redis): сверка не чаще Config.REFERENCE_CHECK_SECONDS."""
+    global _sync_task
+    if (
+        _worker_bundle["fingerprint"]
+        and time.monotonic() - _worker_bundle["checked_at"] < Config.REFERENCE_CHECK_SECONDS
+    ):
+        return
+    if _sync_task is None or _sync_task.done():
+        _sync_task = asyncio.get_running_loop().create_task(_sync_worker_bundle())
+    # shield: отмена одного запроса не должна прерывать синхронизацию для остальных
+    await asyncio.shield(_sync_task)
+
+
 def get_reference_fingerprint_str() -> str:
-    if redis_sync_available():
-        return redis_sync_get(REF_FINGERPRINT_KEY) or ""
+    """Fingerprint справочника, отданного этим процессом (после get_reference_data_cached)."""
+    if redis_available():
+        return _worker_bundle.get("fingerprint") or ""
+    return _memory_fallback.get("reference_fingerprint") or ""
+
+
+async def get_reference_version() -> str:
+    """
+    Текущий fingerprint справочника без загрузки и разбора bundle (проверка ETag):
+    локальный, если сверка с Redis была меньше Config.REFERENCE_CHECK_SECONDS назад,
+    иначе — ключ fingerprint в Redis. Пустая строка — справочник ещё не загружен.
+    """
+    if redis_available():
+        if (
+            _worker_bundle["fingerprint"]
+            and time.monotonic() - _worker_bundle["checked_at"] < Config.REFERENCE_CHECK_SECONDS
+        ):
+            return _worker_bundle["fingerprint"]
+        raw_fp = await redis_get(REF_FINGERPRINT_KEY)
+        return raw_fp.decode("utf-8") if raw_fp else ""
     return _memory_fallback.get("reference_fingerprint") or ""
 
 
-def invalidate_reference_cache() -> None:
-    redis_sync_delete(REF_FINGERPRINT_KEY, REF_BUNDLE_KEY, REF_BROKERS_KEY)
+async def invalidate_reference_cache() -> None:
+    await redis_unlink_many([REF_FINGERPRINT_KEY, REF_BUNDLE_KEY, REF_BROKERS_KEY])
     _clear_worker_bundle()
     _reset_memory_reference()
     _memory_fallback["brokers"] = None
     logger.info("Кэш справочника сброшен (Redis + локально)")
 
 
-def _reset_reference_after_load_failure() -> None:
-    if redis_sync_available():
-        redis_sync_delete(REF_FINGERPRINT_KEY, REF_BUNDLE_KEY)
+async def _reset_reference_after_load_failure() -> None:
+    if redis_available():
+        await redis_unlink_many([REF_FINGERPRINT_KEY, REF_BUNDLE_KEY])
     _clear_worker_bundle()
     _reset_memory_reference()
 
 
 async def _load_reference_into_cache() -> None:
     raw = await rpc_async("get_reference_cache_payload", {})
-    bundle = _parse_rpc_dict(raw)
-    ref = bundle.get("reference") or {}
-    if not isinstance(ref, dict):
-        ref = {}
-    items = _parse_jsonb_asset_list(bundle.get("assets_index"))
-    fp = _reference_fingerprint_for(ref)
+    use_redis = redis_available()
+    ref, items, by_id, fp, blob = await asyncio.to_thread(_prepare_bundle, raw, use_redis)
 
-    if redis_sync_available():
-        payload = json.dumps(
-            {"reference": ref, "assets_index": items, "fingerprint": fp},
-            default=str,
-            ensure_ascii=False,
-        )
-        if not redis_sync_set(REF_FINGERPRINT_KEY, fp) or not redis_sync_set(REF_BUNDLE_KEY, payload):
+    if use_redis:
+        # Атомарно: читатель, увидевший новый fingerprint, найдёт и новый bundle
+        if not await redis_mset_with_ttl({REF_BUNDLE_KEY: blob, REF_FINGERPRINT_KEY: fp}, ttl=None):
             logger.error("Запись справочника в Redis не удалась")
-            redis_sync_delete(REF_FINGERPRINT_KEY, REF_BUNDLE_KEY)
+            await redis_unlink_many([REF_FINGERPRINT_KEY, REF_BUNDLE_KEY])
             raise RuntimeError("Redis SET reference bundle failed")
     else:
         _memory_fallback["reference"] = ref
         _memory_fallback["reference_fingerprint"] = fp
-        _apply_memory_assets(items)
+        _apply_memory_assets(items, by_id)
 
-    _set_worker_bundle(ref, items, fp)
+    _set_worker_bundle(ref, items, fp, by_id)
     logger.info("Справочник загружен (%s активов)", len(items))
 
 
-def _reference_exists_in_store() -> bool:
-    if redis_sync_available():
-        return bool(redis_sync_get(REF_FINGERPRINT_KEY))
+async def _reference_exists_in_store() -> bool:
+    if redis_available():
+        return bool(await redis_get(REF_FINGERPRINT_KEY))
     return _memory_fallback.get("reference") is not None
 
 
 async def _ensure_assets_search_cache() -> None:
-    if redis_sync_available():
-        if not redis_sync_get(REF_FINGERPRINT_KEY):
-            try:
-                await _load_reference_into_cache()
-            except Exception as e:
-                logger.error("Справочник (ensure cache): %s", e, exc_info=True)
-            return
-        if not _sync_worker_bundle_from_redis():
-            try:
-                await _load_reference_into_cache()
-            except Exception as e:
-                logger.error("Повторная загрузка справочника: %s", e, exc_info=True)
+    if redis_available():
+        await _ensure_worker_bundle()
         return
 
     if _memory_fallback.get("assets_search_list") is not None:
@@ -239,7 +301,7 @@ async def search_reference_assets(query: str, limit: int = 25) -> list:
     if len(q) < 2:
         return []
     await _ensure_assets_search_cache()
-    if redis_sync_available():
+    if redis_available():
         items = _worker_bundle.get("assets_list") or []
     else:
         items = _memory_fallback.get("assets_search_list") or []
@@ -278,7 +340,7 @@ async def get_reference_asset_meta(asset_id: int) -> dict | None:
         return None
     aid = int(asset_id)
     await _ensure_assets_search_cache()
-    if redis_sync_available():
+    if redis_available():
         by_id = _worker_bundle.get("assets_by_id") or {}
     else:
         by_id = _memory_fallback.get("assets_search_by_id") or {}
@@ -310,20 +372,8 @@ async def get_reference_asset_splits(asset_id: int) -> list:
 
 
 async def get_reference_data_cached():
-    if redis_sync_available():
-        if not redis_sync_get(REF_FINGERPRINT_KEY):
-            try:
-                await _load_reference_into_cache()
-            except Exception as e:
-                logger.error("Не удалось загрузить справочник по требованию: %s", e, exc_info=True)
-                _reset_reference_after_load_failure()
-            return _worker_bundle.get("reference") or {}
-        if not _sync_worker_bundle_from_redis():
-            try:
-                await _load_reference_into_cache()
-            except Exception as e:
-                logger.error("Не удалось синхронизировать справочник из Redis: %s", e, exc_info=True)
-                _reset_reference_after_load_failure()
+    if redis_available():
+        await _ensure_worker_bundle()
         return _worker_bundle.get("reference") or {}
 
     if _memory_fallback["reference"] is None:
@@ -331,12 +381,12 @@ async def get_reference_data_cached():
             await _load_reference_into_cache()
         except Exception as e:
             logger.error("Не удалось загрузить справочник по требованию: %s", e, exc_info=True)
-            _reset_reference_after_load_failure()
+            await _reset_reference_after_load_failure()
     return _memory_fallback["reference"] or {}
 
 
 async def init_reference_data_async():
-    if _reference_exists_in_store():
+    if await _reference_exists_in_store():
         logger.debug("Справочник уже в Redis/памяти — пропуск загрузки при старте")
         return
 
@@ -349,10 +399,10 @@ async def init_reference_data_async():
         logger.info("Справочник успешно загружен")
     except asyncio.TimeoutError:
         logger.error("Таймаут загрузки справочника при старте (более 30 с)")
-        _reset_reference_after_load_failure()
+        await _reset_reference_after_load_failure()
     except Exception as e:
         logger.error("Не удалось загрузить справочник при старте: %s", e, exc_info=True)
-        _reset_reference_after_load_failure()
+        await _reset_reference_after_load_failure()
 
 
 async def get_brokers():
@@ -360,19 +410,19 @@ async def get_brokers():
 
 
 async def get_brokers_cached():
-    if redis_sync_available():
-        s = redis_sync_get(REF_BROKERS_KEY)
-        if s:
+    if redis_available():
+        blob = await redis_get(REF_BROKERS_KEY)
+        if blob:
             try:
-                return json.loads(s)
-            except json.JSONDecodeError:
-                redis_sync_delete(REF_BROKERS_KEY)
+                return decode(blob)[0]
+            except Exception:
+                await redis_unlink_many([REF_BROKERS_KEY])
         try:
             rows = await get_brokers()
         except Exception as e:
             logger.error("Не удалось загрузить список брокеров: %s", e, exc_info=True)
             return []
-        redis_sync_set(REF_BROKERS_KEY, json.dumps(rows, default=str, ensure_ascii=False))
+        await redis_set(REF_BROKERS_KEY, encode(rows, REF_BROKERS_KEY)[0], ttl=None)
         return rows
 
     if _memory_fallback["brokers"] is None:
@@ -386,26 +436,26 @@ async def get_brokers_cached():
 
 
 async def init_brokers_async():
-    if redis_sync_available() and redis_sync_get(REF_BROKERS_KEY):
+    if redis_available() and await redis_get(REF_BROKERS_KEY):
         logger.debug("Брокеры уже в Redis, пропуск загрузки")
         return
-    if not redis_sync_available() and _memory_fallback.get("brokers"):
+    if not redis_available() and _memory_fallback.get("brokers"):
         logger.debug("Брокеры уже в памяти, пропуск загрузки")
         return
 
     try:
         logger.info("Загрузка брокеров при старте сервера")
         rows = await asyncio.wait_for(get_brokers(), timeout=10.0) or []
-        if redis_sync_available():
-            redis_sync_set(REF_BROKERS_KEY, json.dumps(rows, default=str, ensure_ascii=False))
+        if redis_available():
+            await redis_set(REF_BROKERS_KEY, encode(rows, REF_BROKERS_KEY)[0], ttl=None)
         else:
             _memory_fallback["brokers"] = rows
         logger.info("Брокеры загружены, записей: %s", len(rows))
     except asyncio.TimeoutError:
         logger.error("Таймаут загрузки брокеров при старте (более 10 с)")
-        if not redis_sync_available():
+        if not redis_available():
             _memory_fallback["brokers"] = []
     except Exception as e:
         logger.error("Не удалось загрузить брокеров при старте: %s", e, exc_info=True)
-        if not redis_sync_available():
+        if not redis_available():
             _memory_fallback["brokers"] = []
@@ -86,7 +86,7 @@ async def update_user(user_id: str, name: str = None, email: str = None):
         from app.infrastructure.cache.decorators import invalidate_cache
         from app.core.dependencies import invalidate_cached_user
 
-        await invalidate_cache("dashboard:{user_id}", user_id=str(user_id))
+        await invalidate_cache("dashboard:{user_id}", source="user_update", user_id=str(user_id))
         invalidate_cached_user(existing.get("email"))
 
     return result
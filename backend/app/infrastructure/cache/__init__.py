@@ -1,27 +1,18 @@
 from . import redis_client
-from . import redis_client_sync
 from app.infrastructure.cache.redis_client import (
     init_redis,
     close_redis,
     redis_available,
 )
-from app.infrastructure.cache.redis_client_sync import (
-    init_redis_sync,
-    close_redis_sync,
-    redis_sync_available,
-)
-from app.infrastructure.cache.decorators import cache, invalidate, invalidate_cache
+from app.infrastructure.cache.decorators import cache, invalidate, invalidate_cache, invalidate_tags
 
 __all__ = [
     "redis_client",
-    "redis_client_sync",
     "init_redis",
     "close_redis",
     "redis_available",
-    "init_redis_sync",
-    "close_redis_sync",
-    "redis_sync_available",
     "cache",
     "invalidate",
     "invalidate_cache",
+    "invalidate_tags",
 ]
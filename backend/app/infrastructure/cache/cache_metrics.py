@@ -0,0 +1,91 @@
+"""
+Метрики кэша в памяти процесса.
+
+По шаблонам ключей @cache ("dashboard:{user_id}") — попадания в L1 и Redis, отдачи
+устаревших значений (stale-while-revalidate), промахи, время заполнения, ожидания чужого
+заполнения и ошибки вычисления. Инвалидации — по пространству ключей (первый сегмент:
+"dashboard") и источнику (функция с @invalidate, воркер и т.д.). Ошибки Redis — по операциям.
+Размеры записей — codec.get_codec_stats(). Данные на процесс, сбрасываются при рестарте.
+"""
+import time
+from collections import defaultdict
+from typing import DefaultDict, Dict
+
+from app.infrastructure.database.query_metrics import Histogram
+
+
+class CacheStats:
+    """Накопленная статистика одного шаблона ключа."""
+
+    __slots__ = ("l1_hits", "hits", "stale_hits", "misses", "lock_waits", "fill_errors", "fill")
+
+    def __init__(self):
+        self.l1_hits = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.lock_waits = 0
+        self.fill_errors = 0
+        self.fill = Histogram()
+
+    def to_dict(self) -> dict:
+        served = self.l1_hits + self.hits + self.stale_hits
+        total = served + self.misses
+        return {
+            "requests": total,
+            "hit_rate": round(served / total, 4) if total else 0.0,
+            "l1_hits": self.l1_hits,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "lock_waits": self.lock_waits,
+            "fill_errors": self.fill_errors,
+            "fill": self.fill.to_dict(),
+        }
+
+
+_stats: Dict[str, CacheStats] = {}
+_invalidations: DefaultDict[str, DefaultDict[str, int]] = defaultdict(lambda: defaultdict(int))
+_redis_errors: DefaultDict[str, int] = defaultdict(int)
+_started_at = time.time()
+
+
+def stats_for(template: str) -> CacheStats:
+    stats = _stats.get(template)
+    if stats is None:
+        stats = _stats[template] = CacheStats()
+    return stats
+
+
+def record_invalidation(key_or_template: str, source: str, count: int = 1) -> None:
+    """Инвалидация в пространстве ключей (первый сегмент ключа или шаблона)."""
+    namespace = key_or_template.split(":", 1)[0] or key_or_template
+    _invalidations[namespace][source] += count
+
+
+def record_redis_error(operation: str) -> None:
+    _redis_errors[operation] += 1
+
+
+def get_cache_metrics() -> dict:
+    """Снимок метрик для админского эндпоинта (шаблоны — по числу обращений)."""
+    items = sorted(
+        _stats.items(),
+        key=lambda kv: kv[1].l1_hits + kv[1].hits + kv[1].stale_hits + kv[1].misses,
+        reverse=True,
+    )
+    return {
+        "since": _started_at,
+        "keys": {template: stats.to_dict() for template, stats in items},
+        "invalidations": {ns: dict(sources) for ns, sources in _invalidations.items()},
+        "redis_errors": dict(_redis_errors),
+    }
+
+
+def reset_cache_metrics() -> None:
+    """Сбрасывает накопленные метрики."""
+    global _started_at
+    _stats.clear()
+    _invalidations.clear()
+    _redis_errors.clear()
+    _started_at = time.time()
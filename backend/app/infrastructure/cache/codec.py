@@ -0,0 +1,163 @@
+"""
+Бинарный формат значений @cache в Redis.
+
+Заголовок: MAGIC (0xC1 — недопустимый первый байт UTF-8, JSON-текст с него
+не начинается), версия формата, кодек, с версии 2 — штамп содержимого (STAMP_SIZE байт
+blake2b от JSON). Дальше — orjson-байты, сжатые zstd (если установлен zstandard, иначе zlib),
+когда они не короче Config.CACHE_COMPRESS_MIN_BYTES и сжатие действительно уменьшает запись.
+Значения без заголовка — записи старого формата (JSON-текст) и читаются как есть.
+
+Штамп — строгий ETag значения: одинаковое содержимое даёт одинаковый штамп, а прочитать
+его можно первыми HEADER_SIZE байтами записи (GETRANGE), не забирая и не разбирая значение.
+
+Размеры записей и степень сжатия копятся по шаблонам ключей (get_codec_stats).
+"""
+import hashlib
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+
+from app.config import Config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = 0xC1
+VERSION = 2
+# Версия 1 — без штампа
+_VERSIONS = (1, VERSION)
+
+STAMP_SIZE = 8
+HEADER_SIZE = 3 + STAMP_SIZE
+
+CODEC_NONE = 0
+CODEC_ZSTD = 1
+CODEC_ZLIB = 2
+
+CODEC_NAMES = {CODEC_NONE: "none", CODEC_ZSTD: "zstd", CODEC_ZLIB: "zlib"}
+
+_ZSTD_LEVEL = 3
+_ZLIB_LEVEL = 6
+
+
+class CodecError(ValueError):
+    """Запись в неизвестном формате (версия/кодек) или недоступен кодек для распаковки."""
+
+
+if zstandard is not None:
+    _zstd_compressor = zstandard.ZstdCompressor(level=_ZSTD_LEVEL)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+    DEFAULT_CODEC = CODEC_ZSTD
+else:
+    DEFAULT_CODEC = CODEC_ZLIB
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    raise TypeError(f"Cannot serialize {type(obj)}")
+
+
+def _compress(raw: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZSTD:
+        return _zstd_compressor.compress(raw)
+    return zlib.compress(raw, _ZLIB_LEVEL)
+
+
+def _decompress(payload: bytes, codec: int) -> bytes:
+    if codec == CODEC_NONE:
+        return payload
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise CodecError("zstd-запись, но zstandard не установлен")
+        return _zstd_decompressor.decompress(payload)
+    raise CodecError(f"Неизвестный кодек {codec}")
+
+
+class CodecStats:
+    """Размеры записей одного шаблона ключа."""
+
+    __slots__ = ("entries", "compressed", "raw_bytes", "stored_bytes", "max_stored_bytes")
+
+    def __init__(self):
+        self.entries = 0
+        self.compressed = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.max_stored_bytes = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "entries": self.entries,
+            "compressed": self.compressed,
+            "avg_raw_bytes": round(self.raw_bytes / self.entries) if self.entries else 0,
+            "avg_stored_bytes": round(self.stored_bytes / self.entries) if self.entries else 0,
+            "max_stored_bytes": self.max_stored_bytes,
+            "compression_ratio": round(self.raw_bytes / self.stored_bytes, 2) if self.stored_bytes else 0,
+        }
+
+
+_stats: Dict[str, CodecStats] = {}
+
+
+def encode(data: Any, label: str = "") -> Tuple[bytes, int]:
+    """Значение -> (запись для Redis, размер JSON в байтах). label — шаблон ключа для статистики."""
+    raw = orjson.dumps(data, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    codec, payload = CODEC_NONE, raw
+    if Config.CACHE_COMPRESS_MIN_BYTES and len(raw) >= Config.CACHE_COMPRESS_MIN_BYTES:
+        compressed = _compress(raw, DEFAULT_CODEC)
+        if len(compressed) < len(raw):
+            codec, payload = DEFAULT_CODEC, compressed
+    stamp = hashlib.blake2b(raw, digest_size=STAMP_SIZE).digest()
+    blob = bytes((MAGIC, VERSION, codec)) + stamp + payload
+
+    stats = _stats.get(label)
+    if stats is None:
+        stats = _stats[label] = CodecStats()
+    stats.entries += 1
+    stats.compressed += codec != CODEC_NONE
+    stats.raw_bytes += len(raw)
+    stats.stored_bytes += len(blob)
+    if len(blob) > stats.max_stored_bytes:
+        stats.max_stored_bytes = len(blob)
+    return blob, len(raw)
+
+
+def decode(blob: bytes) -> Tuple[Any, int]:
+    """Запись из Redis -> (значение, размер JSON в байтах). Понимает старый формат (JSON-текст)."""
+    if not blob or blob[0] != MAGIC:
+        return orjson.loads(blob), len(blob)
+    if len(blob) < 3 or blob[1] not in _VERSIONS:
+        raise CodecError(f"Неизвестная версия формата кэша {blob[1] if len(blob) > 1 else None}")
+    offset = HEADER_SIZE if blob[1] >= 2 else 3
+    raw = _decompress(blob[offset:], blob[2])
+    return orjson.loads(raw), len(raw)
+
+
+def stamp_of(blob: Optional[bytes]) -> Optional[str]:
+    """Штамп содержимого (hex) из записи или её первых HEADER_SIZE байт; None — старый формат."""
+    if not blob or len(blob) < HEADER_SIZE or blob[0] != MAGIC or blob[1] != VERSION:
+        return None
+    return blob[3:HEADER_SIZE].hex()
+
+
+def get_codec_stats() -> dict:
+    """Снимок статистики размеров по шаблонам ключей."""
+    return {
+        "codec": CODEC_NAMES[DEFAULT_CODEC],
+        "compress_min_bytes": Config.CACHE_COMPRESS_MIN_BYTES,
+        "keys": {label: stats.to_dict() for label, stats in _stats.items()},
+    }
+
+
+def reset_codec_stats() -> None:
+    _stats.clear()
@@ -7,54 +7,80 @@
     async def get_dashboard_data(user_id: int):
         ...
 
+    # С L1-кэшем процесса перед Redis (см. local_cache)
+    @cache("dashboard:{user_id}", ttl=300, local=True)
+
+    # Stale-while-revalidate: ещё час после устаревания отдаётся прежнее значение,
+    # пересчёт идёт в фоне
+    @cache("dashboard:{user_id}", ttl=300, stale_ttl=3600)
+
+    # Теги: из аргументов ("user:{user_id}") и из результата (result_tags)
+    @cache("dashboard:{user_id}", ttl=300, tags=("user:{user_id}",),
+           result_tags=lambda data: [f"asset:{a['asset_id']}" for a in data["assets"]])
+
     @invalidate("dashboard:{user.id}")
     async def add_transaction_route(data, user=Depends(get_current_user)):
         ...
 
+    # Вместе с ключами — все ключи тегов (шаблоны или функция от аргументов)
+    @invalidate("dashboard:{user.id}", tags=("portfolio:{portfolio_id}",))
+
     # Явная инвалидация (для воркеров и т.д.)
     await invalidate_cache("dashboard:*")
+
+    # Пометить устаревшими вместо удаления (для ключей со stale_ttl)
+    await invalidate_cache("dashboard:*", stale=True)
+
+    # Все ключи с тегом — одним скриптом, без SCAN
+    await invalidate_tags("asset:42", "asset:43", stale=True)
+
+    # ETag (штамп содержимого) — для ответов 304 Not Modified
+    etag = await get_dashboard_data.etag(user_id)
+    data, etag = await get_dashboard_data.with_etag(user_id)
 """
+import asyncio
+import contextvars
 import functools
 import inspect
 import re
-from datetime import date, datetime
-from decimal import Decimal
-from typing import Any, Optional
-
-import orjson
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
 from app.infrastructure.cache.redis_client import (
+    FRESH_PREFIX,
+    PRIMARY_PREFIX,
     redis_get,
+    redis_get_head,
+    redis_mget,
     redis_set,
-    redis_delete,
+    redis_set_entry,
+    redis_unlink_many,
     redis_delete_pattern,
+    redis_mark_stale,
+    redis_mark_stale_pattern,
+    redis_invalidate_tags,
     redis_available,
+    redis_lock_acquire,
+    redis_lock_release,
+    redis_pin_primary,
+)
+from app.config import Config
+from app.infrastructure.cache.cache_metrics import record_invalidation, stats_for
+from app.infrastructure.cache.codec import HEADER_SIZE, decode, encode, stamp_of
+from app.infrastructure.cache.local_cache import (
+    MISSING,
+    local_cache,
+    l1_enabled,
+    l1_ready,
+    l1_ttl,
+    publish_invalidation,
 )
+from app.infrastructure.database.postgres_async import use_primary
 from app.core.logging import get_logger
 
 logger = get_logger(__name__)
 
 
-def _json_default(obj: Any) -> Any:
-    if isinstance(obj, Decimal):
-        return float(obj)
-    if isinstance(obj, (date, datetime)):
-        return obj.isoformat()
-    raise TypeError(f"Cannot serialize {type(obj)}")
-
-
-def _serialize(data: Any) -> str:
-    return orjson.dumps(
-        data,
-        default=_json_default,
-        option=orjson.OPT_NON_STR_KEYS,
-    ).decode("utf-8")
-
-
-def _deserialize(raw: str) -> Any:
-    return orjson.loads(raw)
-
-
 def _resolve_key(template: str, bound_args: dict) -> Optional[str]:
     """Разрешает '{param}' и '{param.attr}' заполнители из аргументов функции."""
     def _replacer(match: re.Match) -> str:
@@ -90,51 +116,412 @@ def _bind_args(func, args, kwargs) -> dict:
         return kwargs
 
 
-def cache(key: str, ttl: int = 300):
+
+# Заполнения кэша, выполняющиеся в этом процессе: ключ -> задача
+_inflight: Dict[str, asyncio.Task] = {}
+
+# Фоновые пересчёты устаревших значений (stale-while-revalidate): ключ -> задача
+_revalidating: Dict[str, asyncio.Task] = {}
+
+# Интервал опроса Redis, пока другой процесс заполняет ключ
+_LOCK_POLL_SECONDS = 0.05
+
+
+# Теги ключа: по аргументам вызова и по результату
+TagsFn = Callable[[Any], Iterable[str]]
+
+
+class _Entry:
+    """Ключ одного вызова @cache с параметрами хранения; template — шаблон ключа для статистики."""
+
+    __slots__ = ("key", "template", "ttl", "stale_ttl", "use_l1", "tags", "result_tags")
+
+    def __init__(
+        self,
+        key: str,
+        template: str,
+        ttl: int,
+        stale_ttl: int,
+        use_l1: bool,
+        tags: Sequence[str],
+        result_tags: Optional[TagsFn],
+    ):
+        self.key = key
+        self.template = template
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.use_l1 = use_l1
+        self.tags = tags
+        self.result_tags = result_tags
+
+    async def compute(self, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Вычисляет значение с замером времени заполнения."""
+        stats = stats_for(self.template)
+        started = time.perf_counter()
+        try:
+            return await compute()
+        except BaseException:
+            stats.fill_errors += 1
+            raise
+        finally:
+            stats.fill.observe((time.perf_counter() - started) * 1000)
+
+    def remember(self, value: Any, size: int, etag: Optional[str]) -> None:
+        """Кладёт свежее значение в L1 вместе со штампом (size — байт JSON)."""
+        if self.use_l1 and l1_ready():
+            local_cache.set(self.key, (value, etag), l1_ttl(self.ttl), size)
+
+
+def _decode(entry: _Entry, blob: bytes) -> Any:
+    """Запись из Redis -> (значение, размер, штамп) или MISSING, если запись не читается."""
+    try:
+        value, size = decode(blob)
+    except Exception as e:
+        logger.warning(f"Запись кэша {entry.key} не читается ({e}), пересчёт")
+        return MISSING
+    return value, size, stamp_of(blob)
+
+
+async def _store(entry: _Entry, result: Any) -> Optional[str]:
+    """
+    Сохраняет результат в Redis (и в L1 при use_l1); при stale_ttl — с меткой свежести,
+    при тегах — вместе с добавлением ключа в их множества (атомарно).
+    Возвращает штамп сохранённой записи (None — не сохранено).
+    """
+    if result is None:
+        return None
+    try:
+        blob, size = encode(result, entry.template)
+        all_tags = list(entry.tags)
+        if entry.result_tags is not None:
+            all_tags.extend(entry.result_tags(result))
+        if entry.stale_ttl or all_tags:
+            fresh_until = time.time() + entry.ttl if entry.stale_ttl else None
+            await redis_set_entry(
+                entry.key, blob, entry.ttl + entry.stale_ttl, fresh_until, dict.fromkeys(all_tags)
+            )
+        else:
+            await redis_set(entry.key, blob, entry.ttl)
+        logger.debug(f"Cache SET: {entry.key} (ttl={entry.ttl}s, stale_ttl={entry.stale_ttl}s, {len(blob)} bytes)")
+        etag = stamp_of(blob)
+        entry.remember(result, size, etag)
+        return etag
+    except Exception as e:
+        logger.debug(f"Cache SET failed for {entry.key}: {e}")
+        return None
+
+
+async def _fill(entry: _Entry, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, Optional[str]]:
+    """
+    Заполнение ключа с блокировкой в Redis: значение считает один процесс,
+    остальные ждут его в Redis до Config.CACHE_LOCK_WAIT_MS, затем считают сами.
+    Возвращает (значение, штамп).
+    """
+    acquired, token = await redis_lock_acquire(f"lock:{entry.key}", Config.CACHE_LOCK_TTL_MS)
+    if not acquired:
+        logger.debug(f"Cache WAIT (lock): {entry.key}")
+        stats_for(entry.template).lock_waits += 1
+        deadline = time.monotonic() + Config.CACHE_LOCK_WAIT_MS / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(_LOCK_POLL_SECONDS)
+            cached = await redis_get(entry.key)
+            if cached is not None:
+                decoded = _decode(entry, cached)
+                if decoded is MISSING:
+                    break
+                value, size, etag = decoded
+                entry.remember(value, size, etag)
+                return value, etag
+        logger.debug(f"Cache lock wait timeout: {entry.key}")
+
+    try:
+        result = await entry.compute(compute)
+        return result, await _store(entry, result)
+    finally:
+        if token:
+            await redis_lock_release(f"lock:{entry.key}", token)
+
+
+async def _fill_coalesced(entry: _Entry, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, Optional[str]]:
+    """
+    Одновременные промахи по ключу в процессе ждут одну задачу заполнения.
+    Задача запускается в пустом контексте: она не привязана к запросу, который её начал
+    (соединение connection_scope, отмена при разрыве клиента).
+    """
+    cache_key = entry.key
+    task = _inflight.get(cache_key)
+    if task is None:
+        task = asyncio.get_running_loop().create_task(
+            _fill(entry, compute),
+            context=contextvars.Context(),
+        )
+        _inflight[cache_key] = task
+
+        def _done(finished: asyncio.Task) -> None:
+            if _inflight.get(cache_key) is finished:
+                del _inflight[cache_key]
+            # Ошибку получают ожидающие; если все отменены — не шумим "never retrieved"
+            if not finished.cancelled():
+                finished.exception()
+
+        task.add_done_callback(_done)
+    else:
+        logger.debug(f"Cache WAIT (in-flight): {cache_key}")
+    return await asyncio.shield(task)
+
+
+async def _revalidate(entry: _Entry, compute: Callable[[], Awaitable[Any]]) -> bool:
+    """
+    Пересчёт значения в фоне (устаревшее, прогрев); если ключ уже пересчитывает
+    другой процесс — пропуск. True — значение пересчитано и сохранено.
+    """
+    acquired, token = await redis_lock_acquire(f"lock:{entry.key}", Config.CACHE_LOCK_TTL_MS)
+    if not acquired:
+        return False
+    try:
+        await _store(entry, await entry.compute(compute))
+        logger.debug(f"Cache REVALIDATED: {entry.key}")
+        return True
+    except Exception as e:
+        logger.warning(f"Фоновый пересчёт кэша {entry.key} не удался: {e}")
+        return False
+    finally:
+        if token:
+            await redis_lock_release(f"lock:{entry.key}", token)
+
+
+def _start_revalidation(entry: _Entry, compute: Callable[[], Awaitable[Any]]) -> None:
+    """Запускает пересчёт ключа, если в процессе он ещё не идёт (пустой контекст, как в _fill_coalesced)."""
+    cache_key = entry.key
+    if cache_key in _revalidating or cache_key in _inflight:
+        return
+    task = asyncio.get_running_loop().create_task(
+        _revalidate(entry, compute),
+        context=contextvars.Context(),
+    )
+    _revalidating[cache_key] = task
+    task.add_done_callback(lambda _: _revalidating.pop(cache_key, None))
+
+
+def _read_after_write(cache_key: str, compute: Callable[[], Awaitable[Any]]) -> Callable[[], Awaitable[Any]]:
+    """
+    compute, который для недавно сброшенного записью ключа (метка PRIMARY_PREFIX,
+    см. _pin_primary) считает значение на основной БД: реплика может ещё не видеть запись,
+    а её ответ остался бы в кэше на весь TTL. Без реплики метка не читается.
+    """
+    async def run():
+        if Config.DB_READ_HOST and await redis_get(PRIMARY_PREFIX + cache_key) is not None:
+            with use_primary():
+                return await compute()
+        return await compute()
+
+    return run
+
+
+async def _pin_primary(keys: List[str]) -> None:
+    """Метки PRIMARY_PREFIX на сброшенные ключи на время допустимого отставания реплики."""
+    if Config.DB_READ_HOST and keys:
+        await redis_pin_primary(keys, int(Config.DB_READ_MAX_LAG_SECONDS * 1000))
+
+
+def _resolve_tags(templates: Sequence[str], bound_args: dict) -> list:
+    """Теги по шаблонам; неразрешённые пропускаются."""
+    resolved = (_resolve_key(t, bound_args) if "{" in t else t for t in templates)
+    return [t for t in resolved if t]
+
+
+def _is_fresh(fresh_until: Optional[bytes]) -> bool:
+    """Метка свежести: unix-время окончания свежести, 0 — помечено устаревшим."""
+    if fresh_until is None:
+        return False
+    try:
+        return float(fresh_until) > time.time()
+    except ValueError:
+        return False
+
+
+def cache(
+    key: str,
+    ttl: int = 300,
+    local: bool = False,
+    stale_ttl: int = 0,
+    tags: Sequence[str] = (),
+    result_tags: Optional[TagsFn] = None,
+):
     """
     Кэширует возвращаемое значение асинхронной функции в Redis.
 
     При попадании в кэш, возвращает десериализованные данные без вызова функции.
-    При промахе в кэш, вызывает функцию, сериализует результат, сохраняет его в Redis.
+    При промахе в кэш, вызывает функцию, сериализует результат (формат — codec: orjson,
+    сжатие больших значений), сохраняет его в Redis.
     Если Redis недоступен, функция вызывается нормально.
+
+    local=True — дополнительно L1-кэш процесса (local_cache): готовый объект без запроса
+    к Redis и десериализации. Возвращаемый объект общий — вызывающий код не должен его менять.
+
+    Промахи схлопываются: в процессе по ключу считается одно значение, между процессами —
+    под короткой блокировкой в Redis (остальные ждут заполнения, см. _fill).
+
+    stale_ttl > 0 — stale-while-revalidate: значение хранится ttl + stale_ttl секунд,
+    после ttl (или invalidate(..., stale=True)) оно ещё отдаётся сразу, а пересчёт
+    запускается в фоне — один на ключ среди всех процессов. Устаревшее значение в L1 не попадает.
+
+    Ключ, сброшенный invalidate / invalidate_cache / invalidate_tags не позже
+    DB_READ_MAX_LAG_SECONDS назад, заполняется с основной БД, а не с реплики (_read_after_write).
+
+    tags — шаблоны тегов по аргументам (как key), result_tags — функция тегов по результату.
+    Ключ добавляется в множества тегов при заполнении; invalidate_tags() сбрасывает все
+    ключи тега одним скриптом вместо SCAN по шаблону.
+
+    await func.refresh(*args, **kwargs) — пересчитать и сохранить значение (прогрев кэша),
+    без L1; False — Redis недоступен или ключ уже пересчитывает другой процесс.
+
+    await func.with_etag(*args, **kwargs) — (значение, штамп содержимого из codec) для ETag;
+    await func.etag(*args, **kwargs) — штамп свежего значения (L1 или заголовок записи
+    через GETRANGE, без чтения и разбора значения), None — значения нет или оно устарело.
     """
     def decorator(func):
         _original = func
         if hasattr(func, "__wrapped__"):
             _original = func.__wrapped__
 
-        @functools.wraps(_original)
-        async def wrapper(*args, **kwargs):
+        async def _get(args, kwargs) -> Tuple[Any, Optional[str]]:
             if not redis_available():
-                return await func(*args, **kwargs)
+                return await func(*args, **kwargs), None
 
             bound = _bind_args(_original, args, kwargs)
             cache_key = _resolve_key(key, bound)
             if not cache_key:
-                return await func(*args, **kwargs)
-
-            cached = await redis_get(cache_key)
-            if cached is not None:
+                return await func(*args, **kwargs), None
+
+            use_l1 = local and l1_enabled()
+            if use_l1:
+                hit = local_cache.get(cache_key)
+                if hit is not MISSING:
+                    logger.debug(f"Cache L1 HIT: {cache_key}")
+                    stats_for(key).l1_hits += 1
+                    return hit
+
+            if stale_ttl:
+                cached, fresh_until = await redis_mget(cache_key, FRESH_PREFIX + cache_key)
+                fresh = _is_fresh(fresh_until)
+            else:
+                cached, fresh = await redis_get(cache_key), True
+
+            entry = _Entry(cache_key, key, ttl, stale_ttl, use_l1, _resolve_tags(tags, bound), result_tags)
+            compute = _read_after_write(cache_key, lambda: func(*args, **kwargs))
+            decoded = _decode(entry, cached) if cached is not None else MISSING
+            if decoded is not MISSING:
+                value, size, etag = decoded
+                if not fresh:
+                    logger.debug(f"Cache STALE HIT: {cache_key}")
+                    stats_for(key).stale_hits += 1
+                    _start_revalidation(entry, compute)
+                    return value, etag
                 logger.debug(f"Cache HIT: {cache_key}")
-                return _deserialize(cached)
+                stats_for(key).hits += 1
+                entry.remember(value, size, etag)
+                return value, etag
 
-            result = await func(*args, **kwargs)
+            stats_for(key).misses += 1
+            return await _fill_coalesced(entry, compute)
 
-            if result is not None:
-                try:
-                    await redis_set(cache_key, _serialize(result), ttl)
-                    logger.debug(f"Cache SET: {cache_key} (ttl={ttl}s)")
-                except Exception as e:
-                    logger.debug(f"Cache SET failed for {cache_key}: {e}")
+        @functools.wraps(_original)
+        async def wrapper(*args, **kwargs):
+            value, _ = await _get(args, kwargs)
+            return value
 
-            return result
+        async def with_etag(*args, **kwargs) -> Tuple[Any, Optional[str]]:
+            return await _get(args, kwargs)
+
+        async def etag(*args, **kwargs) -> Optional[str]:
+            if not redis_available():
+                return None
+            cache_key = _resolve_key(key, _bind_args(_original, args, kwargs))
+            if not cache_key:
+                return None
+            if local and l1_enabled():
+                hit = local_cache.get(cache_key)
+                if hit is not MISSING:
+                    return hit[1]
+            if stale_ttl:
+                head, fresh_until = await redis_get_head(cache_key, HEADER_SIZE, FRESH_PREFIX + cache_key)
+                if not _is_fresh(fresh_until):
+                    return None
+            else:
+                head = (await redis_get_head(cache_key, HEADER_SIZE))[0]
+            return stamp_of(head)
+
+        async def refresh(*args, **kwargs) -> bool:
+            if not redis_available():
+                return False
+            bound = _bind_args(_original, args, kwargs)
+            cache_key = _resolve_key(key, bound)
+            if not cache_key:
+                return False
+            entry = _Entry(cache_key, key, ttl, stale_ttl, False, _resolve_tags(tags, bound), result_tags)
+            return await _revalidate(entry, _read_after_write(cache_key, lambda: func(*args, **kwargs)))
 
         wrapper.__wrapped__ = _original
+        wrapper.refresh = refresh
+        wrapper.with_etag = with_etag
+        wrapper.etag = etag
         return wrapper
     return decorator
 
 
-def invalidate(*key_templates: str):
+async def _invalidate_resolved(
+    keys: List[Tuple[str, str]],
+    patterns: List[Tuple[str, str]],
+    stale: bool,
+    source: str,
+    tags: Sequence[str] = (),
+) -> int:
+    """
+    Сбрасывает ключи и шаблоны ключей: keys — пары (шаблон, ключ), все ключи — одним
+    пайплайном; patterns — пары (шаблон, шаблон ключей с '*'), SCAN по ним идут параллельно;
+    tags — ключи тегов, одним скриптом и раньше остальных (ключи, собираемые из помеченных
+    тегами, не должны пересобраться из ещё не сброшенных).
+    Пишет метрики по шаблонам и рассылает инвалидацию L1. Сброшенные ключи (кроме шаблонов —
+    их ключи неизвестны) ставятся на чтение с основной БД (_pin_primary).
+    Возвращает число сброшенных ключей.
+    """
+    delete_pattern = redis_mark_stale_pattern if stale else redis_delete_pattern
+
+    total = 0
+    tagged = await redis_invalidate_tags(tags, stale=stale) if tags else []
+    for key in tagged:
+        record_invalidation(key, source)
+    total += len(tagged)
+    if keys:
+        resolved = [k for _, k in keys]
+        counts = await (redis_mark_stale(*resolved) if stale else redis_unlink_many(resolved))
+        for (tmpl, key), deleted in zip(keys, counts):
+            record_invalidation(tmpl, source, deleted)
+            total += deleted
+            logger.debug(f"Cache INVALIDATE: {key}")
+    if patterns:
+        counts = await asyncio.gather(*(delete_pattern(pattern) for _, pattern in patterns))
+        for (tmpl, pattern), deleted in zip(patterns, counts):
+            record_invalidation(tmpl, source, deleted)
+            total += deleted
+            if deleted:
+                logger.debug(f"Cache INVALIDATE pattern: {pattern} ({deleted} keys)")
+
+    await _pin_primary(tagged + [k for _, k in keys])
+    await publish_invalidation(
+        tagged + [k for _, k in keys],
+        [pattern.split("*")[0] for _, pattern in patterns],
+    )
+    return total
+
+
+def invalidate(
+    *key_templates: str,
+    stale: bool = False,
+    tags: Sequence[str] = (),
+    tags_from: Optional[Callable[[dict], Iterable[str]]] = None,
+):
     """
     Инвалидирует кэш ключи после успешной выполнения асинхронной функции.
 
@@ -142,6 +529,12 @@ def invalidate(*key_templates: str):
         @invalidate("dashboard:{user.id}")          — один ключ
         @invalidate("dashboard:{user.id}", "analytics:{user.id}")  — несколько ключей
         @invalidate("dashboard:*")                   — wildcard шаблон
+
+    stale=True — ключи со stale_ttl помечаются устаревшими (отдаются до фонового пересчёта),
+    остальные удаляются. Все ключи сбрасываются одним запросом к Redis.
+    tags — шаблоны тегов по аргументам (как ключи), tags_from — функция тегов по словарю
+    аргументов (когда их число зависит от запроса); ключи тегов сбрасываются первыми.
+    В метриках источник инвалидации — имя функции.
     """
     def decorator(func):
         _original = func
@@ -156,24 +549,26 @@ def invalidate(*key_templates: str):
                 return result
 
             bound = _bind_args(_original, args, kwargs)
+            keys, patterns = [], []
 
             for tmpl in key_templates:
-                try:
-                    if "*" in tmpl:
-                        static_part = tmpl.split("*")[0]
-                        resolved_prefix = _resolve_key(static_part, bound) if "{" in static_part else static_part
-                        if resolved_prefix:
-                            deleted = await redis_delete_pattern(f"{resolved_prefix}*")
-                            if deleted:
-                                logger.debug(f"Cache INVALIDATE pattern: {resolved_prefix}* ({deleted} keys)")
-                    else:
-                        resolved = _resolve_key(tmpl, bound)
-                        if resolved:
-                            await redis_delete(resolved)
-                            logger.debug(f"Cache INVALIDATE: {resolved}")
-                except Exception as e:
-                    logger.debug(f"Cache invalidation error for {tmpl}: {e}")
-
+                if "*" in tmpl:
+                    static_part = tmpl.split("*")[0]
+                    resolved_prefix = _resolve_key(static_part, bound) if "{" in static_part else static_part
+                    if resolved_prefix:
+                        patterns.append((tmpl, f"{resolved_prefix}*"))
+                else:
+                    resolved = _resolve_key(tmpl, bound)
+                    if resolved:
+                        keys.append((tmpl, resolved))
+
+            try:
+                resolved_tags = _resolve_tags(tags, bound)
+                if tags_from is not None:
+                    resolved_tags += list(tags_from(bound))
+                await _invalidate_resolved(keys, patterns, stale, _original.__name__, resolved_tags)
+            except Exception as e:
+                logger.debug(f"Cache invalidation error for {key_templates}: {e}")
             return result
 
         wrapper.__wrapped__ = _original
@@ -181,7 +576,13 @@ def invalidate(*key_templates: str):
     return decorator
 
 
-async def invalidate_cache(*key_templates: str, **params: Any) -> int:
+async def invalidate_cache(
+    *key_templates: str,
+    stale: bool = False,
+    source: str = "invalidate_cache",
+    tags: Sequence[str] = (),
+    **params: Any,
+) -> int:
     """
     Явная функция инвалидации кэша.
 
@@ -189,26 +590,50 @@ async def invalidate_cache(*key_templates: str, **params: Any) -> int:
         await invalidate_cache("dashboard:123")
         await invalidate_cache("dashboard:*")
         await invalidate_cache("dashboard:{user_id}", user_id=123)
+        await invalidate_cache("dashboard:*", stale=True)  # см. invalidate(stale=True)
+        await invalidate_cache("dashboard:{user_id}", tags=("user:{user_id}",), user_id=123)
+
+    tags — шаблоны тегов (как ключи), их ключи сбрасываются первыми.
+    source — источник инвалидации в метриках кэша.
     """
     if not redis_available():
         return 0
 
-    total = 0
+    keys, patterns = [], []
     for tmpl in key_templates:
         resolved = tmpl
         if "{" in tmpl and params:
             resolved = _resolve_key(tmpl, params)
         if not resolved:
             continue
+        (patterns if "*" in resolved else keys).append((tmpl, resolved))
 
-        try:
-            if "*" in resolved:
-                total += await redis_delete_pattern(resolved)
-            else:
-                total += await redis_delete(resolved)
-        except Exception as e:
-            logger.debug(f"invalidate_cache error for {resolved}: {e}")
+    resolved_tags = _resolve_tags(tags, params) if params else [t for t in tags if "{" not in t]
+    try:
+        total = await _invalidate_resolved(keys, patterns, stale, source, resolved_tags)
+    except Exception as e:
+        logger.debug(f"invalidate_cache error for {key_templates}: {e}")
+        return 0
 
     if total:
         logger.debug(f"invalidate_cache: cleared {total} keys")
     return total
+
+
+async def invalidate_tags(*tags: str, stale: bool = False, source: str = "invalidate_tags") -> List[str]:
+    """
+    Инвалидирует все ключи с тегами (см. cache(tags=..., result_tags=...)) одним вызовом Redis.
+
+    stale=True — ключи со stale_ttl помечаются устаревшими, остальные удаляются.
+    source — источник инвалидации в метриках кэша. Возвращает затронутые ключи.
+    """
+    if not redis_available() or not tags:
+        return []
+    keys = await redis_invalidate_tags(tags, stale=stale)
+    for key in keys:
+        record_invalidation(key, source)
+    await _pin_primary(keys)
+    await publish_invalidation(keys)
+    if keys:
+        logger.debug(f"invalidate_tags: {len(keys)} keys ({len(tags)} tags, stale={stale})")
+    return keys
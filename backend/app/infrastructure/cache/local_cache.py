@@ -0,0 +1,183 @@
+"""
+L1-кэш процесса перед Redis (L2) для декоратора @cache(..., local=True).
+
+Хранит уже десериализованные объекты: попадание не требует ни сетевого запроса,
+ни orjson.loads. Ограничен числом записей и суммарным размером (по длине JSON
+в Redis), записи живут не дольше Config.CACHE_L1_MAX_TTL секунд.
+
+Согласованность между воркерами uvicorn и контейнерами: invalidate()/invalidate_cache()
+публикуют ключи и префиксы в канал Redis, каждый процесс удаляет их из своего L1.
+Пока подписка на канал не активна, L1 не заполняется; при её обрыве L1 очищается.
+
+Объекты из L1 общие для всех запросов процесса — изменять их нельзя.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Tuple
+
+import orjson
+
+from app.config import Config
+from app.core.logging import get_logger
+from app.infrastructure.cache.redis_client import (
+    INVALIDATION_CHANNEL,
+    redis_publish,
+    redis_pubsub,
+)
+
+logger = get_logger(__name__)
+
+# Маркер промаха L1
+MISSING = object()
+
+
+class LocalCache:
+    """LRU с TTL и ограничением по числу записей и байтам."""
+
+    def __init__(self, max_items: int, max_bytes: int):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._data: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self.delete(key)
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float, size: int) -> None:
+        if ttl <= 0 or size > self.max_bytes:
+            self.delete(key)
+            return
+        self.delete(key)
+        self._data[key] = (time.monotonic() + ttl, size, value)
+        self.total_bytes += size
+        while self._data and (len(self._data) > self.max_items or self.total_bytes > self.max_bytes):
+            _, (_, evicted_size, _) = self._data.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def delete(self, key: str) -> bool:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return False
+        self.total_bytes -= entry[1]
+        return True
+
+    def delete_prefix(self, prefix: str) -> int:
+        keys = [k for k in self._data if k.startswith(prefix)]
+        for k in keys:
+            self.delete(k)
+        return len(keys)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.total_bytes = 0
+
+
+local_cache = LocalCache(Config.CACHE_L1_MAX_ITEMS, Config.CACHE_L1_MAX_BYTES)
+
+_listener_task: Optional[asyncio.Task] = None
+_subscribed = False
+
+
+def l1_enabled() -> bool:
+    return Config.CACHE_L1_MAX_ITEMS > 0 and Config.CACHE_L1_MAX_BYTES > 0
+
+
+def l1_ready() -> bool:
+    """L1 можно заполнять: подписка на инвалидации активна (запускает её при первом вызове)."""
+    if not l1_enabled():
+        return False
+    _ensure_listener()
+    return _subscribed
+
+
+def l1_ttl(ttl: int) -> float:
+    return min(ttl, Config.CACHE_L1_MAX_TTL)
+
+
+def apply_invalidation(keys: Iterable[str] = (), prefixes: Iterable[str] = ()) -> None:
+    """Удаляет ключи и префиксы (без '*') из L1 текущего процесса."""
+    for key in keys:
+        local_cache.delete(key)
+    for prefix in prefixes:
+        local_cache.delete_prefix(prefix)
+
+
+async def publish_invalidation(keys: Iterable[str] = (), prefixes: Iterable[str] = ()) -> None:
+    """Удаляет ключи из своего L1 и рассылает инвалидацию остальным процессам."""
+    keys, prefixes = list(keys), list(prefixes)
+    if not keys and not prefixes:
+        return
+    apply_invalidation(keys, prefixes)
+    await redis_publish(
+        INVALIDATION_CHANNEL,
+        orjson.dumps({"keys": keys, "prefixes": prefixes}).decode("utf-8"),
+    )
+
+
+def _ensure_listener() -> None:
+    global _listener_task
+    if _listener_task is not None and not _listener_task.done():
+        return
+    try:
+        _listener_task = asyncio.get_running_loop().create_task(_listen())
+    except RuntimeError:
+        _listener_task = None
+
+
+async def _listen() -> None:
+    """Подписка на канал инвалидаций с переподключением."""
+    global _subscribed
+    while True:
+        pubsub = redis_pubsub()
+        if pubsub is None:
+            return
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            _subscribed = True
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None or message.get("type") != "message":
+                    continue
+                try:
+                    payload = orjson.loads(message["data"])
+                except orjson.JSONDecodeError:
+                    continue
+                apply_invalidation(payload.get("keys", ()), payload.get("prefixes", ()))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Подписка на инвалидации кэша прервана ({e}), L1 очищен")
+        finally:
+            # Пропущенные сообщения не восстановить — сбрасываем L1 целиком
+            _subscribed = False
+            local_cache.clear()
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        await asyncio.sleep(1)
+
+
+async def stop_listener() -> None:
+    """Останавливает подписку (при закрытии Redis)."""
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _listener_task = None
+    local_cache.clear()
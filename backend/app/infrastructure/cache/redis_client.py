@@ -1,12 +1,25 @@
 """
 Асинхронный Redis-клиент (redis.asyncio) — декораторы кэша, async-код.
 
-Синхронный доступ — модуль redis_client_sync (отдельное TCP-подключение).
+Ответы не декодируются: значения кэша — байты (формат — модуль codec).
+
+Операции над многими ключами (redis_mget, redis_mset_with_ttl, redis_unlink_many,
+redis_mark_stale, удаление по шаблону) уходят пачками по _BATCH_SIZE ключей
+в одном пайплайне — один сетевой обмен вместо запроса на ключ.
+
+Только одиночный Redis (в т.ч. с репликами / Sentinel), не Redis Cluster: скрипты Lua
+(_SET_ENTRY_SCRIPT, _MARK_STALE_SCRIPT, _INVALIDATE_TAGS_SCRIPT) работают с ключом значения,
+его меткой свежести и множествами тегов за один вызов. Общий hash tag им не назначить:
+тег (например, asset:<id>) собирает ключи разных пользователей, а скрипты тегов ещё и
+обращаются к меткам свежести и сброса, не переданным в KEYS.
 """
+import uuid
+
 import redis.asyncio as aioredis
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
 from app.core.logging import get_logger
+from app.infrastructure.cache.cache_metrics import record_redis_error
 
 logger = get_logger(__name__)
 
@@ -14,6 +27,31 @@ _redis: Optional[aioredis.Redis] = None
 
 CACHE_PREFIX = "cv:"
 
+# Канал рассылки инвалидаций L1-кэша процессов (см. local_cache)
+INVALIDATION_CHANNEL = f"{CACHE_PREFIX}invalidate"
+
+# Метка свежести значения для stale-while-revalidate: fresh:<ключ> = unix-время,
+# до которого значение свежее (0 — помечено устаревшим); живёт столько же, сколько значение
+FRESH_PREFIX = "fresh:"
+
+# Теги: tag:<тег> — множество полных ключей, записанных с этим тегом
+TAG_PREFIX = "tag:"
+
+# Метка сброса тега: inv:<тег> = время последней инвалидации тега (мс, часы Redis).
+# Значение, посчитанное до сброса, не записывается (redis_set_entry(not_invalidated_since=...));
+# метка живёт дольше любого заполнения
+INVALIDATED_PREFIX = "inv:"
+_INVALIDATED_TTL = 600
+
+# Метка записи: primary:<ключ> живёт DB_READ_MAX_LAG_SECONDS после сброса ключа записью —
+# пока она есть, значение заполняется с основной БД (реплика может ещё не видеть запись)
+PRIMARY_PREFIX = "primary:"
+
+# Ключей в одной команде пакетной операции (MGET, UNLINK, скрипт); команды пачек
+# отправляются одним пайплайном. Удаление по шаблону сбрасывает накопленное каждые _FLUSH_KEYS
+_BATCH_SIZE = 500
+_FLUSH_KEYS = 5000
+
 
 async def init_redis(url: str) -> bool:
     global _redis
@@ -23,7 +61,7 @@ async def init_redis(url: str) -> bool:
     try:
         _redis = aioredis.from_url(
             url,
-            decode_responses=True,
+            decode_responses=False,
             socket_connect_timeout=3,
             socket_timeout=2,
             retry_on_timeout=True,
@@ -39,6 +77,9 @@ async def init_redis(url: str) -> bool:
 
 async def close_redis() -> None:
     global _redis
+    from app.infrastructure.cache.local_cache import stop_listener
+
+    await stop_listener()
     if _redis:
         try:
             await _redis.aclose()
@@ -56,17 +97,46 @@ def _key(name: str) -> str:
     return f"{CACHE_PREFIX}{name}"
 
 
-async def redis_get(key: str) -> Optional[str]:
+async def _scan_pages(full_pattern: str, page: int = 200):
+    """SCAN по шаблону страницами (списки полных ключей, байты)."""
+    batch: List[bytes] = []
+    async for key in _redis.scan_iter(match=full_pattern, count=page):
+        batch.append(key)
+        if len(batch) >= page:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _chunks(items: Sequence, size: int = _BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def _unlink_full_keys(full_keys: Sequence[Union[str, bytes]]) -> int:
+    """UNLINK полных ключей пачками в одном пайплайне; число удалённых."""
+    if not full_keys:
+        return 0
+    async with _redis.pipeline(transaction=False) as pipe:
+        for chunk in _chunks(full_keys):
+            pipe.unlink(*chunk)
+        return sum(await pipe.execute())
+
+
+async def redis_get(key: str) -> Optional[bytes]:
     if not _redis:
         return None
     try:
         return await _redis.get(_key(key))
     except Exception as e:
         logger.debug(f"Redis GET error for {key}: {e}")
+        record_redis_error("get")
         return None
 
 
-async def redis_set(key: str, value: str, ttl: int = 300) -> bool:
+async def redis_set(key: str, value: Union[str, bytes], ttl: Optional[int] = 300) -> bool:
+    """ttl=None — без срока жизни."""
     if not _redis:
         return False
     try:
@@ -74,6 +144,7 @@ async def redis_set(key: str, value: str, ttl: int = 300) -> bool:
         return True
     except Exception as e:
         logger.debug(f"Redis SET error for {key}: {e}")
+        record_redis_error("set")
         return False
 
 
@@ -85,20 +156,454 @@ async def redis_delete(*keys: str) -> int:
         return await _redis.delete(*full_keys)
     except Exception as e:
         logger.debug(f"Redis DELETE error: {e}")
+        record_redis_error("delete")
         return 0
 
 
+async def redis_unlink_many(keys: Sequence[str]) -> List[int]:
+    """
+    UNLINK ключей одним пайплайном (память освобождается в фоне Redis);
+    для каждого ключа — 1, если он был удалён. При ошибке — нули.
+    """
+    if not _redis or not keys:
+        return [0] * len(keys)
+    try:
+        async with _redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.unlink(_key(key))
+            return await pipe.execute()
+    except Exception as e:
+        logger.debug(f"Redis UNLINK error: {e}")
+        record_redis_error("unlink")
+        return [0] * len(keys)
+
+
 async def redis_delete_pattern(pattern: str) -> int:
     """Delete all keys matching a pattern (e.g. 'dashboard:*')."""
     if not _redis:
         return 0
     try:
-        full_pattern = _key(pattern)
         count = 0
-        async for key in _redis.scan_iter(match=full_pattern, count=200):
-            await _redis.delete(key)
-            count += 1
-        return count
+        pending: List[bytes] = []
+        async for batch in _scan_pages(_key(pattern), _BATCH_SIZE):
+            pending.extend(batch)
+            if len(pending) >= _FLUSH_KEYS:
+                count += await _unlink_full_keys(pending)
+                pending = []
+        return count + await _unlink_full_keys(pending)
     except Exception as e:
         logger.debug(f"Redis DELETE pattern error for {pattern}: {e}")
+        record_redis_error("delete_pattern")
+        return 0
+
+
+async def redis_pin_primary(keys: Sequence[str], ttl_ms: int) -> None:
+    """Ставит метки PRIMARY_PREFIX на ключи одним пайплайном (SET PX)."""
+    if not _redis or not keys:
+        return
+    try:
+        async with _redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(_key(PRIMARY_PREFIX + key), b"1", px=ttl_ms)
+            await pipe.execute()
+    except Exception as e:
+        logger.debug(f"Redis pin primary error: {e}")
+        record_redis_error("pin_primary")
+
+
+async def redis_publish(channel: str, message: str) -> int:
+    """Публикует сообщение в канал; возвращает число получателей."""
+    if not _redis:
+        return 0
+    try:
+        return await _redis.publish(channel, message)
+    except Exception as e:
+        logger.debug(f"Redis PUBLISH error for {channel}: {e}")
+        record_redis_error("publish")
+        return 0
+
+
+def redis_pubsub():
+    """Новый PubSub на общем пуле соединений или None, если Redis не подключён."""
+    if not _redis:
+        return None
+    return _redis.pubsub()
+
+
+# Снятие блокировки только её владельцем (токен совпадает)
+_UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+async def redis_lock_acquire(name: str, ttl_ms: int) -> Tuple[bool, Optional[str]]:
+    """
+    Короткая блокировка SET NX PX. Возвращает (получена, токен).
+    Если Redis недоступен — (True, None): вызывающий код продолжает без блокировки.
+    """
+    if not _redis:
+        return True, None
+    token = uuid.uuid4().hex
+    try:
+        if await _redis.set(_key(name), token, nx=True, px=ttl_ms):
+            return True, token
+        return False, None
+    except Exception as e:
+        logger.debug(f"Redis lock error for {name}: {e}")
+        record_redis_error("lock")
+        return True, None
+
+
+async def redis_lock_release(name: str, token: str) -> None:
+    if not _redis:
+        return
+    try:
+        await _redis.eval(_UNLOCK_SCRIPT, 1, _key(name), token)
+    except Exception as e:
+        logger.debug(f"Redis unlock error for {name}: {e}")
+        record_redis_error("unlock")
+
+
+async def redis_mget(*keys: str) -> List[Optional[bytes]]:
+    """Несколько ключей за один запрос (MGET пачками в пайплайне); при ошибке — список None."""
+    if not _redis or not keys:
+        return [None] * len(keys)
+    try:
+        full_keys = [_key(k) for k in keys]
+        if len(full_keys) <= _BATCH_SIZE:
+            return await _redis.mget(full_keys)
+        async with _redis.pipeline(transaction=False) as pipe:
+            for chunk in _chunks(full_keys):
+                pipe.mget(chunk)
+            return [value for reply in await pipe.execute() for value in reply]
+    except Exception as e:
+        logger.debug(f"Redis MGET error: {e}")
+        record_redis_error("mget")
+        return [None] * len(keys)
+
+
+async def redis_mset_with_ttl(mapping: Dict[str, Union[str, bytes]], ttl: Optional[int] = 300) -> bool:
+    """
+    Несколько значений с одним TTL (None — без срока) за один запрос, атомарно (MULTI/EXEC):
+    читатели видят либо все новые значения, либо ни одного.
+    """
+    if not _redis or not mapping:
+        return False
+    try:
+        async with _redis.pipeline(transaction=True) as pipe:
+            for key, value in mapping.items():
+                pipe.set(_key(key), value, ex=ttl)
+            await pipe.execute()
+        return True
+    except Exception as e:
+        logger.debug(f"Redis MSET error: {e}")
+        record_redis_error("mset")
+        return False
+
+
+async def redis_get_head(key: str, size: int, *keys: str) -> List[Optional[bytes]]:
+    """
+    Первые size байт значения key (GETRANGE) и значения keys — за один запрос.
+    Нет ключа или ошибка — None на его месте.
+    """
+    if not _redis:
+        return [None] * (1 + len(keys))
+    try:
+        async with _redis.pipeline(transaction=False) as pipe:
+            pipe.getrange(_key(key), 0, size - 1)
+            for k in keys:
+                pipe.get(_key(k))
+            head, *values = await pipe.execute()
+        return [head or None, *values]
+    except Exception as e:
+        logger.debug(f"Redis GETRANGE error for {key}: {e}")
+        record_redis_error("getrange")
+        return [None] * (1 + len(keys))
+
+
+# KEYS[1] — значение, KEYS[2] — метка свежести, KEYS[3..] — множества тегов;
+# ARGV: значение, TTL, fresh_until ('' — без метки), not_invalidated_since (мс, '' — без проверки),
+# префиксы ключей тегов и меток сброса. Тег сброшен не раньше since — ничего не пишется, 0.
+# TTL тега не уменьшается
+_SET_ENTRY_SCRIPT = """
+local ex = tonumber(ARGV[2])
+if ARGV[4] ~= '' then
+    local since = tonumber(ARGV[4])
+    local plen = #ARGV[5]
+    for i = 3, #KEYS do
+        local invalidated = redis.call('get', ARGV[6] .. string.sub(KEYS[i], plen + 1))
+        if invalidated and tonumber(invalidated) >= since then
+            return 0
+        end
+    end
+end
+redis.call('set', KEYS[1], ARGV[1], 'EX', ex)
+if ARGV[3] ~= '' then
+    redis.call('set', KEYS[2], ARGV[3], 'EX', ex)
+end
+for i = 3, #KEYS do
+    redis.call('sadd', KEYS[i], KEYS[1])
+    if redis.call('ttl', KEYS[i]) < ex then
+        redis.call('expire', KEYS[i], ex)
+    end
+end
+return 1
+"""
+
+
+async def redis_set_entry(
+    key: str,
+    value: Union[str, bytes],
+    ex: int,
+    fresh_until: Optional[float] = None,
+    tags: Iterable[str] = (),
+    not_invalidated_since: Optional[int] = None,
+) -> bool:
+    """
+    Атомарно записывает значение, метку свежести (FRESH_PREFIX, если задан fresh_until)
+    и добавляет ключ в множества тегов (TAG_PREFIX).
+
+    not_invalidated_since — время начала вычисления значения (мс, redis_time_ms): если
+    какой-то из тегов сброшен с тех пор, значение могло устареть и не записывается.
+    False — не записано (в т.ч. ошибка Redis).
+    """
+    if not _redis:
+        return False
+    try:
+        script_keys = [_key(key), _key(FRESH_PREFIX + key)] + [_key(TAG_PREFIX + t) for t in tags]
+        fresh = "" if fresh_until is None else str(fresh_until)
+        since = "" if not_invalidated_since is None else str(not_invalidated_since)
+        return bool(await _redis.eval(
+            _SET_ENTRY_SCRIPT,
+            len(script_keys),
+            *script_keys,
+            value,
+            ex,
+            fresh,
+            since,
+            _key(TAG_PREFIX),
+            _key(INVALIDATED_PREFIX),
+        ))
+    except Exception as e:
+        logger.debug(f"Redis SET entry error for {key}: {e}")
+        record_redis_error("set_entry")
+        return False
+
+
+# Для пар (значение, метка): есть метка — сбросить в 0 (устарело, значение остаётся
+# для stale-while-revalidate), нет метки — обычный ключ, удалить значение.
+# Возвращает по элементу на пару: 1 — помечен или удалён, 0 — ключа не было
+_MARK_STALE_SCRIPT = """
+local result = {}
+for i = 1, #KEYS, 2 do
+    if redis.call('exists', KEYS[i + 1]) == 1 then
+        redis.call('set', KEYS[i + 1], '0', 'KEEPTTL')
+        result[#result + 1] = 1
+    else
+        result[#result + 1] = redis.call('del', KEYS[i])
+    end
+end
+return result
+"""
+
+
+async def _mark_stale_full_keys(full_keys: Sequence[Union[str, bytes]]) -> List[int]:
+    """_MARK_STALE_SCRIPT пачками в одном пайплайне; результат — по ключу."""
+    if not full_keys:
+        return []
+    # Ключи из SCAN приходят байтами
+    full_keys = [k.decode() if isinstance(k, bytes) else k for k in full_keys]
+    fresh_prefix = _key(FRESH_PREFIX)
+    async with _redis.pipeline(transaction=False) as pipe:
+        for chunk in _chunks(full_keys):
+            script_keys = []
+            for full_key in chunk:
+                script_keys.append(full_key)
+                script_keys.append(fresh_prefix + full_key[len(CACHE_PREFIX):])
+            pipe.eval(_MARK_STALE_SCRIPT, len(script_keys), *script_keys)
+        return [n for reply in await pipe.execute() for n in reply]
+
+
+async def redis_mark_stale(*keys: str) -> List[int]:
+    """
+    Помечает ключи устаревшими (stale-while-revalidate) или удаляет, если метки нет.
+    Для каждого ключа — 1, если он был помечен или удалён. При ошибке — нули.
+    """
+    if not _redis or not keys:
+        return [0] * len(keys)
+    try:
+        return await _mark_stale_full_keys([_key(k) for k in keys])
+    except Exception as e:
+        logger.debug(f"Redis mark stale error: {e}")
+        record_redis_error("mark_stale")
+        return [0] * len(keys)
+
+
+async def redis_mark_stale_pattern(pattern: str) -> int:
+    """redis_mark_stale для всех ключей по шаблону (e.g. 'dashboard:*')."""
+    if not _redis:
+        return 0
+    try:
+        fresh_prefix = _key(FRESH_PREFIX).encode()
+        count = 0
+        pending: List[bytes] = []
+        async for batch in _scan_pages(_key(pattern), _BATCH_SIZE):
+            pending.extend(key for key in batch if not key.startswith(fresh_prefix))
+            if len(pending) >= _FLUSH_KEYS:
+                count += sum(await _mark_stale_full_keys(pending))
+                pending = []
+        return count + sum(await _mark_stale_full_keys(pending))
+    except Exception as e:
+        logger.debug(f"Redis mark stale pattern error for {pattern}: {e}")
+        record_redis_error("mark_stale_pattern")
+        return 0
+
+
+# KEYS — множества тегов; ARGV[1] = '1' — пометить устаревшими (см. _MARK_STALE_SCRIPT),
+# иначе UNLINK ключей (с метками свежести) и самих тегов. ARGV[2] — префикс ключа метки свежести,
+# ARGV[3] — CACHE_PREFIX, ARGV[4..6] — префиксы тегов и меток сброса, TTL метки сброса.
+# Каждому тегу ставится метка сброса (время Redis, мс). Возвращает затронутые ключи (полные имена)
+_INVALIDATE_TAGS_SCRIPT = """
+local stale = ARGV[1] == '1'
+local fresh_prefix = ARGV[2]
+local plen = #ARGV[3]
+local now = redis.call('time')
+local now_ms = string.format('%d', now[1] * 1000 + math.floor(now[2] / 1000))
+local seen, members = {}, {}
+for _, tag in ipairs(KEYS) do
+    redis.call('set', ARGV[5] .. string.sub(tag, #ARGV[4] + 1), now_ms, 'EX', ARGV[6])
+    for _, member in ipairs(redis.call('smembers', tag)) do
+        if not seen[member] then
+            seen[member] = true
+            members[#members + 1] = member
+        end
+    end
+end
+if stale then
+    for _, member in ipairs(members) do
+        local fresh = fresh_prefix .. string.sub(member, plen + 1)
+        if redis.call('exists', fresh) == 1 then
+            redis.call('set', fresh, '0', 'KEEPTTL')
+        else
+            redis.call('unlink', member)
+        end
+    end
+else
+    for _, member in ipairs(members) do
+        redis.call('unlink', member, fresh_prefix .. string.sub(member, plen + 1))
+    end
+    redis.call('unlink', unpack(KEYS))
+end
+return members
+"""
+
+
+async def redis_invalidate_tags(tags: Iterable[str], stale: bool = False) -> List[str]:
+    """
+    Инвалидирует все ключи с тегами одним скриптом; возвращает ключи (без CACHE_PREFIX).
+    stale=True — ключи со stale-while-revalidate помечаются устаревшими, теги сохраняются.
+    """
+    tag_keys = [_key(TAG_PREFIX + t) for t in tags]
+    if not _redis or not tag_keys:
+        return []
+    try:
+        members = await _redis.eval(
+            _INVALIDATE_TAGS_SCRIPT,
+            len(tag_keys),
+            *tag_keys,
+            "1" if stale else "0",
+            _key(FRESH_PREFIX),
+            CACHE_PREFIX,
+            _key(TAG_PREFIX),
+            _key(INVALIDATED_PREFIX),
+            _INVALIDATED_TTL,
+        )
+        return [m.decode()[len(CACHE_PREFIX):] for m in members]
+    except Exception as e:
+        logger.debug(f"Redis invalidate tags error: {e}")
+        record_redis_error("invalidate_tags")
+        return []
+
+
+async def redis_time_ms() -> Optional[int]:
+    """Время Redis (мс) — те же часы, что у меток сброса тегов; None — Redis недоступен."""
+    if not _redis:
+        return None
+    try:
+        seconds, microseconds = await _redis.time()
+        return seconds * 1000 + microseconds // 1000
+    except Exception as e:
+        logger.debug(f"Redis TIME error: {e}")
+        record_redis_error("time")
+        return None
+
+
+async def redis_tag_members(tag: str) -> List[str]:
+    """Ключи (без CACHE_PREFIX), добавленные в тег; часть из них могла уже истечь или быть сброшена."""
+    if not _redis:
+        return []
+    try:
+        members = await _redis.smembers(_key(TAG_PREFIX + tag))
+        return [m.decode()[len(CACHE_PREFIX):] for m in members]
+    except Exception as e:
+        logger.debug(f"Redis SMEMBERS error for tag {tag}: {e}")
+        record_redis_error("tag_members")
+        return []
+
+
+async def redis_scan_memory(pattern: str = "*", page: int = 200):
+    """
+    Обходит ключи кэша по шаблону, отдаёт (ключ без CACHE_PREFIX, байт в памяти Redis, TTL).
+    MEMORY USAGE и TTL запрашиваются пайплайном на страницу SCAN.
+    """
+    if not _redis:
+        return
+    async for keys in _scan_pages(_key(pattern), page):
+        async with _redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.memory_usage(key)
+                pipe.ttl(key)
+            replies = await pipe.execute()
+        for i, key in enumerate(keys):
+            yield key.decode()[len(CACHE_PREFIX):], replies[2 * i] or 0, replies[2 * i + 1]
+
+
+async def redis_zadd(key: str, mapping: Dict[str, float]) -> int:
+    if not _redis or not mapping:
+        return 0
+    try:
+        return await _redis.zadd(_key(key), mapping)
+    except Exception as e:
+        logger.debug(f"Redis ZADD error for {key}: {e}")
+        record_redis_error("zadd")
+        return 0
+
+
+async def redis_zrevrangebyscore(key: str, min_score: float, limit: Optional[int] = None) -> List[str]:
+    """Члены с score >= min_score, от большего score к меньшему."""
+    if not _redis:
+        return []
+    try:
+        members = await _redis.zrevrangebyscore(
+            _key(key), "+inf", min_score, start=0 if limit else None, num=limit
+        )
+        return [m.decode() for m in members]
+    except Exception as e:
+        logger.debug(f"Redis ZREVRANGEBYSCORE error for {key}: {e}")
+        record_redis_error("zrevrangebyscore")
+        return []
+
+
+async def redis_zremrangebyscore(key: str, max_score: float) -> int:
+    """Удаляет члены с score < max_score."""
+    if not _redis:
+        return 0
+    try:
+        return await _redis.zremrangebyscore(_key(key), "-inf", f"({max_score}")
+    except Exception as e:
+        logger.debug(f"Redis ZREMRANGEBYSCORE error for {key}: {e}")
+        record_redis_error("zremrangebyscore")
         return 0
@@ -5,13 +5,19 @@
 from app.infrastructure.database.postgres_async import (
     rpc_async,
     table_select_async,
+    table_stream_async,
     table_insert_async,
     table_update_async,
     table_upsert_async,
+    table_upsert_many_async,
     table_delete_async,
     table_select_with_neq_async,
     get_connection_pool,
+    get_read_pool,
+    use_primary,
+    connection_scope,
     close_connection_pool,
+    validate_rpc_registry,
     db_select,
     db_insert,
     db_update,
@@ -21,13 +27,19 @@ from app.infrastructure.database.postgres_async import (
 __all__ = [
     'rpc_async',
     'table_select_async',
+    'table_stream_async',
     'table_insert_async',
     'table_update_async',
     'table_upsert_async',
+    'table_upsert_many_async',
     'table_delete_async',
     'table_select_with_neq_async',
     'get_connection_pool',
+    'get_read_pool',
+    'use_primary',
+    'connection_scope',
     'close_connection_pool',
+    'validate_rpc_registry',
     'db_select',
     'db_insert',
     'db_update',
@@ -0,0 +1,165 @@
+"""
+Захват планов медленных RPC-вызовов (EXPLAIN ANALYZE, BUFFERS) в кольцевой буфер процесса.
+
+Для выборки вызовов из Config.DB_EXPLAIN_RPCS (доля Config.DB_EXPLAIN_SAMPLE_RATE)
+в транзакции вызова включается auto_explain (SET LOCAL, вложенные запросы plpgsql
+тоже логируются), а сообщения LOG приходят клиенту через client_min_messages.
+Если auto_explain не загружается (нет расширения или прав), для read-only RPC
+при Config.DB_EXPLAIN_RERUN вызов повторяется под EXPLAIN в той же read-only транзакции.
+Вызовы дольше Config.DB_EXPLAIN_MIN_MS попадают в буфер: план, параметры, время.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Deque, List, Optional
+
+import asyncpg
+import orjson
+
+from app.config import Config
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Максимальная длина сериализованного параметра в записи буфера
+_MAX_PARAM_CHARS = 2000
+
+_captured: Deque[dict] = deque(maxlen=Config.DB_EXPLAIN_BUFFER_SIZE)
+
+# None — ещё не проверяли; False — LOAD 'auto_explain' недоступен
+_auto_explain_available: Optional[bool] = None
+
+
+def should_capture(fn_name: str) -> bool:
+    """Попадает ли вызов в выборку для захвата плана."""
+    rate = Config.DB_EXPLAIN_SAMPLE_RATE
+    if rate <= 0 or fn_name not in Config.DB_EXPLAIN_RPCS:
+        return False
+    return rate >= 1 or random.random() < rate
+
+
+async def _arm_auto_explain(conn: asyncpg.Connection) -> bool:
+    """Включает auto_explain до конца текущей транзакции. False — недоступен."""
+    global _auto_explain_available
+
+    if _auto_explain_available is False:
+        return False
+    try:
+        # Savepoint: ошибка LOAD не должна обрывать транзакцию вызова
+        async with conn.transaction():
+            await conn.execute("LOAD 'auto_explain'")
+    except (asyncpg.UndefinedFileError, asyncpg.InsufficientPrivilegeError) as e:
+        _auto_explain_available = False
+        logger.warning(f"auto_explain недоступен, планы только через повторный EXPLAIN: {e}")
+        return False
+    _auto_explain_available = True
+
+    await conn.execute(
+        f"""
+        SET LOCAL auto_explain.log_min_duration = {int(Config.DB_EXPLAIN_MIN_MS)};
+        SET LOCAL auto_explain.log_analyze = on;
+        SET LOCAL auto_explain.log_buffers = on;
+        SET LOCAL auto_explain.log_nested_statements = on;
+        SET LOCAL auto_explain.log_format = json;
+        SET LOCAL client_min_messages = log;
+        """
+    )
+    return True
+
+
+def _parse_auto_explain(messages: List[Any]) -> List[Any]:
+    """Планы из сообщений auto_explain: 'duration: N ms  plan:\\n{json}'."""
+    plans = []
+    for message in messages:
+        text = getattr(message, "message", "") or ""
+        if not text.startswith("duration:") or "plan:" not in text:
+            continue
+        duration, _, plan = text.partition("plan:")
+        try:
+            plan = orjson.loads(plan.strip())
+        except orjson.JSONDecodeError:
+            plan = plan.strip()
+        plans.append({"duration": duration.replace("duration:", "").strip(), "plan": plan})
+    return plans
+
+
+def _serialize_params(params: dict) -> dict:
+    """Параметры вызова для буфера: длинные значения обрезаются."""
+    result = {}
+    for key, value in params.items():
+        raw = orjson.dumps(value, default=str).decode()
+        if len(raw) > _MAX_PARAM_CHARS:
+            raw = raw[:_MAX_PARAM_CHARS] + f"... (+{len(raw) - _MAX_PARAM_CHARS} символов)"
+        result[key] = raw
+    return result
+
+
+async def capture_rpc_plan(
+    conn: asyncpg.Connection,
+    fn_name: str,
+    params: dict,
+    query: str,
+    args: list,
+    read_only: bool,
+    execute: Callable[[], Awaitable[Any]],
+):
+    """
+    Выполняет execute() с захватом плана. Вызывать внутри транзакции вызова
+    (SET LOCAL действует до её конца; для повторного EXPLAIN транзакция должна быть read-only).
+    """
+    messages: List[Any] = []
+
+    def listener(_conn, message):
+        messages.append(message)
+
+    armed = await _arm_auto_explain(conn)
+    if armed:
+        conn.add_log_listener(listener)
+    started = time.perf_counter()
+    try:
+        result = await execute()
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        if armed:
+            # Колбэки слушателя планируются через call_soon — даём им отработать
+            await asyncio.sleep(0)
+            conn.remove_log_listener(listener)
+
+    if duration_ms < Config.DB_EXPLAIN_MIN_MS:
+        return result
+
+    source = None
+    plans: List[Any] = []
+    if armed:
+        source = "auto_explain"
+        plans = _parse_auto_explain(messages)
+    elif read_only and Config.DB_EXPLAIN_RERUN:
+        source = "explain"
+        try:
+            plan = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", *args)
+            plans = [{"plan": orjson.loads(plan) if isinstance(plan, str) else plan}]
+        except Exception as e:
+            logger.warning(f"Не удалось получить EXPLAIN для {fn_name}: {e}")
+
+    _captured.append({
+        "captured_at": datetime.now(timezone.utc).isoformat(),
+        "rpc": fn_name,
+        "duration_ms": round(duration_ms, 1),
+        "source": source,
+        "params": _serialize_params(params),
+        "plans": plans,
+    })
+    logger.info(f"Захвачен план медленного вызова {fn_name} ({duration_ms:.0f} мс, {source or 'без плана'})")
+    return result
+
+
+def get_captured_plans() -> List[dict]:
+    """Содержимое буфера (от новых к старым)."""
+    return list(reversed(_captured))
+
+
+def clear_captured_plans() -> None:
+    """Очищает буфер планов."""
+    _captured.clear()
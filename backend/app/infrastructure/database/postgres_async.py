@@ -2,20 +2,315 @@
 Асинхронный сервис для работы с PostgreSQL.
 """
 import asyncio
-import json
+import time
+import weakref
 import asyncpg
-from datetime import date, datetime
+import orjson
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from decimal import Decimal
 from typing import Optional, List, Dict, Any
 from app.config import Config
 from app.core.logging import get_logger
 from app.core.exceptions import DatabaseError
 from app.utils.date import parse_date
+from app.infrastructure.database.plan_capture import should_capture, capture_rpc_plan
+from app.infrastructure.database.query_metrics import QueryTimer
+from app.infrastructure.database.rpc_registry import (
+    READ_ONLY_RPCS,
+    MUTATING_RPCS,
+    is_read_only_rpc,
+    find_registry_mismatches,
+)
 
 logger = get_logger(__name__)
 
 # Пул соединений
 _connection_pool: Optional[asyncpg.Pool] = None
 
+# Пул реплики для чтения (Config.DB_READ_HOST) и его состояние
+_read_pool: Optional[asyncpg.Pool] = None
+_read_pool_retry_at = 0.0
+_replica_checked_at = 0.0
+_replica_healthy = False
+
+# Повторная попытка подключиться к недоступной реплике — не чаще раза в N секунд
+_REPLICA_RETRY_SECONDS = 30.0
+# Как часто перепроверять отставание реплики
+_REPLICA_LAG_CHECK_SECONDS = 5.0
+
+# Ошибки соединения: чтение с реплики повторяется на основной БД, соединение области не переиспользуется
+_CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+)
+
+# True — чтения в текущем контексте (запрос/задача) идут на основную БД:
+# выставляется после любой записи (read-after-write) и через use_primary()
+_prefer_primary: ContextVar[bool] = ContextVar("db_prefer_primary", default=False)
+
+
+class _ScopedConnection:
+    """Соединение, закреплённое за connection_scope (по одному на пул)."""
+
+    __slots__ = ("conn", "transaction", "busy", "broken", "orphaned")
+
+    def __init__(self):
+        self.conn: Optional[asyncpg.Connection] = None
+        self.transaction = None
+        self.busy = False
+        self.broken = False
+        # Область закрыта во время запроса (задача пережила запрос FastAPI):
+        # соединение вернёт в пул сам запрос по завершении
+        self.orphaned = False
+
+
+class _ConnectionScope:
+    """
+    Соединения, переиспользуемые всеми запросами внутри connection_scope().
+    Берутся из пула лениво — при первом запросе к нему, возвращаются при выходе.
+    """
+
+    __slots__ = ("snapshot", "entries", "closed")
+
+    def __init__(self, snapshot: bool):
+        self.snapshot = snapshot
+        self.entries: Dict[asyncpg.Pool, _ScopedConnection] = {}
+        self.closed = False
+
+    async def take(self, pool: asyncpg.Pool) -> Optional[_ScopedConnection]:
+        """
+        Занимает соединение области для пула. None — соединение уже занято параллельным
+        запросом (asyncio.gather) или сломано: такой запрос берёт своё соединение из пула.
+        """
+        if self.closed:
+            return None
+        entry = self.entries.get(pool)
+        if entry is not None:
+            if entry.busy or entry.broken:
+                return None
+            entry.busy = True
+            return entry
+
+        entry = self.entries[pool] = _ScopedConnection()
+        entry.busy = True
+        try:
+            entry.conn = await pool.acquire()
+            if self.snapshot:
+                # Все чтения области видят один снимок данных
+                entry.transaction = entry.conn.transaction(isolation='repeatable_read', readonly=True)
+                await entry.transaction.start()
+        except BaseException:
+            entry.broken = True
+            entry.busy = False
+            raise
+        return entry
+
+    async def close(self) -> None:
+        """
+        Возвращает соединения в пул. Занятые запросом (фоновая задача, унаследовавшая
+        контекст) не трогаются: их возвращает _acquire по завершении запроса.
+        """
+        self.closed = True
+        for pool, entry in self.entries.items():
+            if entry.busy:
+                entry.orphaned = True
+                continue
+            await self.release(pool, entry)
+        self.entries.clear()
+
+    @staticmethod
+    async def release(pool: asyncpg.Pool, entry: _ScopedConnection) -> None:
+        if entry.conn is None:
+            return
+        try:
+            if entry.transaction is not None and not entry.broken:
+                await entry.transaction.rollback()
+        except Exception as e:
+            logger.warning(f"Ошибка завершения снимка области соединения: {e}")
+        try:
+            await pool.release(entry.conn)
+        except Exception as e:
+            logger.warning(f"Ошибка возврата соединения области в пул: {e}")
+        entry.conn = None
+
+
+# Текущая область переиспользования соединений (запрос FastAPI и т.п.)
+_connection_scope: ContextVar[Optional[_ConnectionScope]] = ContextVar("db_connection_scope", default=None)
+
+
+@asynccontextmanager
+async def connection_scope(snapshot: bool = False):
+    """
+    Все запросы helpers (rpc_async, table_*_async) внутри блока используют одно соединение
+    на пул вместо acquire/release на каждый вызов.
+    
+    snapshot=True — чтения идут в одной транзакции REPEATABLE READ READ ONLY (согласованный
+    снимок); записи в этом режиме берут отдельное соединение из пула.
+    Параллельные запросы (asyncio.gather) и table_stream_async берут соединения из пула как обычно.
+    """
+    scope = _ConnectionScope(snapshot)
+    token = _connection_scope.set(scope)
+    try:
+        yield
+    finally:
+        _connection_scope.reset(token)
+        await scope.close()
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Cannot serialize {type(obj)}")
+
+
+def _encode_json(value: Any) -> bytes:
+    """
+    Кодирует значение для json/jsonb параметра.
+    Строка, начинающаяся с { или [, считается уже сериализованным JSON и передаётся как есть;
+    любая другая строка кодируется как JSON-строка.
+    """
+    if isinstance(value, str) and value.startswith(('{', '[')):
+        return value.encode("utf-8")
+    return orjson.dumps(
+        value,
+        default=_json_default,
+        option=orjson.OPT_NON_STR_KEYS,
+    )
+
+
+def _decode_json(raw: bytes) -> Any:
+    return orjson.loads(raw)
+
+
+# Бинарный формат jsonb: байт версии + JSON текст
+_JSONB_BINARY_VERSION = b'\x01'
+
+
+def _encode_jsonb(value: Any) -> bytes:
+    return _JSONB_BINARY_VERSION + _encode_json(value)
+
+
+def _decode_jsonb(raw: bytes) -> Any:
+    return orjson.loads(memoryview(raw)[1:])
+
+
+# Счётчики байт JSON/JSONB, декодированных соединением, для метрик payload. Декодирование идёт
+# в колбэках протокола asyncpg, поэтому счётчик привязан к соединению, а не к контексту. Ключ —
+# сам объект соединения: pid бэкенда у основной БД и реплики может совпасть.
+_payload_counters: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _raw_connection(conn) -> asyncpg.Connection:
+    """Соединение под PoolConnectionProxy (pool.acquire отдаёт прокси, init пула — само соединение)."""
+    return getattr(conn, "_con", None) or conn
+
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """
+    Настройка каждого нового соединения пула: json/jsonb кодеки на orjson.
+    JSONB приходит из БД сразу dict/list, а dict/list в параметрах кодируются без json.dumps.
+    Бинарный формат нужен и для COPY (copy_records_to_table принимает только binary-кодеки).
+    """
+    counter = _payload_counters[conn] = [0]
+
+    def decode_jsonb(raw: bytes) -> Any:
+        counter[0] += len(raw)
+        return _decode_jsonb(raw)
+
+    def decode_json(raw: bytes) -> Any:
+        counter[0] += len(raw)
+        return _decode_json(raw)
+
+    await conn.set_type_codec(
+        'jsonb',
+        encoder=_encode_jsonb,
+        decoder=decode_jsonb,
+        schema='pg_catalog',
+        format='binary',
+    )
+    await conn.set_type_codec(
+        'json',
+        encoder=_encode_json,
+        decoder=decode_json,
+        schema='pg_catalog',
+        format='binary',
+    )
+
+
+def _is_connection_error(exc: BaseException) -> bool:
+    """Обрыв соединения или отмена запроса (в т.ч. обёрнутые helpers в DatabaseError)."""
+    for e in (exc, exc.__context__):
+        if isinstance(e, (asyncio.CancelledError,) + _CONNECTION_ERRORS):
+            return True
+    return False
+
+
+@asynccontextmanager
+async def _track(conn: asyncpg.Connection, timer: QueryTimer):
+    """Замер выполнения на полученном соединении: время, байты JSON, ошибка."""
+    timer.acquired()
+    counter = _payload_counters.get(_raw_connection(conn))
+    before = counter[0] if counter else 0
+    try:
+        yield
+    except Exception:
+        timer.failed = True
+        raise
+    finally:
+        if counter:
+            timer.payload_bytes = counter[0] - before
+        timer.finish()
+
+
+@asynccontextmanager
+async def _acquire(pool: asyncpg.Pool, kind: str, name: str, write: bool = False, shared: bool = True):
+    """
+    Соединение для запроса с замером для query_metrics: ожидание соединения, время выполнения,
+    байты JSON в ответе. Отдаёт (conn, timer); timer.rows заполняет вызывающий код.
+    
+    Внутри connection_scope() берётся соединение области (кроме записей в snapshot-режиме
+    и shared=False), иначе — pool.acquire().
+    """
+    timer = QueryTimer(kind, name)
+    scope = _connection_scope.get() if shared else None
+    if scope is not None and write and scope.snapshot:
+        scope = None
+    try:
+        entry = await scope.take(pool) if scope is not None else None
+        if entry is not None:
+            try:
+                async with _track(entry.conn, timer):
+                    yield entry.conn, timer
+            except BaseException as e:
+                # Ошибка в снимке обрывает его транзакцию; обрыв соединения/отмена — само соединение
+                if scope.snapshot or _is_connection_error(e):
+                    entry.broken = True
+                raise
+            finally:
+                entry.busy = False
+                if entry.orphaned:
+                    await scope.release(pool, entry)
+        else:
+            async with pool.acquire() as conn:
+                async with _track(conn, timer):
+                    yield conn, timer
+    except Exception:
+        # Не дождались соединения — тоже учитываем
+        if timer.acquired_at is None:
+            timer.failed = True
+            timer.finish()
+        raise
+
+
+def _count_rows(result) -> int:
+    if result is None:
+        return 0
+    return len(result) if isinstance(result, list) else 1
+
 
 async def get_connection_pool():
     """Получает или создает пул асинхронных соединений PostgreSQL."""
@@ -37,6 +332,7 @@ async def get_connection_pool():
         _connection_pool = await asyncpg.create_pool(
             min_size=Config.DB_POOL_ASYNC_MIN,
             max_size=Config.DB_POOL_ASYNC_MAX,
+            init=_init_connection,
             **db_config,
         )
         logger.info(
@@ -50,19 +346,180 @@ async def get_connection_pool():
         raise DatabaseError(f"Не удалось подключиться к базе данных: {e}")
 
 
+def get_pool_stats() -> Dict[str, Any]:
+    """Размер и занятость пулов (для админских метрик)."""
+    stats = {}
+    for name, pool in (("primary", _connection_pool), ("replica", _read_pool)):
+        if pool is not None:
+            stats[name] = {
+                "size": pool.get_size(),
+                "idle": pool.get_idle_size(),
+                "min": pool.get_min_size(),
+                "max": pool.get_max_size(),
+            }
+    return stats
+
+
 async def close_connection_pool():
-    """Закрывает пул соединений."""
-    global _connection_pool
+    """Закрывает пул соединений (и пул реплики, если он создан)."""
+    global _connection_pool, _read_pool
     if _connection_pool:
         await _connection_pool.close()
         _connection_pool = None
         logger.info("Пул асинхронных соединений PostgreSQL закрыт")
+    if _read_pool:
+        await _read_pool.close()
+        _read_pool = None
+        logger.info("Пул реплики PostgreSQL закрыт")
+
+
+@contextmanager
+def use_primary():
+    """Все чтения внутри блока идут на основную БД (read-after-write сценарии)."""
+    token = _prefer_primary.set(True)
+    try:
+        yield
+    finally:
+        _prefer_primary.reset(token)
+
+
+def _mark_write():
+    """После записи чтения текущего контекста остаются на основной БД."""
+    _prefer_primary.set(True)
+
+
+async def _get_replica_pool() -> Optional[asyncpg.Pool]:
+    """Пул реплики или None, если реплика не настроена или недоступна."""
+    global _read_pool, _read_pool_retry_at
+
+    if _read_pool is not None:
+        return _read_pool
+    if time.monotonic() < _read_pool_retry_at:
+        return None
+
+    try:
+        _read_pool = await asyncpg.create_pool(
+            min_size=Config.DB_POOL_READ_MIN,
+            max_size=Config.DB_POOL_READ_MAX,
+            init=_init_connection,
+            host=Config.DB_READ_HOST,
+            port=Config.DB_READ_PORT,
+            database=Config.DB_READ_NAME,
+            user=Config.DB_READ_USER,
+            password=Config.DB_READ_PASSWORD,
+        )
+        logger.info(
+            "Пул реплики PostgreSQL создан (%s, asyncpg min=%s max=%s)",
+            Config.DB_READ_HOST,
+            Config.DB_POOL_READ_MIN,
+            Config.DB_POOL_READ_MAX,
+        )
+        return _read_pool
+    except Exception as e:
+        _read_pool_retry_at = time.monotonic() + _REPLICA_RETRY_SECONDS
+        logger.warning(f"Реплика PostgreSQL недоступна, чтения идут на основную БД: {e}")
+        return None
+
+
+def _mark_replica_down():
+    """Отправляет чтения на основную БД до следующей проверки реплики."""
+    global _replica_healthy, _replica_checked_at
+    _replica_healthy = False
+    _replica_checked_at = time.monotonic()
+
+
+async def _check_replica(pool: asyncpg.Pool) -> bool:
+    """
+    Реплика пригодна для чтения, если её отставание не больше DB_READ_MAX_LAG_SECONDS.
+    Результат кэшируется на _REPLICA_LAG_CHECK_SECONDS.
+    """
+    global _replica_healthy, _replica_checked_at
+
+    now = time.monotonic()
+    if now - _replica_checked_at < _REPLICA_LAG_CHECK_SECONDS:
+        return _replica_healthy
+    # Сдвигаем отметку до запроса — параллельные чтения не дублируют проверку
+    _replica_checked_at = now
+
+    try:
+        # Всё полученное применено — отставания нет (иначе простой мастера выглядел бы как лаг)
+        lag = await pool.fetchval(
+            """
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END
+            """,
+            timeout=2,
+        )
+    except Exception as e:
+        if _replica_healthy:
+            logger.warning(f"Проверка реплики PostgreSQL не удалась, чтения идут на основную БД: {e}")
+        _replica_healthy = False
+        return False
+
+    healthy = float(lag) <= Config.DB_READ_MAX_LAG_SECONDS
+    if healthy != _replica_healthy:
+        if healthy:
+            logger.info(f"Реплика PostgreSQL доступна для чтения (отставание {float(lag):.1f} с)")
+        else:
+            logger.warning(
+                f"Отставание реплики {float(lag):.1f} с > {Config.DB_READ_MAX_LAG_SECONDS} с, "
+                "чтения идут на основную БД"
+            )
+    _replica_healthy = healthy
+    return healthy
+
+
+async def get_read_pool() -> asyncpg.Pool:
+    """
+    Пул для чтения: реплика, если она настроена, доступна и не отстаёт,
+    и в текущем контексте ещё не было записи; иначе основной пул.
+
+    Read-after-write в пределах контекста (запроса, задачи). Следующий запрос того же
+    пользователя может читать реплику с отставанием до DB_READ_MAX_LAG_SECONDS; значения
+    @cache, сброшенные записью, в это окно заполняются с основной БД (см. cache/decorators).
+    """
+    if Config.DB_READ_HOST and not _prefer_primary.get():
+        replica = await _get_replica_pool()
+        if replica is not None and await _check_replica(replica):
+            return replica
+    return await get_connection_pool()
+
+
+async def _run_read(kind: str, name: str, operation):
+    """
+    Выполняет чтение operation(conn) на пуле для чтения.
+    При обрыве соединения с репликой повторяет его на основной БД.
+    """
+    pool = await get_read_pool()
+    primary = await get_connection_pool()
+
+    if pool is not primary:
+        try:
+            async with _acquire(pool, kind, name) as (conn, timer):
+                result = await operation(conn)
+                timer.rows = _count_rows(result)
+                return result
+        except _CONNECTION_ERRORS as e:
+            logger.warning(f"Ошибка соединения с репликой, повтор на основной БД: {e}")
+            _mark_replica_down()
+
+    async with _acquire(primary, kind, name) as (conn, timer):
+        result = await operation(conn)
+        timer.rows = _count_rows(result)
+        return result
 
 
 async def rpc_async(fn_name: str, params: dict):
     """
     Асинхронно вызывает SQL функцию (RPC) в PostgreSQL.
     
+    Функции из реестра read-only (rpc_registry) выполняются без явной транзакции —
+    экономит BEGIN/COMMIT на каждый вызов — и идут на реплику (get_read_pool);
+    остальные — в транзакции на основной БД.
+    
     Args:
         fn_name: Имя функции в БД
         params: Словарь параметров для функции
@@ -70,263 +527,354 @@ async def rpc_async(fn_name: str, params: dict):
     Returns:
         Результат выполнения функции
     """
-    pool = await get_connection_pool()
+    try:
+        capture = should_capture(fn_name)
+        if is_read_only_rpc(fn_name):
+            if capture:
+                return await _run_read(
+                    "rpc", fn_name, lambda conn: _execute_rpc_captured(conn, fn_name, params, True)
+                )
+            return await _run_read("rpc", fn_name, lambda conn: _execute_rpc(conn, fn_name, params))
+
+        _mark_write()
+        pool = await get_connection_pool()
+        async with _acquire(pool, "rpc", fn_name, write=True) as (conn, timer):
+            if capture:
+                result = await _execute_rpc_captured(conn, fn_name, params, False)
+            else:
+                # Используем транзакцию для сохранения изменений (DML операции в функциях)
+                async with conn.transaction():
+                    result = await _execute_rpc(conn, fn_name, params)
+            timer.rows = _count_rows(result)
+            return result
+    except Exception as e:
+        logger.error(f"Ошибка выполнения RPC функции {fn_name}: {e}")
+        raise DatabaseError(f"Ошибка выполнения функции {fn_name}: {e}")
+
+
+def _rpc_query(fn_name: str, params: dict):
+    """SELECT * FROM fn($1, ...) и подготовленные аргументы."""
+    # dict/list словарей уходят в jsonb через кодек пула, списки простых типов —
+    # в массивы PostgreSQL; строковые даты приводим к date
+    pg_params = {key: _prepare_rpc_param(key, value) for key, value in params.items()}
     
-    async with pool.acquire() as conn:
-        # Используем транзакцию для сохранения изменений (DML операции в функциях)
-        async with conn.transaction():
-            try:
-                # Преобразуем параметры для PostgreSQL
-                # Нужно различать массивы PostgreSQL (bigint[], text[] и т.д.) и jsonb
-                # - Массивы: список простых типов (int, str, float) - оставляем как список
-                # - JSONB: dict или список словарей - преобразуем в JSON строку
-                pg_params = {}
-                for key, value in params.items():
-                    if isinstance(value, dict):
-                        # dict всегда преобразуем в JSON строку для jsonb
-                        pg_params[key] = json.dumps(value, ensure_ascii=False)
-                    elif isinstance(value, list):
-                        # Проверяем, является ли это массивом простых типов или jsonb
-                        if len(value) > 0:
-                            first_item = value[0]
-                            # Если первый элемент - dict, это jsonb
-                            if isinstance(first_item, dict):
-                                pg_params[key] = json.dumps(value, ensure_ascii=False)
-                            else:
-                                # Иначе это массив PostgreSQL - оставляем как список
-                                # asyncpg автоматически преобразует Python list в PostgreSQL array
-                                pg_params[key] = value
-                        else:
-                            # Пустой список - оставляем как есть (asyncpg обработает)
-                            pg_params[key] = value
-                    else:
-                        # Обрабатываем строковые даты для параметров, которые ожидают date
-                        # Проверяем, является ли параметр датой (по имени параметра или значению)
-                        if isinstance(value, str) and ('date' in key.lower() or 'from_date' in key.lower() or 'to_date' in key.lower()):
-                            # Пытаемся распарсить строку как дату
-                            parsed_date = parse_date(value)
-                            if parsed_date:
-                                # Если это timestamp, берем только дату
-                                if isinstance(parsed_date, datetime):
-                                    pg_params[key] = parsed_date.date()
-                                else:
-                                    pg_params[key] = parsed_date
-                            else:
-                                pg_params[key] = value
-                        else:
-                            pg_params[key] = value
-                
-                # Формируем вызов функции
-                param_names = list(pg_params.keys())
-                param_placeholders = ', '.join([f'${i+1}' for i in range(len(param_names))])
-                
-                query = f"SELECT * FROM {fn_name}({param_placeholders})"
-                
-                result = await conn.fetch(query, *[pg_params[name] for name in param_names])
-                
-                # Преобразуем результат
-                if not result:
-                    return None
-                
-                # Если результат - одна строка с одним полем
-                if len(result) == 1 and len(result[0]) == 1:
-                    value = result[0][0]
-                    # Если это JSON, парсим его
-                    if isinstance(value, (dict, list)):
-                        return value
-                    # Если это строка, пытаемся распарсить как JSON
-                    if isinstance(value, str) and (value.startswith('{') or value.startswith('[')):
-                        try:
-                            return json.loads(value)
-                        except:
-                            pass
-                    return value
-                
-                # Если результат - список строк
-                if len(result) > 1 or len(result[0]) > 1:
-                    # Преобразуем в список словарей
-                    result_list = [dict(row) for row in result]
-                    
-                    # Парсим JSONB поля, которые вернулись как строки
-                    # asyncpg может возвращать JSONB как строки, нужно их распарсить
-                    for item in result_list:
-                        if isinstance(item, dict):
-                            # Парсим известные JSONB поля
-                            for field_name in ['properties', 'description', 'result', 'settings']:
-                                if field_name in item and isinstance(item[field_name], str):
-                                    value = item[field_name]
-                                    if value and (value.startswith('{') or value.startswith('[')):
-                                        try:
-                                            item[field_name] = json.loads(value)
-                                        except (json.JSONDecodeError, ValueError):
-                                            # Если не удалось распарсить, оставляем как есть
-                                            pass
-                    
-                    # Нормализуем поля amount_rub/amountRub для совместимости
-                    if result_list and isinstance(result_list[0], dict):
-                        first_item = result_list[0]
-                        has_amount_rub = 'amount_rub' in first_item
-                        has_amountRub = 'amountRub' in first_item
-                        
-                        if has_amount_rub and not has_amountRub:
-                            for item in result_list:
-                                if isinstance(item, dict) and 'amount_rub' in item:
-                                    item['amountRub'] = item['amount_rub']
-                        elif has_amountRub and not has_amount_rub:
-                            for item in result_list:
-                                if isinstance(item, dict) and 'amountRub' in item:
-                                    item['amount_rub'] = item['amountRub']
-                    
-                    return result_list
-                
-                return result
-                
-            except Exception as e:
-                logger.error(f"Ошибка выполнения RPC функции {fn_name}: {e}")
-                raise DatabaseError(f"Ошибка выполнения функции {fn_name}: {e}")
+    # Формируем вызов функции
+    param_names = list(pg_params.keys())
+    param_placeholders = ', '.join([f'${i+1}' for i in range(len(param_names))])
+    
+    query = f"SELECT * FROM {fn_name}({param_placeholders})"
+    return query, [pg_params[name] for name in param_names]
+
+
+async def _execute_rpc_captured(conn: asyncpg.Connection, fn_name: str, params: dict, read_only: bool):
+    """Вызов RPC с захватом плана (plan_capture) в собственной транзакции."""
+    query, args = _rpc_query(fn_name, params)
+    async with conn.transaction(readonly=read_only):
+        return await capture_rpc_plan(
+            conn, fn_name, params, query, args, read_only,
+            lambda: _execute_rpc(conn, fn_name, params),
+        )
+
+
+async def _execute_rpc(conn: asyncpg.Connection, fn_name: str, params: dict):
+    """Выполняет SELECT * FROM fn(...) на соединении и нормализует результат."""
+    query, args = _rpc_query(fn_name, params)
+    result = await conn.fetch(query, *args)
+    
+    # Преобразуем результат
+    if not result:
+        return None
+    
+    # Если результат - одна строка с одним полем (json/jsonb уже декодирован кодеком)
+    if len(result) == 1 and len(result[0]) == 1:
+        return result[0][0]
+    
+    # Если результат - список строк
+    if len(result) > 1 or len(result[0]) > 1:
+        # Преобразуем в список словарей
+        result_list = [dict(row) for row in result]
+        
+        # Нормализуем поля amount_rub/amountRub для совместимости
+        if result_list and isinstance(result_list[0], dict):
+            first_item = result_list[0]
+            has_amount_rub = 'amount_rub' in first_item
+            has_amountRub = 'amountRub' in first_item
+            
+            if has_amount_rub and not has_amountRub:
+                for item in result_list:
+                    if isinstance(item, dict) and 'amount_rub' in item:
+                        item['amountRub'] = item['amount_rub']
+            elif has_amountRub and not has_amount_rub:
+                for item in result_list:
+                    if isinstance(item, dict) and 'amountRub' in item:
+                        item['amount_rub'] = item['amountRub']
+        
+        return result_list
+    
+    return result
+
+
+async def validate_rpc_registry() -> Dict[str, List[str]]:
+    """
+    Сверяет реестр RPC с pg_proc.provolatile и логирует расхождения.
+    Вызывается при старте API; ошибки БД не прерывают запуск.
+    """
+    names = sorted(READ_ONLY_RPCS | MUTATING_RPCS)
+    try:
+        pool = await get_connection_pool()
+        async with pool.acquire() as conn:
+            # Для перегруженных функций берём самую «изменчивую» версию: 'v' > 's' > 'i'
+            rows = await conn.fetch(
+                """
+                SELECT p.proname, max(p.provolatile::text) AS provolatile
+                FROM pg_proc p
+                JOIN pg_namespace n ON n.oid = p.pronamespace
+                WHERE n.nspname = 'public' AND p.proname = ANY($1::text[])
+                GROUP BY p.proname
+                """,
+                names,
+            )
+    except Exception as e:
+        logger.warning(f"Не удалось проверить реестр RPC по pg_proc: {e}")
+        return {}
+
+    mismatches = find_registry_mismatches({row['proname']: row['provolatile'] for row in rows})
+    if mismatches["missing"]:
+        logger.warning(f"RPC из реестра отсутствуют в БД: {', '.join(mismatches['missing'])}")
+    if mismatches["stable_mutating"]:
+        logger.warning(
+            "RPC зарегистрированы как изменяющие, но объявлены STABLE/IMMUTABLE: "
+            f"{', '.join(mismatches['stable_mutating'])}"
+        )
+    if mismatches["volatile_read_only"]:
+        logger.info(
+            "Read-only RPC объявлены VOLATILE (можно пометить STABLE): "
+            f"{', '.join(mismatches['volatile_read_only'])}"
+        )
+    return mismatches
+
+
+def _in_condition(column: str, values, param_counter: int):
+    """
+    IN-фильтр одним параметром-массивом: column = ANY($n). Тип массива PostgreSQL выводит
+    из колонки, поэтому форма запроса не зависит от числа значений и prepared statement
+    переиспользуется. None — пустой список (фильтр пропускается).
+    """
+    if values is None:
+        return None
+    values = list(values)
+    if not values:
+        return None
+    return f"{column} = ANY(${param_counter})", values
+
+
+def _keyset_condition(after: dict, order, param_counter: int):
+    """
+    Условие keyset-пагинации: (c1, c2) > ($n, $n+1) — строки после курсора after
+    в порядке сортировки (< для order desc). Возвращает (условие, параметры).
+    """
+    columns = list(after.keys())
+    op = "<" if isinstance(order, dict) and order.get('desc', False) else ">"
+    placeholders = [f"${param_counter + i}" for i in range(len(columns))]
+    if len(columns) == 1:
+        condition = f"{columns[0]} {op} {placeholders[0]}"
+    else:
+        condition = f"({', '.join(columns)}) {op} ({', '.join(placeholders)})"
+    return condition, [after[c] for c in columns]
+
+
+def _build_select_query(table: str, select="*", filters: dict = None,
+                        in_filters: dict = None, neq_filters: dict = None, order=None,
+                        after: dict = None):
+    """Собирает SELECT ... WHERE ... ORDER BY и список параметров (без LIMIT/OFFSET)."""
+    query_parts = [f"SELECT {select} FROM {table}"]
+    conditions = []
+    params = []
+    param_counter = 1
+    
+    # Фильтры равенства
+    if filters:
+        for k, v in filters.items():
+            if v is None:
+                continue
+            conditions.append(f"{k} = ${param_counter}")
+            params.append(v)
+            param_counter += 1
+    
+    # Фильтры IN
+    if in_filters:
+        for k, v in in_filters.items():
+            in_condition = _in_condition(k, v, param_counter)
+            if in_condition is None:
+                continue
+            conditions.append(in_condition[0])
+            params.append(in_condition[1])
+            param_counter += 1
+    
+    # Фильтры неравенства
+    if neq_filters:
+        for k, v in neq_filters.items():
+            if v is None:
+                continue
+            conditions.append(f"{k} != ${param_counter}")
+            params.append(v)
+            param_counter += 1
+    
+    # Keyset-курсор: без сортировки упорядочиваем по колонкам курсора
+    if after:
+        condition, after_params = _keyset_condition(after, order, param_counter)
+        conditions.append(condition)
+        params.extend(after_params)
+        param_counter += len(after_params)
+        if not order:
+            order = ", ".join(after.keys())
+    
+    if conditions:
+        query_parts.append("WHERE " + " AND ".join(conditions))
+    
+    # Сортировка: dict {"column": "col", "desc": bool} или строка "col1, col2" (ASC)
+    if order:
+        if isinstance(order, str):
+            query_parts.append(f"ORDER BY {order}")
+        else:
+            desc = "DESC" if order.get('desc', False) else "ASC"
+            query_parts.append(f"ORDER BY {order['column']} {desc}")
+    
+    return query_parts, params
 
 
 async def table_select_async(table: str, select="*", filters: dict = None, 
                              in_filters: dict = None, neq_filters: dict = None, 
-                             order=None, limit=10000, offset=None):
+                             order=None, limit=10000, offset=None, after: dict = None):
     """
-    Асинхронно выполняет SELECT запрос к таблице.
+    Асинхронно выполняет SELECT запрос к таблице (на реплике, если она доступна).
     order: dict {'column': str, 'desc': bool} или строка для ORDER BY (например "asset_id, payment_date").
+    in_filters: {колонка: список} — передаётся одним массивом (column = ANY($n)).
+    after: keyset-курсор вместо offset — {колонка: значение последней строки предыдущей страницы}.
+        Сортировка должна идти по тем же колонкам (без order — ORDER BY колонки курсора),
+        колонки должны давать уникальный порядок (например id).
+    
+    Пример постраничного чтения:
+        page = await table_select_async("assets", "id, ticker", limit=1000)
+        while page:
+            ...
+            page = await table_select_async("assets", "id, ticker", limit=1000, after={"id": page[-1]["id"]})
     """
-    pool = await get_connection_pool()
+    if after and offset:
+        raise ValueError("after и offset несовместимы")
     
-    async with pool.acquire() as conn:
-        try:
-            query_parts = [f"SELECT {select} FROM {table}"]
-            conditions = []
-            params = []
-            param_counter = 1
-            
-            # Фильтры равенства
-            if filters:
-                for k, v in filters.items():
-                    if v is None:
-                        continue
-                    conditions.append(f"{k} = ${param_counter}")
-                    params.append(v)
-                    param_counter += 1
-            
-            # Фильтры IN
-            if in_filters:
-                for k, v in in_filters.items():
-                    if v is None or (isinstance(v, list) and len(v) == 0):
-                        continue
-                    placeholders = ', '.join([f'${i+param_counter}' for i in range(len(v))])
-                    conditions.append(f"{k} IN ({placeholders})")
-                    params.extend(v)
-                    param_counter += len(v)
-            
-            # Фильтры неравенства
-            if neq_filters:
-                for k, v in neq_filters.items():
-                    if v is None:
-                        continue
-                    conditions.append(f"{k} != ${param_counter}")
-                    params.append(v)
-                    param_counter += 1
-            
-            if conditions:
-                query_parts.append("WHERE " + " AND ".join(conditions))
-            
-            # Сортировка: dict {"column": "col", "desc": bool} или строка "col1, col2" (ASC)
-            if order:
-                if isinstance(order, str):
-                    query_parts.append(f"ORDER BY {order}")
-                else:
-                    desc = "DESC" if order.get('desc', False) else "ASC"
-                    query_parts.append(f"ORDER BY {order['column']} {desc}")
-            
-            # Лимит и смещение
-            if limit is not None:
-                if offset:
-                    query_parts.append(f"LIMIT {limit} OFFSET {offset}")
-                else:
-                    query_parts.append(f"LIMIT {limit}")
-            
-            query = " ".join(query_parts)
-            rows = await conn.fetch(query, *params)
-            
-            result_list = [dict(row) for row in rows]
-            
-            # Парсим JSONB поля, которые вернулись как строки
-            # asyncpg может возвращать JSONB как строки, нужно их распарсить
-            for item in result_list:
-                if isinstance(item, dict):
-                    # Парсим известные JSONB поля
-                    for field_name in ['properties', 'description', 'result', 'settings']:
-                        if field_name in item and isinstance(item[field_name], str):
-                            value = item[field_name]
-                            if value and (value.startswith('{') or value.startswith('[')):
-                                try:
-                                    item[field_name] = json.loads(value)
-                                except (json.JSONDecodeError, ValueError):
-                                    # Если не удалось распарсить, оставляем как есть
-                                    pass
-            
-            return result_list
-            
-        except Exception as e:
-            logger.error(f"Ошибка выполнения SELECT запроса к таблице {table}: {e}")
-            raise DatabaseError(f"Ошибка выполнения запроса: {e}")
+    query_parts, params = _build_select_query(
+        table, select, filters, in_filters, neq_filters, order, after,
+    )
+    
+    # Лимит и смещение
+    if limit is not None:
+        if offset:
+            query_parts.append(f"LIMIT {limit} OFFSET {offset}")
+        else:
+            query_parts.append(f"LIMIT {limit}")
+    
+    query = " ".join(query_parts)
+    
+    try:
+        rows = await _run_read("select", table, lambda conn: conn.fetch(query, *params))
+        return [dict(row) for row in rows]
+    except Exception as e:
+        logger.error(f"Ошибка выполнения SELECT запроса к таблице {table}: {e}")
+        raise DatabaseError(f"Ошибка выполнения запроса: {e}")
 
 
-# Известные JSONB поля в таблицах
-_JSONB_FIELDS = {
-    'portfolios': {'description', 'properties'},
-    'assets': {'properties'},
-    'import_tasks': {'result'},
-    'user_broker_connections': {'settings'},
-}
+async def table_stream_async(table: str, select="*", filters: dict = None,
+                             in_filters: dict = None, neq_filters: dict = None,
+                             order=None, batch_size: int = 5000, batches: bool = False):
+    """
+    Потоковый SELECT через серверный курсор: строки читаются пачками по batch_size,
+    следующая пачка запрашивается, пока вызывающий код обрабатывает текущую.
+    Для больших выборок (все активы, выплаты, цены) — память ограничена размером пачки.
+    
+    Фильтры и order — как в table_select_async.
+    batches=True — отдаёт списки словарей (пачки), иначе — по одной строке.
+    
+    Пример:
+        async for batch in table_stream_async("asset_payouts", "asset_id, value", batches=True):
+            ...
+    
+    Курсор держит соединение пула и транзакцию до конца итерации; при досрочном выходе
+    из цикла (break) оборачивайте генератор в contextlib.aclosing, чтобы сразу вернуть соединение.
+    """
+    query_parts, params = _build_select_query(
+        table, select, filters, in_filters, neq_filters, order,
+    )
+    query = " ".join(query_parts)
+    pool = await get_connection_pool()
+    
+    # В метриках время stream включает обработку пачек вызывающим кодом
+    async with _acquire(pool, "stream", table, shared=False) as (conn, timer):
+        # Серверный курсор в PostgreSQL живёт только внутри транзакции
+        async with conn.transaction(readonly=True):
+            try:
+                cursor = await conn.cursor(query, *params)
+                pending = asyncio.ensure_future(cursor.fetch(batch_size))
+            except Exception as e:
+                logger.error(f"Ошибка открытия курсора к таблице {table}: {e}")
+                raise DatabaseError(f"Ошибка выполнения запроса: {e}")
+            
+            try:
+                while True:
+                    try:
+                        rows = await pending
+                    except Exception as e:
+                        logger.error(f"Ошибка чтения курсора таблицы {table}: {e}")
+                        raise DatabaseError(f"Ошибка выполнения запроса: {e}")
+                    if not rows:
+                        break
+                    # Следующая пачка читается параллельно с обработкой текущей
+                    pending = (
+                        asyncio.ensure_future(cursor.fetch(batch_size))
+                        if len(rows) == batch_size else None
+                    )
+                    timer.rows += len(rows)
+                    batch = [dict(row) for row in rows]
+                    if batches:
+                        yield batch
+                    else:
+                        for item in batch:
+                            yield item
+                    if pending is None:
+                        break
+            finally:
+                if pending is not None and not pending.done():
+                    pending.cancel()
+                    try:
+                        await pending
+                    except (asyncio.CancelledError, Exception):
+                        pass
 
 
-def _is_jsonb_field(table: str, column: str) -> bool:
-    """Проверяет, является ли поле JSONB по известным полям."""
-    return column in _JSONB_FIELDS.get(table, set())
+def _prepare_rpc_param(key: str, value):
+    """
+    Подготавливает параметр RPC. Массивы и jsonb передаются как есть (см. _init_connection);
+    строки в параметрах с 'date' в имени приводятся к date.
+    """
+    if isinstance(value, str) and 'date' in key.lower():
+        parsed_date = parse_date(value)
+        if parsed_date:
+            return parsed_date.date() if isinstance(parsed_date, datetime) else parsed_date
+    return value
 
 
-def _prepare_value(value, table: str = None, column: str = None):
+def _prepare_value(value):
     """
-    Подготавливает значение для вставки в PostgreSQL.
-    - Преобразует dict/list в JSON строку для JSONB полей
-    - Преобразует строки дат в объекты datetime используя parse_date из app.utils.date
-    - Для JSONB полей: если строка не является JSON, оборачивает её в JSON строку
-    
-    Args:
-        value: Значение для подготовки
-        table: Имя таблицы (для определения типа поля)
-        column: Имя колонки (для определения типа поля)
+    Подготавливает значение для записи в таблицу.
+    - dict/list передаются как есть: jsonb кодирует кодек пула, массивы — asyncpg
+    - datetime обрезается до секунд, строки дат преобразуются через parse_date
     """
-    # Если это dict/list, преобразуем в JSON строку для JSONB
-    if isinstance(value, (dict, list)):
-        return json.dumps(value, ensure_ascii=False)
-    
-    # Если это уже date/datetime, обрезаем микросекунды для единообразия
     if isinstance(value, datetime):
         # Убираем микросекунды, чтобы избежать проблем с дубликатами
         return value.replace(microsecond=0)
-    if isinstance(value, date):
-        return value
     
-    # Если это строка
-    if isinstance(value, str):
-        # Проверяем, является ли поле JSONB
-        is_jsonb = table and column and _is_jsonb_field(table, column)
-        
-        # Если это JSONB поле и строка не является JSON, оборачиваем её в JSON строку
-        if is_jsonb and not value.startswith(('{', '[')):
-            # Обычная строка для JSONB поля - оборачиваем в JSON строку
-            return json.dumps(value, ensure_ascii=False)
-        
-        # Пропускаем JSON строки (они начинаются с { или [)
-        if value.startswith(('{', '[')):
-            return value
-        
-        # Используем parse_date из app.utils.date для парсинга дат
+    # JSON строки (начинаются с { или [) не трогаем — их закодирует кодек jsonb
+    if isinstance(value, str) and not value.startswith(('{', '[')):
         parsed_date = parse_date(value)
         if parsed_date is not None:
             return parsed_date
@@ -334,33 +882,113 @@ def _prepare_value(value, table: str = None, column: str = None):
     return value
 
 
-async def table_insert_async(table: str, data):
+# Кэш метаданных колонок для unnest-запросов: {table: {column: type}} и {table: {identity always колонки}}
+_table_column_types: Dict[str, Dict[str, str]] = {}
+_table_identity_columns: Dict[str, set] = {}
+
+
+async def _get_column_types(conn: asyncpg.Connection, table: str) -> Dict[str, str]:
+    """Возвращает типы колонок таблицы (format_type без модификаторов), кэшируется на процесс."""
+    cached = _table_column_types.get(table)
+    if cached is not None:
+        return cached
+    rows = await conn.fetch(
+        """
+        SELECT attname, format_type(atttypid, NULL) AS type_name, attidentity = 'a' AS identity_always
+        FROM pg_attribute
+        WHERE attrelid = $1::regclass AND attnum > 0 AND NOT attisdropped
+        """,
+        table,
+    )
+    types = {r['attname']: r['type_name'] for r in rows}
+    _table_identity_columns[table] = {r['attname'] for r in rows if r['identity_always']}
+    _table_column_types[table] = types
+    return types
+
+
+def _unnest_args(columns: List[str], column_types: Dict[str, str], table: str) -> str:
+    """'$1::bigint[], $2::jsonb[], ...' для SELECT * FROM unnest(...)."""
+    args = []
+    for i, col in enumerate(columns):
+        col_type = column_types.get(col)
+        if not col_type:
+            raise ValueError(f"Колонка {col} не найдена в таблице {table}")
+        if col_type.endswith('[]'):
+            raise ValueError(f"Колонка-массив {table}.{col} не поддерживается в unnest")
+        args.append(f'${i+1}::{col_type}[]')
+    return ', '.join(args)
+
+
+def _split_table_name(table: str):
+    """'schema.table' -> ('table', 'schema'); 'table' -> ('table', None)."""
+    if '.' in table:
+        schema_name, table_name = table.split('.', 1)
+        return table_name, schema_name
+    return table, None
+
+
+async def _insert_many(conn: asyncpg.Connection, table: str, data: List[dict], returning: bool):
+    """
+    Множественная вставка одним запросом.
+    - returning=False: COPY (copy_records_to_table), без возврата строк
+    - returning=True: INSERT ... SELECT FROM unnest($1::type[], ...) RETURNING *
+    Колонки-массивы не раскладываются через unnest — для них построчная вставка в транзакции.
+    """
+    columns = list(data[0].keys())
+    # Преобразуем значения для корректной работы с JSONB и датами
+    records = [tuple(_prepare_value(row[col]) for col in columns) for row in data]
+    
+    if not returning:
+        table_name, schema_name = _split_table_name(table)
+        await conn.copy_records_to_table(
+            table_name, records=records, columns=columns, schema_name=schema_name,
+        )
+        return []
+    
+    column_types = await _get_column_types(conn, table)
+    types = [column_types.get(col) for col in columns]
+    
+    if all(t and not t.endswith('[]') for t in types):
+        arrays = [list(col_values) for col_values in zip(*records)]
+        query = (
+            f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"SELECT * FROM unnest({_unnest_args(columns, column_types, table)}) RETURNING *"
+        )
+        rows = await conn.fetch(query, *arrays)
+        return [dict(row) for row in rows]
+    
+    placeholders = ', '.join([f'${i+1}' for i in range(len(columns))])
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) RETURNING *"
+    results = []
+    async with conn.transaction():
+        for values in records:
+            result = await conn.fetchrow(query, *values)
+            if result:
+                results.append(dict(result))
+    return results
+
+
+async def table_insert_async(table: str, data, returning: bool = True):
     """
     Асинхронно вставляет данные в таблицу.
+    
+    Args:
+        table: Имя таблицы
+        data: dict (одна запись) или list of dicts (пакет, ключи берутся из первой записи)
+        returning: Для пакета — вернуть вставленные строки (unnest + RETURNING *).
+            False — быстрая вставка через COPY, возвращается пустой список.
     """
+    if isinstance(data, list) and not data:
+        return []
+    
+    _mark_write()
     pool = await get_connection_pool()
     
-    async with pool.acquire() as conn:
+    async with _acquire(pool, "insert", table, write=True) as (conn, timer):
         try:
-            if isinstance(data, list) and len(data) > 0:
-                # Множественная вставка
-                if not data:
-                    return []
-                
-                columns = list(data[0].keys())
-                placeholders = ', '.join([f'${i+1}' for i in range(len(columns))])
-                query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) RETURNING *"
-                
-                results = []
-                async with conn.transaction():
-                    for row in data:
-                        # Преобразуем значения для корректной работы с JSONB и датами
-                        values = [_prepare_value(row[col], table=table, column=col) for col in columns]
-                        result = await conn.fetchrow(query, *values)
-                        if result:
-                            results.append(dict(result))
-                
-                return results
+            if isinstance(data, list):
+                timer.rows = len(data)
+                return await _insert_many(conn, table, data, returning)
             else:
                 # Одна запись
                 if isinstance(data, dict):
@@ -368,8 +996,9 @@ async def table_insert_async(table: str, data):
                     placeholders = ', '.join([f'${i+1}' for i in range(len(columns))])
                     query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) RETURNING *"
                     # Преобразуем значения для корректной работы с JSONB и датами
-                    values = [_prepare_value(data[col], table=table, column=col) for col in columns]
+                    values = [_prepare_value(data[col]) for col in columns]
                     result = await conn.fetchrow(query, *values)
+                    timer.rows = 1 if result else 0
                     return [dict(result)] if result else []
                 else:
                     raise ValueError("data должен быть dict или list of dicts")
@@ -383,9 +1012,10 @@ async def table_update_async(table: str, data: dict, filters: dict):
     """
     Асинхронно обновляет записи в таблице.
     """
+    _mark_write()
     pool = await get_connection_pool()
     
-    async with pool.acquire() as conn:
+    async with _acquire(pool, "update", table, write=True) as (conn, timer):
         try:
             if not filters:
                 raise ValueError("filters обязателен для UPDATE")
@@ -397,7 +1027,7 @@ async def table_update_async(table: str, data: dict, filters: dict):
             # SET часть - преобразуем значения для корректной работы с JSONB и датами
             for k, v in data.items():
                 set_clauses.append(f"{k} = ${param_counter}")
-                params.append(_prepare_value(v, table=table, column=k))
+                params.append(_prepare_value(v))
                 param_counter += 1
             
             # WHERE часть
@@ -414,6 +1044,7 @@ async def table_update_async(table: str, data: dict, filters: dict):
             
             query = f"UPDATE {table} SET {', '.join(set_clauses)} WHERE {' AND '.join(conditions)} RETURNING *"
             rows = await conn.fetch(query, *params)
+            timer.rows = len(rows)
             
             return [dict(row) for row in rows]
             
@@ -430,9 +1061,10 @@ async def table_upsert_async(table: str, data, filters: dict = None):
         return await table_update_async(table, data, filters)
     else:
         # UPSERT (ON CONFLICT)
+        _mark_write()
         pool = await get_connection_pool()
         
-        async with pool.acquire() as conn:
+        async with _acquire(pool, "upsert", table, write=True) as (conn, timer):
             try:
                 if isinstance(data, dict):
                     columns = list(data.keys())
@@ -446,8 +1078,9 @@ async def table_upsert_async(table: str, data, filters: dict = None):
                         RETURNING *
                     """
                     # Преобразуем значения для корректной работы с JSONB и датами
-                    values = [_prepare_value(data[col], table=table, column=col) for col in columns]
+                    values = [_prepare_value(data[col]) for col in columns]
                     result = await conn.fetchrow(query, *values)
+                    timer.rows = 1 if result else 0
                     return [dict(result)] if result else []
                 else:
                     raise ValueError("data должен быть dict для upsert")
@@ -457,14 +1090,105 @@ async def table_upsert_async(table: str, data, filters: dict = None):
                 raise DatabaseError(f"Ошибка выполнения запроса: {e}")
 
 
+async def table_upsert_many_async(
+    table: str,
+    rows: List[dict],
+    conflict_cols,
+    update_cols=None,
+    conflict_where: Optional[str] = None,
+    chunk_size: int = 1000,
+) -> Dict[str, int]:
+    """
+    Пакетный UPSERT: один запрос INSERT ... SELECT FROM unnest(...) ON CONFLICT на чанк.
+    
+    Строки, у которых значения update_cols не изменились, не перезаписываются
+    (DO UPDATE ... WHERE ... IS DISTINCT FROM). При повторе ключа в rows побеждает последняя строка.
+    Если в rows передана GENERATED ALWAYS колонка (например id), добавляется OVERRIDING SYSTEM VALUE.
+    
+    Args:
+        table: Имя таблицы
+        rows: Список словарей с одинаковым набором ключей (берётся из первой строки)
+        conflict_cols: Колонки уникального ключа/индекса для ON CONFLICT
+        update_cols: Колонки для обновления; None — все колонки rows, кроме conflict_cols;
+            пустой список — ON CONFLICT DO NOTHING
+        conflict_where: Предикат частичного уникального индекса (например "type_id = 2")
+        chunk_size: Размер чанка (строк на запрос)
+    
+    Returns:
+        {'inserted': n, 'updated': n, 'unchanged': n}
+    """
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    if not rows:
+        return counts
+    
+    conflict_cols = list(conflict_cols)
+    columns = list(rows[0].keys())
+    if update_cols is None:
+        update_cols = [c for c in columns if c not in conflict_cols]
+    else:
+        update_cols = list(update_cols)
+    
+    # Дедупликация по ключу конфликта: один запрос не может обновить строку дважды
+    unique_rows = {tuple(row[c] for c in conflict_cols): row for row in rows}
+    records = [tuple(_prepare_value(row[col]) for col in columns) for row in unique_rows.values()]
+    
+    _mark_write()
+    pool = await get_connection_pool()
+    
+    async with _acquire(pool, "upsert_many", table, write=True) as (conn, timer):
+        timer.rows = len(records)
+        try:
+            column_types = await _get_column_types(conn, table)
+            overriding = (
+                " OVERRIDING SYSTEM VALUE"
+                if _table_identity_columns.get(table, set()) & set(columns) else ""
+            )
+            conflict_target = f"({', '.join(conflict_cols)})"
+            if conflict_where:
+                conflict_target += f" WHERE {conflict_where}"
+            if update_cols:
+                set_clause = ', '.join([f"{c} = EXCLUDED.{c}" for c in update_cols])
+                current = ', '.join([f"target.{c}" for c in update_cols])
+                incoming = ', '.join([f"EXCLUDED.{c}" for c in update_cols])
+                action = (
+                    f"DO UPDATE SET {set_clause} "
+                    f"WHERE ROW({current}) IS DISTINCT FROM ROW({incoming})"
+                )
+            else:
+                action = "DO NOTHING"
+            
+            query = (
+                f"INSERT INTO {table} AS target ({', '.join(columns)}){overriding} "
+                f"SELECT * FROM unnest({_unnest_args(columns, column_types, table)}) "
+                f"ON CONFLICT {conflict_target} {action} "
+                f"RETURNING (xmax = 0) AS inserted"
+            )
+            
+            for i in range(0, len(records), chunk_size):
+                chunk = records[i:i + chunk_size]
+                arrays = [list(col_values) for col_values in zip(*chunk)]
+                result = await conn.fetch(query, *arrays)
+                inserted = sum(1 for r in result if r['inserted'])
+                counts['inserted'] += inserted
+                counts['updated'] += len(result) - inserted
+                counts['unchanged'] += len(chunk) - len(result)
+            
+            return counts
+            
+        except Exception as e:
+            logger.error(f"Ошибка выполнения пакетного UPSERT в таблицу {table}: {e}")
+            raise DatabaseError(f"Ошибка выполнения запроса: {e}")
+
+
 async def table_delete_async(table: str, filters: dict = None, neq_filters: dict = None, 
                              in_filters: dict = None):
     """
     Асинхронно удаляет записи из таблицы.
     """
+    _mark_write()
     pool = await get_connection_pool()
     
-    async with pool.acquire() as conn:
+    async with _acquire(pool, "delete", table, write=True) as (conn, timer):
         try:
             conditions = []
             params = []
@@ -491,18 +1215,19 @@ async def table_delete_async(table: str, filters: dict = None, neq_filters: dict
             # Фильтры IN
             if in_filters:
                 for k, v in in_filters.items():
-                    if v is None or (isinstance(v, list) and len(v) == 0):
+                    in_condition = _in_condition(k, v, param_counter)
+                    if in_condition is None:
                         continue
-                    placeholders = ', '.join([f'${i+param_counter}' for i in range(len(v))])
-                    conditions.append(f"{k} IN ({placeholders})")
-                    params.extend(v)
-                    param_counter += len(v)
+                    conditions.append(in_condition[0])
+                    params.append(in_condition[1])
+                    param_counter += 1
             
             if not conditions:
                 raise ValueError("Необходимо указать хотя бы один фильтр для DELETE")
             
             query = f"DELETE FROM {table} WHERE {' AND '.join(conditions)} RETURNING *"
             rows = await conn.fetch(query, *params)
+            timer.rows = len(rows)
             
             return [dict(row) for row in rows]
             
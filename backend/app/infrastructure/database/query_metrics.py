@@ -0,0 +1,179 @@
+"""
+Метрики запросов к PostgreSQL в памяти процесса.
+
+Для каждой RPC-функции и таблицы копятся гистограммы ожидания соединения
+(pool.acquire) и времени выполнения, число строк и байт JSON/JSONB в ответе.
+Запросы дольше Config.DB_SLOW_QUERY_MS пишутся в лог. Данные — на процесс
+(у каждого gunicorn-воркера свои), сбрасываются при рестарте.
+"""
+import time
+from typing import Dict, Tuple
+
+from app.config import Config
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+# Верхние границы корзин гистограмм, мс (последняя корзина — всё, что больше)
+BUCKETS_MS: Tuple[float, ...] = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Гистограмма длительностей с фиксированными корзинами."""
+
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        idx = len(BUCKETS_MS)
+        for i, bound in enumerate(BUCKETS_MS):
+            if value_ms <= bound:
+                idx = i
+                break
+        self.counts[idx] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def percentile(self, q: float) -> float:
+        """Оценка перцентиля по верхней границе корзины (мс)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": {
+                **{f"le_{int(b)}": n for b, n in zip(BUCKETS_MS, self.counts)},
+                "inf": self.counts[-1],
+            },
+        }
+
+
+class QueryStats:
+    """Накопленная статистика одного ключа (rpc:<функция> или <операция>:<таблица>)."""
+
+    __slots__ = ("acquire", "execution", "errors", "rows", "payload_bytes")
+
+    def __init__(self):
+        self.acquire = Histogram()
+        self.execution = Histogram()
+        self.errors = 0
+        self.rows = 0
+        self.payload_bytes = 0
+
+    def to_dict(self) -> dict:
+        calls = self.execution.count
+        return {
+            "calls": calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "avg_rows": round(self.rows / calls, 1) if calls else 0,
+            "payload_bytes": self.payload_bytes,
+            "avg_payload_bytes": round(self.payload_bytes / calls) if calls else 0,
+            "acquire": self.acquire.to_dict(),
+            "execution": self.execution.to_dict(),
+        }
+
+
+_stats: Dict[str, QueryStats] = {}
+_started_at = time.time()
+
+
+class QueryTimer:
+    """
+    Замер одного запроса: создаётся до pool.acquire(), acquired() — после получения
+    соединения, finish() — после выполнения. rows/payload_bytes заполняет вызывающий код.
+    """
+
+    __slots__ = ("key", "started", "acquired_at", "rows", "payload_bytes", "failed")
+
+    def __init__(self, kind: str, name: str):
+        self.key = f"{kind}:{name}"
+        self.started = time.perf_counter()
+        self.acquired_at = None
+        self.rows = 0
+        self.payload_bytes = 0
+        self.failed = False
+
+    def acquired(self) -> None:
+        self.acquired_at = time.perf_counter()
+
+    def finish(self) -> None:
+        now = time.perf_counter()
+        acquired_at = self.acquired_at if self.acquired_at is not None else now
+        acquire_ms = (acquired_at - self.started) * 1000
+        execution_ms = (now - acquired_at) * 1000
+
+        stats = _stats.get(self.key)
+        if stats is None:
+            stats = _stats[self.key] = QueryStats()
+        stats.acquire.observe(acquire_ms)
+        stats.execution.observe(execution_ms)
+        stats.rows += self.rows
+        stats.payload_bytes += self.payload_bytes
+        if self.failed:
+            stats.errors += 1
+
+        if Config.DB_SLOW_QUERY_MS and execution_ms >= Config.DB_SLOW_QUERY_MS:
+            logger.warning(
+                "slow_query key=%s execution_ms=%.1f acquire_ms=%.1f rows=%s payload_bytes=%s",
+                self.key,
+                execution_ms,
+                acquire_ms,
+                self.rows,
+                self.payload_bytes,
+                extra={
+                    "query_key": self.key,
+                    "execution_ms": execution_ms,
+                    "acquire_ms": acquire_ms,
+                    "rows": self.rows,
+                    "payload_bytes": self.payload_bytes,
+                },
+            )
+
+
+def get_query_metrics(sort_by: str = "total_ms") -> dict:
+    """
+    Снимок метрик для админского эндпоинта.
+    sort_by: total_ms (суммарное время выполнения), p95_ms, calls, acquire_ms (суммарное ожидание пула).
+    """
+    sort_keys = {
+        "total_ms": lambda s: s.execution.total_ms,
+        "p95_ms": lambda s: s.execution.percentile(0.95),
+        "calls": lambda s: s.execution.count,
+        "acquire_ms": lambda s: s.acquire.total_ms,
+    }
+    key_fn = sort_keys.get(sort_by, sort_keys["total_ms"])
+    items = sorted(_stats.items(), key=lambda kv: key_fn(kv[1]), reverse=True)
+    return {
+        "since": _started_at,
+        "slow_query_ms": Config.DB_SLOW_QUERY_MS,
+        "buckets_ms": list(BUCKETS_MS),
+        "queries": {key: stats.to_dict() for key, stats in items},
+    }
+
+
+def reset_query_metrics() -> None:
+    """Сбрасывает накопленные метрики."""
+    global _started_at
+    _stats.clear()
+    _started_at = time.time()
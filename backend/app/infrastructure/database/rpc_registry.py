@@ -0,0 +1,92 @@
+"""
+Реестр RPC-функций PostgreSQL: только чтение / изменение данных.
+
+Функции из READ_ONLY_RPCS вызываются без явной транзакции (один SELECT и так
+выполняется атомарно) и могут направляться на реплику чтения. Всё, что не
+зарегистрировано как read-only, считается изменяющим данные.
+"""
+from typing import Dict, List
+
+# Функции, которые только читают данные
+READ_ONLY_RPCS = frozenset({
+    "check_operations_access",
+    "check_resource_access",
+    "check_transactions_access",
+    "get_admin_data",
+    "get_admin_support_messages",
+    "get_all_assets",
+    "get_all_portfolios_with_assets_and_history",
+    "get_asset_detail_for_user",
+    "get_asset_in_all_portfolios",
+    "get_asset_splits",
+    "get_cash_operations",
+    "get_dashboard_data_complete",
+    "get_missed_payouts",
+    "get_portfolio_asset_daily_values",
+    "get_portfolio_asset_detail",
+    "get_portfolio_asset_meta",
+    "get_portfolio_assets",
+    "get_portfolio_payout_positions",
+    "get_portfolio_transactions",
+    "get_portfolio_value_history",
+    "get_reference_asset_meta",
+    "get_reference_cache_payload",
+    "get_transactions",
+    "get_user_portfolios",
+    "get_user_portfolios_analytics",
+})
+
+# Функции, изменяющие данные (всегда в транзакции на основной БД)
+MUTATING_RPCS = frozenset({
+    "apply_operations_batch",
+    "batch_create_portfolio_assets",
+    "check_missed_payouts",
+    "check_missed_payouts_for_portfolio",
+    "check_missed_payouts_for_user",
+    "clear_portfolio_full",
+    "create_portfolio_asset",
+    "delete_operations_batch",
+    "delete_portfolio_asset",
+    "delete_transactions_batch",
+    "get_next_pending_task",  # FOR UPDATE SKIP LOCKED + смена статуса
+    "move_portfolio_asset",
+    "refresh_portfolio_assets_and_daily_values",
+    "refresh_portfolio_tree_values_batch",
+    "update_asset_latest_prices_batch",
+    "update_assets_daily_values",
+    "update_operations_batch",
+    "update_portfolio_asset",
+    "update_task_status",
+    "upsert_asset_prices",
+})
+
+
+def is_read_only_rpc(fn_name: str) -> bool:
+    """True, если функция зарегистрирована как только читающая."""
+    return fn_name in READ_ONLY_RPCS
+
+
+def find_registry_mismatches(volatility: Dict[str, str]) -> Dict[str, List[str]]:
+    """
+    Сверяет реестр с pg_proc.provolatile.
+
+    Args:
+        volatility: {имя функции: provolatile} ('i' — IMMUTABLE, 's' — STABLE, 'v' — VOLATILE)
+
+    Returns:
+        missing — зарегистрированные функции, которых нет в БД;
+        volatile_read_only — read-only функции, объявленные VOLATILE (работают,
+            но планировщик не может считать их чистыми — стоит объявить STABLE);
+        stable_mutating — изменяющие функции, объявленные STABLE/IMMUTABLE
+            (запись в них невозможна — реестр, скорее всего, ошибается).
+    """
+    registered = READ_ONLY_RPCS | MUTATING_RPCS
+    return {
+        "missing": sorted(name for name in registered if name not in volatility),
+        "volatile_read_only": sorted(
+            name for name in READ_ONLY_RPCS if volatility.get(name) == "v"
+        ),
+        "stable_mutating": sorted(
+            name for name in MUTATING_RPCS if volatility.get(name) in ("s", "i")
+        ),
+    }
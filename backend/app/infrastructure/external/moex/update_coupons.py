@@ -5,7 +5,12 @@
 import asyncio
 from datetime import date, datetime
 
-from app.infrastructure.database.postgres_async import db_select, db_update, get_connection_pool
+from app.infrastructure.database.postgres_async import (
+    db_select,
+    db_update,
+    get_connection_pool,
+    table_stream_async,
+)
 from tqdm.asyncio import tqdm_asyncio
 from app.infrastructure.external.moex.client import (
     MOEX_HTTP_PER_HOST_LIMIT,
@@ -249,15 +254,13 @@ async def update_all_coupons(show_progress: bool | None = None):
     logger.info("coupons_bonds_count count=%s", len(bonds))
 
     logger.info("coupons_load_existing_payouts")
-    existing_payouts = await db_select(
+    existing_keys = set()
+    async for payout in table_stream_async(
         "asset_payouts",
-        "asset_id, record_date, payment_date, value, type_id",
+        "asset_id, record_date, payment_date, type_id",
         in_filters={"type_id": [PAYOUT_TYPE_COUPON_ID, PAYOUT_TYPE_AMORTIZATION_ID]},
-        limit=None
-    )
-    
-    existing_keys = set()
-    for payout in existing_payouts:
+        batch_size=20000,
+    ):
         p_type = PAYOUT_CODE_BY_ID.get(payout.get("type_id"), "coupon")
         pd = payout.get("payment_date")
         rd = payout.get("record_date")
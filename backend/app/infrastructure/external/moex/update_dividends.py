@@ -13,7 +13,7 @@ from tqdm import tqdm
 from app.infrastructure.database.postgres_async import (
     table_select_async,
     table_insert_async,
-    table_update_async,
+    table_upsert_many_async,
     table_delete_async,
 )
 from app.core.reference_logging import get_reference_logger, reference_progress_enabled
@@ -637,19 +637,7 @@ async def update_forecasts(show_progress: bool | None = None):
         if not payout_row_changed(existing, new_payout):
             continue
 
-        rd = existing["record_date"]
-        filters = {"asset_id": merged["asset_id"], "record_date": rd, "type_id": PAYOUT_TYPE_DIVIDEND_ID}
-        payouts_to_update.append(
-            (
-                filters,
-                {
-                    "value": new_payout["value"],
-                    "dividend_yield": new_payout["dividend_yield"],
-                    "last_buy_date": new_payout["last_buy_date"],
-                    "payment_date": new_payout["payment_date"],
-                },
-            )
-        )
+        payouts_to_update.append({**new_payout, "id": existing["id"], "record_date": existing["record_date"]})
 
     added_count = 0
     updated_count = 0
@@ -658,20 +646,18 @@ async def update_forecasts(show_progress: bool | None = None):
 
     if payouts_to_update:
         logger.info(f"Обновление записей с изменившимися полями: {len(payouts_to_update)}...")
-        upd_iter = tqdm(
-            payouts_to_update,
-            desc="Обновление БД",
-            unit="стр",
-            disable=not show_progress,
-            leave=False,
-            dynamic_ncols=True,
-        )
-        for filters, data in upd_iter:
-            try:
-                rows = await table_update_async("asset_payouts", data, filters)
-                updated_count += len(rows)
-            except Exception as e:
-                logger.warning("Ошибка UPDATE asset_payouts %s: %s", filters, e)
+        # Строки уже есть в БД — UPSERT по id сводится к пакетному UPDATE чанками
+        try:
+            counts = await table_upsert_many_async(
+                "asset_payouts",
+                payouts_to_update,
+                conflict_cols=("id",),
+                update_cols=("value", "dividend_yield", "last_buy_date", "payment_date"),
+                chunk_size=BATCH_SIZE,
+            )
+            updated_count += counts["updated"]
+        except Exception as e:
+            logger.warning("Ошибка UPDATE asset_payouts (%s строк): %s", len(payouts_to_update), e)
 
     if payouts_to_insert:
         _before_ins = len(payouts_to_insert)
@@ -695,7 +681,7 @@ async def update_forecasts(show_progress: bool | None = None):
             batch = payouts_to_insert[i : i + BATCH_SIZE]
             batch_num = i // BATCH_SIZE + 1
             try:
-                await table_insert_async("asset_payouts", batch)
+                await table_insert_async("asset_payouts", batch, returning=False)
                 logger.debug(f"Вставлен пакет {batch_num} ({len(batch)} записей)")
                 added_count += len(batch)
             except Exception as e:
@@ -7,7 +7,7 @@ from tqdm import tqdm
 from app.infrastructure.database.postgres_async import (
     table_select_async,
     table_insert_async,
-    table_update_async,
+    table_upsert_many_async,
     table_delete_async
 )
 from app.infrastructure.external.moex.client import (
@@ -144,33 +144,63 @@ def resolve_quote_asset_id(currency: Optional[str], currency_map: Dict[str, int]
 #  Вставка/обновление
 # ---------------------------------------------------------------------------
 
-async def upsert_asset(asset, existing_assets) -> Tuple[str, List[str]]:
-    """Returns (status, differences)  where status is inserted/updated/no_change."""
+_ASSET_UPDATE_COLS = ("asset_type_id", "name", "properties", "quote_asset_id")
+
+
+def plan_asset_upsert(asset, existing_assets, global_by_ticker) -> Tuple[str, Optional[dict], List[str]]:
+    """
+    Сравнивает актив MOEX с БД без запросов.
+    Returns (status, row, differences): status — inserted/updated/no_change;
+    row — строка для вставки (inserted) или полная строка с id для UPSERT (updated).
+    """
     ticker = asset["ticker"].upper()
     existing = existing_assets.get(ticker)
 
+    if not existing:
+        # Глобальный актив с тем же тикером, но не из MOEX (source != moex)
+        existing = global_by_ticker.get(ticker)
+        if existing:
+            existing = {**existing, "properties": parse_json_properties(existing.get("properties"))}
+
     if existing:
         needs_update, update_data, diffs = compare_assets(existing, asset)
         if needs_update:
-            await table_update_async("assets", update_data, {"id": existing["id"]})
-            return "updated", diffs
-        return "no_change", []
+            row = {
+                "id": existing["id"],
+                "ticker": ticker,
+                "user_id": None,
+                **{col: update_data.get(col, existing.get(col)) for col in _ASSET_UPDATE_COLS},
+            }
+            return "updated", row, diffs
+        return "no_change", None, []
+
+    return "inserted", asset, []
 
-    dup_check = await table_select_async(
-        "assets", "id, ticker, asset_type_id, name, properties, quote_asset_id",
-        filters={"ticker": ticker, "user_id": None}, limit=1,
+
+async def _load_global_assets_by_ticker(tickers: List[str]) -> Dict[str, dict]:
+    """Глобальные активы (user_id IS NULL) по тикерам одним запросом; на тикер — запись с минимальным id."""
+    if not tickers:
+        return {}
+    rows = await table_select_async(
+        "assets", "id, ticker, asset_type_id, name, properties, quote_asset_id, user_id",
+        in_filters={"ticker": tickers}, order="id", limit=None,
     )
-    if dup_check:
-        dup = dup_check[0]
-        dup["properties"] = parse_json_properties(dup.get("properties"))
-        needs_update, update_data, diffs = compare_assets(dup, asset)
-        if needs_update:
-            await table_update_async("assets", update_data, {"id": dup["id"]})
-            return "updated", diffs
-        return "no_change", []
+    out: Dict[str, dict] = {}
+    for r in rows:
+        if r.get("user_id") is not None or not r.get("ticker"):
+            continue
+        out.setdefault(r["ticker"].upper(), r)
+    return out
 
-    await table_insert_async("assets", asset)
-    return "inserted", []
+
+async def write_asset_changes(to_insert: List[dict], to_update: List[dict]) -> None:
+    """Записывает результат сверки: пакетная вставка новых и UPSERT изменённых по id."""
+    if to_update:
+        await table_upsert_many_async(
+            "assets", to_update, conflict_cols=("id",), update_cols=_ASSET_UPDATE_COLS,
+        )
+    if to_insert:
+        await table_insert_async("assets", to_insert, returning=False)
 
 
 # ---------------------------------------------------------------------------
@@ -452,6 +482,12 @@ async def _process_assets(rows, cols, i_SECID, i_SHORTNAME, i_NAME, i_ISIN, i_BO
     updated = 0
     no_change = 0
     skipped_no_prices = 0
+    to_insert: List[dict] = []
+    to_update: List[dict] = []
+
+    global_by_ticker = await _load_global_assets_by_ticker(
+        [t for t in ticker_records if t not in existing_assets]
+    )
 
     inserted_examples: List[str] = []
     updated_examples: List[str] = []
@@ -545,12 +581,14 @@ async def _process_assets(rows, cols, i_SECID, i_SHORTNAME, i_NAME, i_ISIN, i_BO
             "quote_asset_id": quote_asset_id,
         }
 
-        status, diffs = await upsert_asset(asset, existing_assets)
+        status, row, diffs = plan_asset_upsert(asset, existing_assets, global_by_ticker)
         if status == "inserted":
+            to_insert.append(row)
             inserted += 1
             if len(inserted_examples) < MAX_EXAMPLES:
                 inserted_examples.append(f"  {ticker} ({name}, {actual_type_name})")
         elif status == "updated":
+            to_update.append(row)
             updated += 1
             if len(updated_examples) < MAX_EXAMPLES:
                 updated_examples.append(f"  {ticker}: {', '.join(diffs)}")
@@ -561,6 +599,8 @@ async def _process_assets(rows, cols, i_SECID, i_SHORTNAME, i_NAME, i_ISIN, i_BO
 
     pbar.close()
 
+    await write_asset_changes(to_insert, to_update)
+
     # Итоги
     logger.info(
         f"[{market}] Добавлено: {inserted}, обновлено: {updated}, "
@@ -6,9 +6,8 @@ from datetime import date, datetime
 from typing import Dict, List, Optional, Tuple
 
 from app.infrastructure.database.postgres_async import (
-    table_insert_async,
-    table_select_async,
-    table_update_async,
+    table_stream_async,
+    table_upsert_many_async,
 )
 from app.infrastructure.external.moex.client import create_moex_session, fetch_json
 from app.infrastructure.external.moex.urls import MOEX_STOCK_SPLITS_JSON
@@ -39,10 +38,6 @@ def _parse_trade_date(raw) -> Optional[date]:
     return _as_date_field(raw)
 
 
-def _split_pair_key(asset_id: int, trade_date: date) -> Tuple[int, str]:
-    return (asset_id, trade_date.isoformat())
-
-
 def _build_ticker_map(assets: list) -> Dict[str, int]:
     out: Dict[str, int] = {}
     for a in assets:
@@ -86,10 +81,6 @@ def _parse_splits_rows(data: dict) -> List[Tuple[str, date, int, int]]:
     return out
 
 
-def _ratios_equal(a, b, c, d) -> bool:
-    return float(a) == float(c) and float(b) == float(d)
-
-
 async def update_splits_from_moex_async() -> int:
     """
     Загружает список сплитов MOEX и синхронизирует asset_splits для глобальных активов.
@@ -97,24 +88,13 @@ async def update_splits_from_moex_async() -> int:
     Returns:
         Число записей, затронутых вставкой или обновлением.
     """
-    assets = await table_select_async("assets", limit=200000)
-    ticker_map = _build_ticker_map(assets or [])
+    ticker_map: Dict[str, int] = {}
+    async for batch in table_stream_async("assets", "id, ticker, user_id", batches=True):
+        ticker_map.update(_build_ticker_map(batch))
     if not ticker_map:
         logger.warning("splits: нет глобальных активов (user_id IS NULL)")
         return 0
 
-    existing_rows = await table_select_async(
-        "asset_splits",
-        select="asset_id,trade_date,ratio_before,ratio_after",
-        limit=500000,
-    )
-    existing_by_key: Dict[Tuple[int, str], dict] = {}
-    for r in existing_rows or []:
-        td = _as_date_field(r.get("trade_date"))
-        if td is None:
-            continue
-        existing_by_key[_split_pair_key(int(r["asset_id"]), td)] = r
-
     async with create_moex_session() as session:
         data = await fetch_json(session, MOEX_STOCK_SPLITS_JSON, max_attempts=3)
     if not data:
@@ -122,39 +102,29 @@ async def update_splits_from_moex_async() -> int:
         return 0
 
     parsed = _parse_splits_rows(data)
-    to_insert: List[dict] = []
-    updated_count = 0
+    rows: List[dict] = []
 
     for secid, trade_date, before, after in parsed:
         aid = ticker_map.get(secid)
         if aid is None:
             continue
-        key = _split_pair_key(aid, trade_date)
-        row = {
+        rows.append({
             "asset_id": aid,
             "trade_date": trade_date,
             "ratio_before": before,
             "ratio_after": after,
-        }
-        ex = existing_by_key.get(key)
-        if ex is None:
-            to_insert.append(row)
-            continue
-        if _ratios_equal(ex["ratio_before"], ex["ratio_after"], before, after):
-            continue
-        await table_update_async(
-            "asset_splits",
-            {"ratio_before": before, "ratio_after": after},
-            {"asset_id": aid, "trade_date": trade_date},
-        )
-        updated_count += 1
-
-    inserted_count = 0
-    if to_insert:
-        for i in range(0, len(to_insert), BATCH_SIZE):
-            batch = to_insert[i : i + BATCH_SIZE]
-            await table_insert_async("asset_splits", batch)
-            inserted_count += len(batch)
+        })
+
+    # Сверка одним UPSERT по PK (asset_id, trade_date): неизменённые строки не перезаписываются
+    counts = await table_upsert_many_async(
+        "asset_splits",
+        rows,
+        conflict_cols=("asset_id", "trade_date"),
+        update_cols=("ratio_before", "ratio_after"),
+        chunk_size=BATCH_SIZE,
+    )
+    inserted_count = counts["inserted"]
+    updated_count = counts["updated"]
 
     touched = inserted_count + updated_count
     logger.info(
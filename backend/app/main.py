@@ -87,19 +87,17 @@ async def startup_event():
     logger.info(f"Environment: {os.getenv('ENVIRONMENT', 'development')}")
     logger.info(f"Log level: {Config.LOG_LEVEL}")
     
-    # Подключение Redis (async — декораторы кэша; sync — общий справочник для всех воркеров)
+    # Подключение Redis (декораторы кэша и общий справочник для всех воркеров)
     from app.infrastructure.cache import init_redis
-    from app.infrastructure.cache.redis_client_sync import init_redis_sync
 
     await init_redis(Config.REDIS_URL)
-    init_redis_sync(Config.REDIS_URL)
 
     # Redis volume в Docker переживает рестарт контейнера: без сброса init_reference_data_async
     # видит старый reference:fingerprint и не вызывает get_reference_cache_payload — клиенты
     # получают устаревший справочник (например без currency_rates_to_rub после миграции SQL).
     from app.domain.services.reference_service import invalidate_reference_cache
 
-    invalidate_reference_cache()
+    await invalidate_reference_cache()
     logger.info("Кэш справочника очищен при старте; загрузка из БД в init_reference_data_async")
     
     # Опциональное обновление справочников (MOEX, дивиденды, купоны, сплиты, крипто)
@@ -112,7 +110,7 @@ async def startup_event():
         logger.info("Запуск обновления справочных данных (RUN_REFERENCE_UPDATES=1)...")
         await run_all_updates()
         from app.domain.services.reference_service import invalidate_reference_cache
-        invalidate_reference_cache()  # Сброс кеша для загрузки свежих валют и криптовалют
+        await invalidate_reference_cache()  # Сброс кеша для загрузки свежих валют и криптовалют
     
     # Инициализация справочных данных при старте (асинхронно с таймаутом)
     # Включает валюты (asset_type_id=7) и криптовалюты (asset_type_id=6) для операций
@@ -120,6 +118,10 @@ async def startup_event():
     await init_reference_data_async()
     await init_brokers_async()
 
+    # Сверка реестра read-only/изменяющих RPC с pg_proc.provolatile (только логирование)
+    from app.infrastructure.database.database_service import validate_rpc_registry
+    await validate_rpc_registry()
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -134,10 +136,8 @@ async def shutdown_event():
         logger.warning("Закрытие async-пула PostgreSQL: %s", e)
     
     from app.infrastructure.cache import close_redis
-    from app.infrastructure.cache.redis_client_sync import close_redis_sync
 
     await close_redis()
-    close_redis_sync()
 
 
 @app.get("/")
@@ -3,6 +3,7 @@ Helper функции для формирования стандартизиро
 Работает с FastAPI (возвращает dict вместо tuple).
 """
 from typing import Optional, Dict, Any, Union
+from fastapi import Response
 from app.constants import HTTPStatus
 
 
@@ -102,3 +103,41 @@ def forbidden_response(message: str = "Доступ запрещен") -> Dict[s
         error=message,
         status_code=HTTPStatus.FORBIDDEN
     )
+
+
+def make_etag(version: Optional[str]) -> Optional[str]:
+    """Строгий ETag из версии данных (fingerprint, штамп кэша); None — версии нет."""
+    return f'"{version}"' if version else None
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """
+    Совпадает ли If-None-Match с ETag (слабое сравнение, как требует RFC 9110:
+    префикс W/ не учитывается; поддерживаются списки через запятую и '*').
+    """
+    if not if_none_match or not etag:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def etag_headers(etag: Optional[str]) -> Dict[str, str]:
+    """
+    Заголовки ответа с ETag: клиент хранит ответ у себя (private — он зависит от пользователя)
+    и перед использованием перепроверяет его запросом с If-None-Match.
+    """
+    if not etag:
+        return {}
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def not_modified_response(etag: str) -> Response:
+    """Ответ 304 Not Modified без тела."""
+    return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=etag_headers(etag))
@@ -5,7 +5,7 @@
 """
 import asyncio
 from datetime import datetime, date
-from typing import Optional, Dict, List, Tuple, Callable, Awaitable
+from typing import Optional, Dict, Iterable, List, Set, Tuple, Callable, Awaitable
 
 from app.infrastructure.database.postgres_async import db_rpc
 from app.utils.date import parse_date as normalize_date, normalize_date_to_sql_date
@@ -14,18 +14,52 @@ from app.core.logging import get_logger
 logger = get_logger(__name__)
 
 
-async def _invalidate_all_dashboards() -> None:
-    """Invalidate all dashboard caches after price updates."""
+async def invalidate_asset_dashboards(asset_ids: List[int]) -> None:
+    """
+    Mark stale the dashboards of users holding updated assets (tag asset:<id>, see
+    dashboard_service._dashboard_cache_tags); served until recomputed in background.
+    Per-portfolio dashboard fragments carry the same tags and are dropped, so only the
+    portfolios holding these assets are re-queried.
+    Recently active users' dashboards are then warmed up (dashboard_service.warm_dashboards).
+    """
+    if not asset_ids:
+        return
     try:
-        from app.infrastructure.cache.redis_client import redis_available, redis_delete_pattern
-        if redis_available():
-            deleted = await redis_delete_pattern("dashboard:*")
-            if deleted:
-                logger.info(f"Cache: invalidated {deleted} dashboard keys after price update")
+        from app.infrastructure.cache.decorators import invalidate_tags
+        keys = await invalidate_tags(
+            *(f"asset:{asset_id}" for asset_id in asset_ids), stale=True, source="price_worker"
+        )
+        if keys:
+            logger.info(f"Cache: marked {len(keys)} dashboard keys stale after price update ({len(asset_ids)} assets)")
+            _schedule_dashboard_warmup(k.split(":", 1)[1] for k in keys if k.startswith("dashboard:"))
     except Exception as e:
         logger.debug(f"Cache invalidation skipped: {e}")
 
 
+_warmup_task: Optional[asyncio.Task] = None
+_warmup_pending: Set[str] = set()
+
+
+def _schedule_dashboard_warmup(user_ids: Iterable[str]) -> None:
+    """Warm-up runs in background; ids arriving while it runs are warmed in the next round."""
+    global _warmup_task
+    _warmup_pending.update(user_ids)
+    if _warmup_pending and (_warmup_task is None or _warmup_task.done()):
+        _warmup_task = asyncio.get_running_loop().create_task(_run_dashboard_warmup())
+
+
+async def _run_dashboard_warmup() -> None:
+    from app.domain.services.dashboard_service import warm_dashboards
+
+    while _warmup_pending:
+        user_ids = list(_warmup_pending)
+        _warmup_pending.clear()
+        try:
+            await warm_dashboards(user_ids)
+        except Exception as e:
+            logger.warning(f"Dashboard warm-up failed: {e}")
+
+
 def filter_new_prices(
     prices: List[Tuple[str, float]],
     asset_id: int,
@@ -121,11 +155,20 @@ async def update_latest_and_portfolios(
 ) -> None:
     """
     Обновляет asset_latest_prices и portfolio daily values
-    для списка обновлённых активов.
+    для списка обновлённых активов, затем помечает устаревшими дашборды их держателей.
     """
     if not updated_asset_ids:
         return
 
+    await _update_latest_and_portfolios(updated_asset_ids, asset_date_map, db_sem)
+    await invalidate_asset_dashboards(updated_asset_ids)
+
+
+async def _update_latest_and_portfolios(
+    updated_asset_ids: List[int],
+    asset_date_map: Dict[int, str],
+    db_sem: Optional[asyncio.Semaphore],
+) -> None:
     batch_size = 500
     for i in range(0, len(updated_asset_ids), batch_size):
         batch_ids = updated_asset_ids[i:i + batch_size]
@@ -170,6 +213,12 @@ async def run_worker_loop(
     """Общий цикл: обновление истории, затем today в цикле."""
     logger.info(f"{worker_name} запущен")
 
+    # Redis — для инвалидации и прогрева кэша дашбордов
+    from app.config import Config
+    from app.infrastructure.cache import init_redis
+
+    await init_redis(Config.REDIS_URL)
+
     try:
         logger.info(f"Начальное обновление истории ({worker_name})...")
         await update_history_fn()
@@ -180,8 +229,6 @@ async def run_worker_loop(
     while True:
         try:
             updated = await update_today_fn()
-            if updated:
-                await _invalidate_all_dashboards()
             logger.info(
                 f"[{worker_name}] Цикл обновления завершён "
                 f"(обновлено: {updated}), следующий через {interval_seconds // 60} мин"
@@ -199,7 +199,7 @@ async def update_history_prices() -> int:
     if asset_date_map:
         await update_latest_and_portfolios(list(asset_date_map.keys()), asset_date_map)
         try:
-            invalidate_reference_cache()
+            await invalidate_reference_cache()
             logger.debug("Справочник сброшен после догрузки истории курсов валют")
         except Exception as e:
             logger.warning("invalidate_reference_cache после истории курсов: %s", e)
@@ -256,7 +256,7 @@ async def update_today_prices() -> int:
     await update_latest_and_portfolios(updated_ids, asset_date_map)
 
     try:
-        invalidate_reference_cache()
+        await invalidate_reference_cache()
         logger.debug("Справочник сброшен после обновления курсов валют (currency_rates_to_rub)")
     except Exception as e:
         logger.warning("invalidate_reference_cache после курсов валют: %s", e)
@@ -26,6 +26,7 @@ from app.workers.base_price_worker import (
     filter_new_prices,
     batch_upsert_prices,
     update_latest_and_portfolios,
+    invalidate_asset_dashboards,
     run_worker_loop,
 )
 from app.utils.date import parse_date as normalize_date, normalize_date_to_sql_date
@@ -505,7 +506,8 @@ async def update_history_prices() -> int:
             async with db_sem:
                 return await db_rpc('update_portfolio_values_from_date', {
                     'p_portfolio_id': pid,
-                    'p_from_date': fdate
+                    'p_from_date': fdate,
+                    'p_refresh_tree': False
                 })
         
         update_tasks.append(update_portfolio_with_sem(portfolio_id, from_date))
@@ -530,6 +532,24 @@ async def update_history_prices() -> int:
         if error_count > 0:
             logger.warning(f"Ошибок при обновлении портфелей: {error_count}")
 
+        # 4. Итоги поддеревьев одним вызовом: общие предки пересчитываются один раз,
+        # а не параллельно из вызовов по каждому дочернему портфелю
+        tree_ids, tree_dates = [], []
+        for pid, r in zip(portfolio_dates, portfolio_results):
+            if not isinstance(r, Exception):
+                fdate = portfolio_dates[pid]
+                tree_ids.append(pid)
+                tree_dates.append(fdate.date() if isinstance(fdate, datetime) else fdate)
+        if tree_ids:
+            try:
+                async with db_sem:
+                    await db_rpc('refresh_portfolio_tree_values_batch', {
+                        'p_portfolio_ids': tree_ids,
+                        'p_from_dates': tree_dates
+                    })
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении итогов поддеревьев: {e}")
+
     return success_count
 
 
@@ -843,6 +863,8 @@ async def update_today_prices() -> int:
         except Exception as e:
             logger.error(f"Ошибка при обновлении портфелей: {e}", exc_info=True)
 
+    await invalidate_asset_dashboards(updated_ids)
+
     count = len(updated_ids)
     if count:
         logger.info(
@@ -90,7 +90,9 @@ async def process_import_task(task: dict) -> bool:
 
         result = await import_broker_portfolio(user_email, portfolio_id, broker_data, broker_id_int, api_key=broker_token)
 
-        await invalidate_cache("dashboard:{user_id}", user_id=user_id)
+        await invalidate_cache(
+            "dashboard:{user_id}", source="import_task", tags=("user:{user_id}",), user_id=user_id
+        )
 
         await update_task_status(
             task_id, TaskStatus.COMPLETED,
@@ -182,15 +184,12 @@ def run_worker():
     try:
         async def _runner():
             from app.infrastructure.cache import init_redis, close_redis
-            from app.infrastructure.cache.redis_client_sync import init_redis_sync, close_redis_sync
 
             await init_redis(Config.REDIS_URL)
-            init_redis_sync(Config.REDIS_URL)
             try:
                 await worker_loop()
             finally:
                 await close_redis()
-                close_redis_sync()
 
         asyncio.run(_runner())
     except KeyboardInterrupt:
@@ -13,6 +13,7 @@ from typing import Dict, List, Tuple
 from app.infrastructure.database.postgres_async import (
     db_select,
     get_connection_pool,
+    table_stream_async,
 )
 from app.utils.date import parse_date as normalize_date
 from app.domain.constants.payout_types import PAYOUT_TYPE_COUPON_ID
@@ -46,16 +47,13 @@ def calculate_accrued_coupon(
 
 
 async def load_coupon_schedules() -> Dict[int, List[Tuple[date, float]]]:
-    rows = await db_select(
+    schedules: Dict[int, List[Tuple[date, float]]] = {}
+    async for r in table_stream_async(
         "asset_payouts",
         "asset_id, payment_date, value",
         filters={"type_id": PAYOUT_TYPE_COUPON_ID},
         order="asset_id, payment_date",
-        limit=None,
-    )
-
-    schedules: Dict[int, List[Tuple[date, float]]] = {}
-    for r in rows:
+    ):
         aid = r["asset_id"]
         pd = r.get("payment_date")
         val = r.get("value")
@@ -95,25 +93,20 @@ async def backfill():
         print("No bonds with sufficient coupon data.")
         return
 
-    print("Loading asset_prices for bonds...")
+    print("Streaming asset_prices for bonds...")
     pool = await get_connection_pool()
 
     total_updated = 0
-
-    for i in range(0, len(bonds_with_coupons), 50):
-        chunk_ids = bonds_with_coupons[i:i + 50]
-
-        async with pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT asset_id, trade_date, accrued_coupon
-                FROM asset_prices
-                WHERE asset_id = ANY($1)
-                ORDER BY asset_id, trade_date
-                """,
-                chunk_ids,
-            )
-
+    total_scanned = 0
+
+    # Курсор читает цены пачками; UPDATE идут через другое соединение пула
+    async for rows in table_stream_async(
+        "asset_prices",
+        "asset_id, trade_date, accrued_coupon",
+        in_filters={"asset_id": bonds_with_coupons},
+        batch_size=BATCH_SIZE * 5,
+        batches=True,
+    ):
         updates: List[Tuple[float, int, date]] = []
         for row in rows:
             aid = row["asset_id"]
@@ -138,8 +131,8 @@ async def backfill():
                     )
             total_updated += len(updates)
 
-        processed = min(i + 50, len(bonds_with_coupons))
-        print(f"  Processed {processed}/{len(bonds_with_coupons)} bonds, updated {total_updated} rows so far")
+        total_scanned += len(rows)
+        print(f"  Scanned {total_scanned} prices, updated {total_updated} rows so far")
 
     print(f"\nDone! Total rows updated: {total_updated}")
 
@@ -0,0 +1,53 @@
+"""
+Крупнейшие ключи кэша в Redis (MEMORY USAGE) с TTL.
+
+Запуск:
+    python -m scripts.cache_top_keys
+    python -m scripts.cache_top_keys --pattern "dashboard:*" --limit 50
+
+Шаблон — без префикса кэша (cv:). Метрики попаданий и размеров по шаблонам ключей —
+GET /admin/cache-metrics.
+"""
+import argparse
+import asyncio
+import heapq
+import os
+import sys
+
+# Добавляем корень backend в path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import Config
+from app.infrastructure.cache.redis_client import close_redis, init_redis, redis_scan_memory
+
+
+async def top_keys(pattern: str, limit: int) -> None:
+    if not await init_redis(Config.REDIS_URL):
+        print("Redis недоступен (REDIS_URL)")
+        sys.exit(1)
+    try:
+        total_keys = 0
+        total_bytes = 0
+        top = []
+        async for key, size, ttl in redis_scan_memory(pattern):
+            total_keys += 1
+            total_bytes += size
+            if len(top) < limit:
+                heapq.heappush(top, (size, key, ttl))
+            else:
+                heapq.heappushpop(top, (size, key, ttl))
+    finally:
+        await close_redis()
+
+    print(f"{'bytes':>12}  {'ttl':>7}  key")
+    for size, key, ttl in sorted(top, reverse=True):
+        print(f"{size:>12}  {ttl:>7}  {key}")
+    print(f"\nКлючей: {total_keys}, всего {total_bytes / 1024 / 1024:.1f} МБ (шаблон {pattern})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Крупнейшие ключи кэша в Redis")
+    parser.add_argument("--pattern", default="*", help="шаблон ключей без префикса cv: (по умолчанию *)")
+    parser.add_argument("--limit", type=int, default=20, help="сколько ключей показать")
+    args = parser.parse_args()
+    asyncio.run(top_keys(args.pattern, args.limit))
@@ -254,6 +254,21 @@ def mock_table_delete_async():
         yield mock
 
 
+# ============================================================================
+# Redis Fixtures
+# ============================================================================
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """Redis кэша в памяти (fakeredis, со скриптами Lua) вместо реального подключения."""
+    import fakeredis
+    from app.infrastructure.cache import redis_client
+
+    server = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(redis_client, "_redis", server)
+    return server
+
+
 # ============================================================================
 # Repository Fixtures
 # ============================================================================
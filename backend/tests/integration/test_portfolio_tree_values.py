@@ -0,0 +1,143 @@
+"""
+Интеграционные тесты итогов поддеревьев (portfolio_tree_daily_values) на тестовой БД.
+
+Итоги из SQL (refresh_portfolio_tree_values_batch) сравниваются с суммированием
+истории детей на бэкенде (build_portfolio_hierarchy без tree_history).
+"""
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from app.domain.services.dashboard_service import build_portfolio_hierarchy
+
+DATABASE_DIR = Path(__file__).resolve().parents[3] / "database"
+FIELDS = ("total_value", "total_invested", "total_payouts", "total_pnl", "balance")
+
+
+@pytest.fixture
+async def db_conn(test_db_config):
+    """Соединение с тестовой БД в транзакции, которая откатывается после теста."""
+    asyncpg = pytest.importorskip("asyncpg")
+    try:
+        conn = await asyncpg.connect(**test_db_config)
+    except Exception as e:
+        pytest.skip(f"Тестовая БД недоступна: {e}")
+    tx = conn.transaction()
+    await tx.start()
+    try:
+        for name in ("refresh_portfolio_tree_values.sql", "migrate_portfolio_tree_daily_values.sql"):
+            await conn.execute((DATABASE_DIR / name).read_text(encoding="utf-8"))
+        yield conn
+    finally:
+        await tx.rollback()
+        await conn.close()
+
+
+async def _create_tree(conn) -> dict:
+    """Корень R (лист A и B с листом C); у всех портфелей истории с пропусками дат."""
+    user_id = await conn.fetchval(
+        "INSERT INTO users (email) VALUES ('tree-values@test.local') RETURNING id"
+    )
+    ids = {}
+    for name, parent in (("R", None), ("A", "R"), ("B", "R"), ("C", "B")):
+        ids[name] = await conn.fetchval(
+            "INSERT INTO portfolios (user_id, parent_portfolio_id, name) VALUES ($1, $2, $3) RETURNING id",
+            user_id, ids.get(parent), name,
+        )
+    history = {
+        "R": [(2, 1), (5, 2)],
+        "A": [(1, 10), (3, 20)],
+        "B": [(2, 100), (6, 200)],
+        "C": [(3, 1000), (4, 2000), (8, 3000)],
+    }
+    for name, rows in history.items():
+        for day, value in rows:
+            await _set_value(conn, ids[name], day, value)
+    return ids
+
+
+async def _set_value(conn, portfolio_id: int, day: int, value: int) -> None:
+    await conn.execute(
+        """
+        INSERT INTO portfolio_daily_values (
+            portfolio_id, report_date, total_value, total_invested, total_payouts, total_pnl, balance
+        ) VALUES ($1, $2, $3, $4, $5, $6, $7)
+        ON CONFLICT (portfolio_id, report_date) DO UPDATE SET
+            total_value = EXCLUDED.total_value,
+            total_invested = EXCLUDED.total_invested,
+            total_payouts = EXCLUDED.total_payouts,
+            total_pnl = EXCLUDED.total_pnl,
+            balance = EXCLUDED.balance
+        """,
+        portfolio_id, date(2024, 1, day), value, 2 * value, day, value - day, 3 * day,
+    )
+
+
+async def _python_totals(conn, ids: dict) -> dict:
+    """Итоги поддеревьев, посчитанные на бэкенде из portfolio_daily_values."""
+    portfolios = []
+    for name, pid in ids.items():
+        rows = await conn.fetch(
+            f"SELECT report_date, {', '.join(FIELDS)} FROM portfolio_daily_values "
+            "WHERE portfolio_id = $1 ORDER BY report_date",
+            pid,
+        )
+        portfolios.append({
+            "id": pid,
+            "name": name,
+            "parent_portfolio_id": None if name == "R" else ids["B" if name == "C" else "R"],
+            "assets": [],
+            "history": [
+                {"date": r["report_date"], "value": r["total_value"], "invested": r["total_invested"],
+                 "payouts": r["total_payouts"], "pnl": r["total_pnl"], "balance": r["balance"]}
+                for r in rows
+            ],
+            "analytics": None,
+            "balance": 0,
+        })
+    by_id = {p["id"]: p for p in build_portfolio_hierarchy(portfolios)}
+    return {name: by_id[ids[name]]["history"].rounded().to_series() for name in ("R", "B")}
+
+
+async def _sql_totals(conn, ids: dict) -> dict:
+    totals = {}
+    for name in ("R", "B"):
+        rows = await conn.fetch(
+            f"SELECT report_date, {', '.join(FIELDS)} FROM portfolio_tree_daily_values "
+            "WHERE portfolio_id = $1 ORDER BY report_date",
+            ids[name],
+        )
+        totals[name] = [[r["report_date"].isoformat(), *(float(r[f]) for f in FIELDS)] for r in rows]
+    return totals
+
+
+@pytest.mark.integration
+@pytest.mark.database
+class TestPortfolioTreeValues:
+    """Итоги поддеревьев в SQL совпадают с суммированием истории на бэкенде."""
+
+    async def test_gapped_tree_matches_history_sum(self, db_conn):
+        """Собственные записи узла не продолжаются на пропуски, ряды детей — доводятся до последней даты."""
+        ids = await _create_tree(db_conn)
+        await db_conn.fetchval("SELECT refresh_portfolio_tree_values_batch($1)", [ids["A"], ids["C"]])
+
+        sql = await _sql_totals(db_conn, ids)
+        assert sql == await _python_totals(db_conn, ids)
+        assert [(row[0], row[1]) for row in sql["R"]] == [
+            ("2024-01-01", 10), ("2024-01-02", 111), ("2024-01-03", 1020), ("2024-01-04", 2020),
+            ("2024-01-05", 2022), ("2024-01-06", 2220), ("2024-01-07", 2020), ("2024-01-08", 3020),
+        ]
+
+    async def test_refresh_from_date_matches_full_rebuild(self, db_conn):
+        """Пересчёт с даты (последняя запись до неё продолжается) даёт те же итоги, что и с начала."""
+        ids = await _create_tree(db_conn)
+        await db_conn.fetchval("SELECT refresh_portfolio_tree_values_batch($1)", [ids["A"], ids["C"]])
+
+        await _set_value(db_conn, ids["C"], 8, 5000)
+        await _set_value(db_conn, ids["C"], 10, 4000)
+        await db_conn.fetchval(
+            "SELECT refresh_portfolio_tree_values_batch($1, $2)", [ids["C"]], [date(2024, 1, 7)]
+        )
+
+        assert await _sql_totals(db_conn, ids) == await _python_totals(db_conn, ids)
@@ -0,0 +1,256 @@
+"""
+Unit тесты для агрегации дерева портфелей dashboard_service.
+"""
+import asyncio
+from datetime import date
+from time import time
+
+import pytest
+
+from app.config import Config
+from app.domain.services import dashboard_service
+from app.domain.services.dashboard_service import (
+    HistoryView,
+    PortfolioTree,
+    apply_history_view,
+    build_portfolio_hierarchy,
+)
+from app.domain.services.history_series import HistorySeries
+from app.infrastructure.cache import invalidate_tags
+from app.infrastructure.database import postgres_async
+
+
+def _portfolio(pid, parent=None, history=(), assets=(), balance=0.0):
+    return {
+        "id": pid,
+        "name": f"P{pid}",
+        "parent_portfolio_id": parent,
+        "assets": list(assets),
+        "history": [
+            {"date": d, "value": v, "invested": v, "payouts": 0, "pnl": 0, "balance": 0}
+            for d, v in history
+        ],
+        "analytics": None,
+        "balance": balance,
+    }
+
+
+@pytest.mark.unit
+@pytest.mark.services
+class TestPortfolioTree:
+    """Тесты агрегации портфелей снизу вверх."""
+
+    def test_history_forward_filled_to_latest_child_date(self):
+        """История детей доводится до последней даты и суммируется по дням."""
+        portfolios = build_portfolio_hierarchy([
+            _portfolio(1),
+            _portfolio(2, parent=1, history=[("2024-01-01", 100), ("2024-01-03", 110)]),
+            _portfolio(3, parent=1, history=[("2024-01-02", 50), ("2024-01-05T00:00:00", 60)]),
+        ])
+        root = next(p for p in portfolios if p["id"] == 1)
+        assert [(row[0], row[1]) for row in root["history"].to_series()] == [
+            ("2024-01-01", 100),
+            ("2024-01-02", 150),
+            ("2024-01-03", 160),
+            ("2024-01-04", 160),
+            ("2024-01-05", 170),
+        ]
+
+    def test_totals_include_grandchildren_once(self):
+        """Итоги родителя включают всё поддерево, исходные позиции не изменяются."""
+        asset = {"portfolio_asset_id": 7, "quantity": 2, "last_price": 10, "average_price": 8}
+        portfolios = build_portfolio_hierarchy([
+            _portfolio(1, balance=1),
+            _portfolio(2, parent=1, balance=2),
+            _portfolio(3, parent=2, assets=[asset], balance=3),
+        ])
+        by_id = {p["id"]: p for p in portfolios}
+        assert by_id[3]["total_value"] == 23
+        assert by_id[2]["total_value"] == 25
+        assert by_id[1]["total_value"] == 26
+        assert by_id[1]["total_invested"] == 16
+        assert by_id[1]["combined_assets"][0] is asset
+
+    def test_tree_history_replaces_children_sum(self):
+        """Итоги поддерева из SQL (tree_history) заменяют суммирование истории детей."""
+        parent = _portfolio(1)
+        parent["tree_history"] = [["2024-01-01", 150, 0, 0, 0, 0], ["2024-01-02", 160, 0, 0, 0, 0]]
+        portfolios = build_portfolio_hierarchy([
+            parent,
+            _portfolio(2, parent=1, history=[("2024-01-01", 100)]),
+            _portfolio(3, parent=1, history=[("2024-01-02", 50)]),
+        ])
+        root = next(p for p in portfolios if p["id"] == 1)
+        assert [(row[0], row[1]) for row in root["history"].to_series()] == [
+            ("2024-01-01", 150),
+            ("2024-01-02", 160),
+        ]
+        assert "tree_history" not in root
+
+    def test_cycle_does_not_hang(self):
+        """Цикл parent_portfolio_id не приводит к бесконечному обходу."""
+        tree = PortfolioTree([_portfolio(1), _portfolio(2, parent=3), _portfolio(3, parent=2)])
+        assert [p["id"] for p in tree.post_order()] == [1]
+
+
+@pytest.mark.unit
+@pytest.mark.services
+class TestHistorySeries:
+    """Тесты ряда истории на массивах numpy."""
+
+    def test_duplicate_dates_summed_and_zero_point(self):
+        """Строки на одну дату суммируются, нулевая точка — за день до первой даты."""
+        series = HistorySeries.from_rows([
+            {"date": "2024-03-01", "value": 1, "pnl": 1},
+            {"report_date": "2024-03-01T10:00:00", "value": 2, "pnl": None},
+            {"date": None, "value": 100},
+        ]).to_series(zero_point=True)
+        assert series == [
+            ["2024-02-29", 0.0, 0.0, 0.0, 0.0, 0.0],
+            ["2024-03-01", 3.0, 0.0, 0.0, 1.0, 0.0],
+        ]
+
+    def test_sum_of_forward_filled_parts(self):
+        """Дни, которых нет в ряду, дают ему 0; forward_filled заполняет пропуски."""
+        a = HistorySeries.from_rows([{"date": "2024-01-01", "value": 1}, {"date": "2024-01-03", "value": 3}])
+        b = HistorySeries.from_rows([{"date": "2024-01-02", "value": 10}])
+        total = HistorySeries.sum([a, b.forward_filled(a.last_day)])
+        assert total.column("value").tolist() == [1.0, 10.0, 13.0]
+
+    def test_resampled_and_downsampled_keep_edges(self):
+        """Недельный ряд — первая точка и последняя точка каждой недели; LTTB — ровно points точек."""
+        rows = [{"date": f"2024-01-{d:02d}", "value": d % 5} for d in range(1, 32)]
+        series = HistorySeries.from_rows(rows)
+        weekly = series.resampled("W").to_series()
+        # 2024-01-01 — понедельник: недели заканчиваются по воскресеньям
+        assert [row[0] for row in weekly] == [
+            "2024-01-01", "2024-01-07", "2024-01-14", "2024-01-21", "2024-01-28", "2024-01-31",
+        ]
+        sparse = series.downsampled(7)
+        assert len(sparse) == 7
+        assert (sparse.days[0], sparse.days[-1]) == (series.days[0], series.days[-1])
+
+
+@pytest.mark.unit
+@pytest.mark.services
+class TestHistoryView:
+    """Тесты вида истории в ответе дашборда."""
+
+    def test_range_from_last_date_clamped_to_month_end(self):
+        """1M от 31 марта — с 29 февраля; исходные данные дашборда не меняются."""
+        series = [[f"2024-{m:02d}-{d:02d}", 1.0, 0.0, 0.0, 0.0, 0.0] for m, d in [(2, 28), (2, 29), (3, 1), (3, 31)]]
+        dashboard = {"portfolios": [{"id": 1, "history": {"series": series}}]}
+        view = apply_history_view(dashboard, HistoryView("1M"))
+        assert [row[0] for row in view["portfolios"][0]["history"]["series"]] == [
+            "2024-02-29", "2024-03-01", "2024-03-31",
+        ]
+        assert len(dashboard["portfolios"][0]["history"]["series"]) == 4
+
+    def test_validation_and_default(self):
+        """Неизвестные значения — ValueError; без параметров — вид по умолчанию."""
+        assert HistoryView().is_default
+        assert not HistoryView(date_to=date(2024, 1, 1)).is_default
+        with pytest.raises(ValueError):
+            HistoryView(resolution="hourly")
+
+
+@pytest.mark.unit
+@pytest.mark.services
+class TestDashboardFragments:
+    """Тесты сборки дашборда из фрагментов портфелей."""
+
+    @staticmethod
+    def _rows():
+        return [
+            _portfolio(1, history=[("2024-01-01", 5)], balance=1),
+            _portfolio(2, parent=1, history=[("2024-01-01", 10)], balance=2),
+        ]
+
+    @staticmethod
+    def _rpc(rows, calls, during=None):
+        async def rpc(name, params):
+            ids = params["p_portfolio_ids"]
+            calls.append((ids, postgres_async._prefer_primary.get()))
+            if during is not None:
+                await during()
+            return {"portfolios": [
+                p if ids is None or p["id"] in ids else {**p, "assets": [], "history": [], "balance": 0}
+                for p in rows
+            ]}
+        return rpc
+
+    async def test_only_missing_fragments_requested(self, fake_redis, monkeypatch):
+        """Собственные данные запрашиваются с основной БД и только для портфелей без фрагмента в кэше."""
+        calls = []
+        monkeypatch.setattr(dashboard_service, "rpc_async", self._rpc(self._rows(), calls))
+
+        first = await dashboard_service._fetch_dashboard_data("u")
+        # Ключ сброшен, а в множестве тега user:u остаётся
+        await fake_redis.delete("cv:" + dashboard_service._fragment_key("u", 2))
+        second = await dashboard_service._fetch_dashboard_data("u")
+
+        assert calls == [(None, True), ([2], True)]
+        for before, after in zip(first["portfolios"], second["portfolios"]):
+            assert after["balance"] == before["balance"]
+            assert after["history"].to_series() == before["history"].to_series()
+
+    async def test_fragment_invalidated_during_fill_not_stored(self, fake_redis, monkeypatch):
+        """Фрагмент, чей тег сброшен записью во время запроса, в кэш не попадает."""
+        calls = []
+
+        async def concurrent_write():
+            await invalidate_tags("portfolio:2")
+
+        monkeypatch.setattr(dashboard_service, "rpc_async", self._rpc(self._rows(), calls, concurrent_write))
+        await dashboard_service._fetch_dashboard_data("u")
+
+        assert await fake_redis.exists("cv:" + dashboard_service._fragment_key("u", 1)) == 1
+        assert await fake_redis.exists("cv:" + dashboard_service._fragment_key("u", 2)) == 0
+
+
+@pytest.mark.unit
+@pytest.mark.services
+class TestDashboardWarming:
+    """Тесты прогрева кэша дашбордов после обновления цен."""
+
+    async def test_recent_candidates_within_limit(self, fake_redis, monkeypatch):
+        """Прогреваются только недавно активные из затронутых, сначала самые недавние; старые отметки удаляются."""
+        now = time()
+        await fake_redis.zadd(
+            "cv:" + dashboard_service.DASHBOARD_SEEN_KEY,
+            {"old": now - 2 * 86400, "a": now - 60, "b": now - 30, "c": now},
+        )
+        monkeypatch.setattr(Config, "DASHBOARD_WARM_MAX_USERS", 2)
+        refreshed = []
+
+        async def refresh(user_id):
+            refreshed.append(user_id)
+            return True
+
+        monkeypatch.setattr(dashboard_service.get_dashboard_data, "refresh", refresh)
+
+        assert await dashboard_service.warm_dashboards(["a", "c", "old", "unknown"]) == 2
+        assert refreshed == ["c", "a"]
+        assert await fake_redis.zscore("cv:" + dashboard_service.DASHBOARD_SEEN_KEY, "old") is None
+
+    async def test_budget_and_concurrency(self, fake_redis, monkeypatch):
+        """Одновременно не больше DASHBOARD_WARM_CONCURRENCY; после бюджета новые пересчёты не начинаются."""
+        now = time()
+        users = [f"u{i}" for i in range(6)]
+        await fake_redis.zadd("cv:" + dashboard_service.DASHBOARD_SEEN_KEY, {u: now for u in users})
+        monkeypatch.setattr(Config, "DASHBOARD_WARM_CONCURRENCY", 2)
+        monkeypatch.setattr(Config, "DASHBOARD_WARM_BUDGET_SECONDS", 0.15)
+        running, peak = 0, 0
+
+        async def refresh(user_id):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.1)
+            running -= 1
+            return True
+
+        monkeypatch.setattr(dashboard_service.get_dashboard_data, "refresh", refresh)
+
+        assert await dashboard_service.warm_dashboards(users) == 4
+        assert peak == 2
@@ -0,0 +1,57 @@
+"""
+Unit тесты для бинарного формата значений кэша.
+"""
+from decimal import Decimal
+
+import pytest
+from app.infrastructure.cache.codec import (
+    CODEC_NONE,
+    HEADER_SIZE,
+    MAGIC,
+    CodecError,
+    decode,
+    encode,
+    stamp_of,
+)
+
+
+@pytest.mark.unit
+class TestCacheCodec:
+    """Тесты кодирования значений @cache."""
+
+    def test_large_value_compressed_roundtrip(self):
+        """Большие значения сжимаются и читаются обратно."""
+        data = {"rows": [{"id": i, "price": Decimal("1.25")} for i in range(1000)]}
+        blob, size = encode(data, "test:{id}")
+        assert blob[0] == MAGIC and blob[2] != CODEC_NONE
+        assert len(blob) < size
+        value, decoded_size = decode(blob)
+        assert value["rows"][10] == {"id": 10, "price": 1.25}
+        assert decoded_size == size
+
+    def test_small_value_not_compressed(self):
+        """Маленькие значения хранятся без сжатия."""
+        blob, _ = encode({"a": 1}, "test:{id}")
+        assert blob[2] == CODEC_NONE
+        assert decode(blob)[0] == {"a": 1}
+
+    def test_content_stamp(self):
+        """Штамп зависит только от содержимого и читается из заголовка записи."""
+        blob, _ = encode({"a": 1}, "test:{id}")
+        assert stamp_of(blob[:HEADER_SIZE]) == stamp_of(encode({"a": 1}, "other")[0])
+        assert stamp_of(blob) != stamp_of(encode({"a": 2}, "test:{id}")[0])
+
+    def test_version1_entry(self):
+        """Записи версии 1 (без штампа) читаются, штампа у них нет."""
+        blob = bytes((MAGIC, 1, CODEC_NONE)) + b'{"a": 1}'
+        assert decode(blob)[0] == {"a": 1}
+        assert stamp_of(blob) is None
+
+    def test_legacy_text_entry(self):
+        """Записи старого формата (JSON-текст без заголовка) читаются."""
+        assert decode(b'{"a": [1, 2]}')[0] == {"a": [1, 2]}
+
+    def test_unknown_version(self):
+        """Неизвестная версия формата — ошибка, а не мусор."""
+        with pytest.raises(CodecError):
+            decode(bytes((MAGIC, 99, 0)) + b"{}")
@@ -0,0 +1,237 @@
+"""
+Unit тесты для декоратора @cache и инвалидации на Redis в памяти (fakeredis).
+"""
+import asyncio
+
+import pytest
+from app.config import Config
+from app.infrastructure.cache import decorators
+from app.infrastructure.cache.codec import encode
+from app.infrastructure.cache.decorators import cache
+from app.infrastructure.database import postgres_async
+
+
+@pytest.mark.unit
+class TestSingleFlight:
+    """Тесты схлопывания промахов в процессе и между процессами."""
+
+    async def test_concurrent_misses_compute_once(self, fake_redis):
+        """Одновременные промахи по ключу ждут одно вычисление."""
+        calls = []
+        release = asyncio.Event()
+
+        @cache("sf:{x}", ttl=60)
+        async def load(x):
+            calls.append(x)
+            await release.wait()
+            return {"x": x}
+
+        waiters = [asyncio.create_task(load(1)) for _ in range(5)]
+        while not calls:
+            await asyncio.sleep(0.001)
+        assert list(decorators._inflight) == ["sf:1"]
+        release.set()
+        assert await asyncio.gather(*waiters) == [{"x": 1}] * 5
+        assert calls == [1]
+        assert decorators._inflight == {}
+        assert await fake_redis.exists("cv:sf:1", "cv:lock:sf:1") == 1
+
+    async def test_failed_fill_reaches_all_waiters(self, fake_redis):
+        """Ошибка заполнения получают все ожидающие; следующий вызов считает заново."""
+        calls = []
+
+        @cache("sf_err:{x}", ttl=60)
+        async def load(x):
+            calls.append(x)
+            await asyncio.sleep(0.01)
+            if len(calls) == 1:
+                raise RuntimeError("db down")
+            return {"x": x}
+
+        results = await asyncio.gather(load(1), load(1), return_exceptions=True)
+        assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+        assert await load(1) == {"x": 1}
+        assert calls == [1, 1]
+
+    async def test_waits_for_lock_holder_value(self, fake_redis, monkeypatch):
+        """Ключ заполняет другой процесс (блокировка занята) — значение берётся из Redis."""
+        monkeypatch.setattr(Config, "CACHE_LOCK_WAIT_MS", 2000)
+        await fake_redis.set("cv:lock:sf_lock:1", "other", px=5000)
+
+        @cache("sf_lock:{x}", ttl=60)
+        async def load(x):
+            raise AssertionError("значение должен посчитать владелец блокировки")
+
+        async def other_process():
+            await asyncio.sleep(0.1)
+            await fake_redis.set("cv:sf_lock:1", encode({"x": "other"}, "sf_lock:{x}")[0])
+
+        writer = asyncio.create_task(other_process())
+        assert await load(1) == {"x": "other"}
+        await writer
+
+    async def test_lock_wait_timeout_computes_locally(self, fake_redis, monkeypatch):
+        """Владелец блокировки не записал значение за CACHE_LOCK_WAIT_MS — считаем сами, чужую блокировку не снимаем."""
+        monkeypatch.setattr(Config, "CACHE_LOCK_WAIT_MS", 100)
+        await fake_redis.set("cv:lock:sf_wait:1", "other", px=5000)
+
+        @cache("sf_wait:{x}", ttl=60)
+        async def load(x):
+            return {"x": x}
+
+        assert await load(1) == {"x": 1}
+        assert await fake_redis.get("cv:lock:sf_wait:1") == b"other"
+        assert await fake_redis.exists("cv:sf_wait:1") == 1
+
+
+@pytest.mark.unit
+class TestStaleWhileRevalidate:
+    """Тесты stale_ttl: устаревшее значение отдаётся сразу, пересчёт — в фоне."""
+
+    async def test_stale_value_served_while_revalidating(self, fake_redis):
+        """После invalidate_cache(stale=True) отдаётся прежнее значение, фон записывает новое."""
+        version = [1]
+
+        @cache("swr:{x}", ttl=60, stale_ttl=600)
+        async def load(x):
+            return {"v": version[0]}
+
+        assert await load(1) == {"v": 1}
+        assert float(await fake_redis.get("cv:fresh:swr:1")) > 0
+
+        version[0] = 2
+        await decorators.invalidate_cache("swr:{x}", stale=True, x=1)
+        assert await fake_redis.get("cv:fresh:swr:1") == b"0"
+        assert await load(1) == {"v": 1}
+        await decorators._revalidating["swr:1"]
+        assert await load(1) == {"v": 2}
+        assert float(await fake_redis.get("cv:fresh:swr:1")) > 0
+
+    async def test_expired_fresh_marker_is_stale(self, fake_redis):
+        """Метка свежести в прошлом — значение устарело, отдаётся и пересчитывается в фоне."""
+        calls = []
+
+        @cache("swr_exp:{x}", ttl=60, stale_ttl=600)
+        async def load(x):
+            calls.append(x)
+            return {"n": len(calls)}
+
+        await load(1)
+        await fake_redis.set("cv:fresh:swr_exp:1", "1", keepttl=True)
+        assert await load(1) == {"n": 1}
+        await decorators._revalidating["swr_exp:1"]
+        assert calls == [1, 1]
+        assert await load(1) == {"n": 2}
+
+    async def test_refresh_skipped_while_locked(self, fake_redis):
+        """refresh пересчитывает значение; ключ под чужой блокировкой — пропуск."""
+        @cache("swr_ref:{x}", ttl=60, stale_ttl=600)
+        async def load(x):
+            return {"x": x}
+
+        assert await load.refresh(1) is True
+        assert await fake_redis.exists("cv:swr_ref:1", "cv:fresh:swr_ref:1") == 2
+        await fake_redis.set("cv:lock:swr_ref:2", "other", px=5000)
+        assert await load.refresh(2) is False
+        assert await fake_redis.exists("cv:swr_ref:2") == 0
+
+
+@pytest.mark.unit
+class TestTagInvalidation:
+    """Тесты тегов @cache и invalidate."""
+
+    async def test_invalidate_tags_drops_tagged_results(self, fake_redis):
+        """Ключ с тегами из аргументов и результата сбрасывается по любому из них."""
+        calls = []
+
+        @cache("tagged:{user_id}", ttl=60, tags=("user:{user_id}",),
+               result_tags=lambda data: [f"asset:{a}" for a in data["assets"]])
+        async def load(user_id):
+            calls.append(user_id)
+            return {"assets": [7, 8]}
+
+        await load(1)
+        assert await decorators.invalidate_tags("asset:8") == ["tagged:1"]
+        await load(1)
+        assert await decorators.invalidate_tags("asset:9") == []
+        await load(1)
+        assert calls == [1, 1]
+
+    async def test_invalidate_decorator_resolves_tags(self, fake_redis):
+        """@invalidate сбрасывает ключи по шаблонам тегов и tags_from после успешного вызова."""
+        @cache("tagged_a:{x}", ttl=60, tags=("portfolio:{x}",))
+        async def load(x):
+            return {"x": x}
+
+        @decorators.invalidate(tags=("portfolio:{portfolio_id}",),
+                               tags_from=lambda bound: [f"portfolio:{bound['other_id']}"])
+        async def update(portfolio_id, other_id):
+            return "ok"
+
+        for x in (1, 2, 3):
+            await load(x)
+        assert await update(1, other_id=2) == "ok"
+        assert await fake_redis.exists("cv:tagged_a:1", "cv:tagged_a:2", "cv:tagged_a:3") == 1
+
+
+@pytest.mark.unit
+class TestEtag:
+    """Тесты штампа содержимого для ETag."""
+
+    async def test_etag_from_header_matches_value(self, fake_redis):
+        """etag (GETRANGE заголовка) совпадает со штампом with_etag; другое значение — другой штамп."""
+        data = {"v": 1}
+
+        @cache("etag:{x}", ttl=60)
+        async def load(x):
+            return dict(data)
+
+        assert await load.etag(1) is None
+        value, etag = await load.with_etag(1)
+        assert value == {"v": 1} and etag
+        assert await load.etag(1) == etag
+        assert await load.with_etag(1) == (value, etag)
+
+        data["v"] = 2
+        await decorators.invalidate_cache("etag:{x}", x=1)
+        assert (await load.with_etag(1))[1] != etag
+
+    async def test_no_etag_for_stale_value(self, fake_redis):
+        """Устаревшее значение (stale_ttl) штампа не даёт: ответ 304 по нему был бы неверен."""
+        @cache("etag_swr:{x}", ttl=60, stale_ttl=600)
+        async def load(x):
+            return {"x": x}
+
+        _, etag = await load.with_etag(1)
+        assert await load.etag(1) == etag
+        await decorators.invalidate_cache("etag_swr:{x}", stale=True, x=1)
+        assert await load.etag(1) is None
+
+
+@pytest.mark.unit
+class TestReadAfterWrite:
+    """Тесты заполнения с основной БД ключей, сброшенных записью."""
+
+    async def test_invalidated_key_filled_from_primary(self, fake_redis, monkeypatch):
+        """После инвалидации ключ в окне отставания реплики считается под use_primary()."""
+        monkeypatch.setattr(Config, "DB_READ_HOST", "replica")
+        on_primary = []
+
+        @cache("raw:{x}", ttl=60)
+        async def load(x):
+            on_primary.append(postgres_async._prefer_primary.get())
+            return {"x": x}
+
+        await load(1)
+        await decorators.invalidate_cache("raw:{x}", x=1)
+        await load(1)
+        await load(2)
+        assert on_primary == [False, True, False]
+        ttl_ms = await fake_redis.pttl("cv:primary:raw:1")
+        assert 0 < ttl_ms <= Config.DB_READ_MAX_LAG_SECONDS * 1000
+
+    async def test_no_marks_without_replica(self, fake_redis, monkeypatch):
+        """Без реплики метки не ставятся."""
+        monkeypatch.setattr(Config, "DB_READ_HOST", "")
+        await decorators.invalidate_cache("raw:{x}", x=1)
+        assert await fake_redis.exists("cv:primary:raw:1") == 0
@@ -0,0 +1,34 @@
+"""
+Unit тесты для метрик кэша.
+"""
+import pytest
+from app.infrastructure.cache.cache_metrics import (
+    get_cache_metrics,
+    record_invalidation,
+    reset_cache_metrics,
+    stats_for,
+)
+
+
+@pytest.mark.unit
+class TestCacheMetrics:
+    """Тесты счётчиков по шаблонам ключей."""
+
+    def setup_method(self):
+        reset_cache_metrics()
+
+    def test_hit_rate_counts_all_hit_kinds(self):
+        """Доля попаданий учитывает L1, Redis и устаревшие значения."""
+        stats = stats_for("dashboard:{user_id}")
+        stats.l1_hits, stats.hits, stats.stale_hits, stats.misses = 1, 1, 1, 1
+        data = get_cache_metrics()["keys"]["dashboard:{user_id}"]
+        assert data["requests"] == 4
+        assert data["hit_rate"] == 0.75
+
+    def test_invalidations_grouped_by_namespace(self):
+        """Инвалидации группируются по первому сегменту ключа и источнику."""
+        record_invalidation("dashboard:{user.id}", "add_transaction_route")
+        record_invalidation("dashboard:42", "price_worker", 3)
+        assert get_cache_metrics()["invalidations"] == {
+            "dashboard": {"add_transaction_route": 1, "price_worker": 3},
+        }
@@ -0,0 +1,50 @@
+"""
+Unit тесты для L1-кэша процесса.
+"""
+import time
+
+import pytest
+from app.infrastructure.cache.local_cache import LocalCache, MISSING
+
+
+@pytest.mark.unit
+class TestLocalCache:
+    """Тесты LRU с TTL и лимитами."""
+
+    def test_evicts_least_recently_used(self):
+        """При превышении числа записей вытесняется самая давняя."""
+        cache = LocalCache(max_items=2, max_bytes=1000)
+        cache.set("a", 1, ttl=60, size=1)
+        cache.set("b", 2, ttl=60, size=1)
+        assert cache.get("a") == 1
+        cache.set("c", 3, ttl=60, size=1)
+        assert cache.get("b") is MISSING
+        assert cache.get("a") == 1 and cache.get("c") == 3
+
+    def test_byte_limit(self):
+        """Суммарный размер не превышает max_bytes; слишком большие записи не хранятся."""
+        cache = LocalCache(max_items=10, max_bytes=100)
+        cache.set("a", "x", ttl=60, size=60)
+        cache.set("b", "y", ttl=60, size=60)
+        assert cache.get("a") is MISSING
+        assert cache.total_bytes == 60
+        cache.set("big", "z", ttl=60, size=500)
+        assert cache.get("big") is MISSING
+
+    def test_ttl_expiry(self, monkeypatch):
+        """Просроченная запись не отдаётся."""
+        cache = LocalCache(max_items=10, max_bytes=100)
+        cache.set("a", 1, ttl=10, size=1)
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+        assert cache.get("a") is MISSING
+        assert len(cache) == 0
+
+    def test_delete_prefix(self):
+        """Инвалидация по префиксу."""
+        cache = LocalCache(max_items=10, max_bytes=100)
+        cache.set("dashboard:1", 1, ttl=60, size=1)
+        cache.set("dashboard:2", 2, ttl=60, size=1)
+        cache.set("analytics:1", 3, ttl=60, size=1)
+        assert cache.delete_prefix("dashboard:") == 2
+        assert cache.get("analytics:1") == 3
@@ -0,0 +1,30 @@
+"""
+Unit тесты для захвата планов медленных RPC.
+"""
+from types import SimpleNamespace
+
+import pytest
+from app.infrastructure.database.plan_capture import _parse_auto_explain, _serialize_params
+
+
+@pytest.mark.unit
+class TestPlanCapture:
+    """Тесты разбора сообщений auto_explain и параметров."""
+
+    def test_parse_auto_explain_json(self):
+        """Из LOG-сообщений берутся только планы auto_explain."""
+        messages = [
+            SimpleNamespace(message='duration: 1203.512 ms  plan:\n{"Query Text": "SELECT 1", "Plan": {"Node Type": "Result"}}'),
+            SimpleNamespace(message="some other log line"),
+        ]
+        plans = _parse_auto_explain(messages)
+        assert len(plans) == 1
+        assert plans[0]["duration"] == "1203.512 ms"
+        assert plans[0]["plan"]["Plan"]["Node Type"] == "Result"
+
+    def test_serialize_params_truncates(self):
+        """Длинные параметры обрезаются, короткие сериализуются в JSON."""
+        params = _serialize_params({"p_user_id": 5, "p_operations": [{"x": "y" * 5000}]})
+        assert params["p_user_id"] == "5"
+        assert len(params["p_operations"]) < 2100
+        assert "символов" in params["p_operations"]
@@ -0,0 +1,198 @@
+"""
+Unit тесты для вспомогательных функций postgres_async (без подключения к БД).
+"""
+import asyncio
+
+import pytest
+from datetime import date, datetime
+from decimal import Decimal
+from app.infrastructure.database.postgres_async import (
+    _encode_json,
+    _decode_json,
+    _encode_jsonb,
+    _decode_jsonb,
+    _prepare_value,
+    _prepare_rpc_param,
+    _build_select_query,
+    _init_connection,
+    _payload_counters,
+    _raw_connection,
+    _acquire,
+    connection_scope,
+)
+
+
+class _FakeConnection:
+    """Соединение с одинаковым pid бэкенда (как у основной БД и реплики)."""
+
+    def __init__(self):
+        self.decoders = {}
+
+    def get_server_pid(self):
+        return 42
+
+    async def set_type_codec(self, typename, *, decoder, **kwargs):
+        self.decoders[typename] = decoder
+
+
+class _FakeProxy:
+    """Как PoolConnectionProxy: соединение в _con."""
+
+    def __init__(self, con):
+        self._con = con
+
+
+@pytest.mark.unit
+class TestJsonCodec:
+    """Тесты для json/jsonb кодека пула."""
+
+    def test_encode_dict(self):
+        """dict кодируется в JSON текст."""
+        assert _decode_json(_encode_json({"a": 1, "b": [1, 2]})) == {"a": 1, "b": [1, 2]}
+
+    def test_encode_serialized_string_passthrough(self):
+        """Уже сериализованный JSON передаётся без повторного кодирования."""
+        assert _encode_json('{"a": 1}') == b'{"a": 1}'
+
+    def test_encode_plain_string(self):
+        """Обычная строка кодируется как JSON-строка."""
+        assert _encode_json("hello") == b'"hello"'
+
+    def test_encode_decimal_and_date(self):
+        """Decimal и date сериализуются."""
+        raw = _encode_json({"price": Decimal("1.5"), "d": date(2024, 1, 2)})
+        assert _decode_json(raw) == {"price": 1.5, "d": "2024-01-02"}
+
+    def test_jsonb_binary_roundtrip(self):
+        """jsonb в бинарном формате: байт версии + JSON."""
+        raw = _encode_jsonb([{"a": 1}])
+        assert raw[:1] == b"\x01"
+        assert _decode_jsonb(raw) == [{"a": 1}]
+
+
+@pytest.mark.unit
+class TestPayloadCounters:
+    """Тесты счётчиков байт JSON по соединениям."""
+
+    async def test_counters_per_connection_not_pid(self):
+        """Соединения разных пулов с одним pid считают байты раздельно, прокси — как соединение."""
+        primary, replica = _FakeConnection(), _FakeConnection()
+        await _init_connection(primary)
+        await _init_connection(replica)
+        primary.decoders["json"](b'{"a": 1}')
+        assert _payload_counters[_raw_connection(_FakeProxy(primary))] == [8]
+        assert _payload_counters[replica] == [0]
+
+
+class _FakePool:
+    """Пул, записывающий выдачу и возврат соединений."""
+
+    def __init__(self):
+        self.events = []
+
+    async def acquire(self):
+        self.events.append("acquire")
+        return _FakeProxy(_FakeConnection())
+
+    async def release(self, conn):
+        self.events.append("release")
+
+
+@pytest.mark.unit
+class TestConnectionScope:
+    """Тесты соединений connection_scope."""
+
+    async def test_queries_share_connection_until_close(self):
+        """Запросы области берут одно соединение; оно возвращается при выходе из области."""
+        pool = _FakePool()
+        async with connection_scope():
+            async with _acquire(pool, "rpc", "a") as (first, _):
+                pass
+            async with _acquire(pool, "rpc", "b") as (second, _):
+                pass
+            assert first is second
+            assert pool.events == ["acquire"]
+        assert pool.events == ["acquire", "release"]
+
+    async def test_task_outliving_scope_releases_after_query(self):
+        """Задача, унаследовавшая область, возвращает соединение сама — после своего запроса."""
+        pool = _FakePool()
+        started, finish = asyncio.Event(), asyncio.Event()
+
+        async def background_query():
+            async with _acquire(pool, "rpc", "check_missed_payouts"):
+                started.set()
+                await finish.wait()
+                pool.events.append("query done")
+
+        async with connection_scope():
+            task = asyncio.create_task(background_query())
+            await started.wait()
+        assert pool.events == ["acquire"]
+
+        finish.set()
+        await task
+        assert pool.events == ["acquire", "query done", "release"]
+
+
+@pytest.mark.unit
+class TestPrepareValue:
+    """Тесты подготовки значений для записи."""
+
+    def test_datetime_microseconds_stripped(self):
+        """У datetime обрезаются микросекунды."""
+        assert _prepare_value(datetime(2024, 1, 1, 12, 0, 0, 123)) == datetime(2024, 1, 1, 12, 0, 0)
+
+    def test_date_string_parsed(self):
+        """Строка даты преобразуется в datetime."""
+        assert _prepare_value("2024-01-01") == datetime(2024, 1, 1)
+
+    def test_json_like_values_untouched(self):
+        """dict/list и JSON строки передаются кодеку как есть."""
+        assert _prepare_value({"a": 1}) == {"a": 1}
+        assert _prepare_value([1, 2]) == [1, 2]
+        assert _prepare_value('{"a": 1}') == '{"a": 1}'
+
+    def test_rpc_date_param(self):
+        """Строковые даты в параметрах *date* приводятся к date."""
+        assert _prepare_rpc_param("p_from_date", "2024-01-01") == date(2024, 1, 1)
+        assert _prepare_rpc_param("p_name", "2024-01-01") == "2024-01-01"
+
+
+@pytest.mark.unit
+class TestBuildSelectQuery:
+    """Тесты сборки SELECT."""
+
+    def test_in_filter_single_array_param(self):
+        """IN-фильтр передаётся одним параметром-массивом независимо от длины списка."""
+        for ids in ([1, 2], list(range(1000))):
+            parts, params = _build_select_query("assets", "id", filters={"user_id": 5}, in_filters={"id": ids})
+            assert " ".join(parts) == "SELECT id FROM assets WHERE user_id = $1 AND id = ANY($2)"
+            assert params == [5, ids]
+
+    def test_empty_in_filter_skipped(self):
+        """Пустой список в in_filters не добавляет условие."""
+        parts, params = _build_select_query("assets", in_filters={"id": []})
+        assert " ".join(parts) == "SELECT * FROM assets"
+        assert params == []
+
+    def test_keyset_after(self):
+        """after добавляет условие курсора и сортировку по его колонкам."""
+        parts, params = _build_select_query("assets", "id", after={"id": 10})
+        assert " ".join(parts) == "SELECT id FROM assets WHERE id > $1 ORDER BY id"
+        assert params == [10]
+
+    def test_keyset_after_desc(self):
+        """При сортировке по убыванию курсор берёт строки меньше значения."""
+        parts, params = _build_select_query("assets", "id", order={"column": "id", "desc": True}, after={"id": 10})
+        assert " ".join(parts) == "SELECT id FROM assets WHERE id < $1 ORDER BY id DESC"
+        assert params == [10]
+
+    def test_keyset_after_composite(self):
+        """Составной курсор сравнивается как ROW."""
+        parts, params = _build_select_query(
+            "asset_prices", order="asset_id, trade_date",
+            after={"asset_id": 3, "trade_date": date(2024, 1, 1)},
+        )
+        assert parts[1] == "WHERE (asset_id, trade_date) > ($1, $2)"
+        assert params == [3, date(2024, 1, 1)]
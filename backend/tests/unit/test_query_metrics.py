@@ -0,0 +1,50 @@
+"""
+Unit тесты для метрик запросов к БД.
+"""
+import pytest
+from app.infrastructure.database.query_metrics import (
+    Histogram,
+    QueryTimer,
+    get_query_metrics,
+    reset_query_metrics,
+)
+
+
+@pytest.mark.unit
+class TestQueryMetrics:
+    """Тесты гистограмм и накопления метрик."""
+
+    def test_histogram_percentiles(self):
+        """Перцентили оцениваются по верхней границе корзины."""
+        hist = Histogram()
+        for value in [1] * 90 + [300] * 10:
+            hist.observe(value)
+        assert hist.count == 100
+        assert hist.percentile(0.5) == 1
+        assert hist.percentile(0.95) == 500
+        assert hist.max_ms == 300
+
+    def test_histogram_overflow_bucket(self):
+        """Значения больше последней границы попадают в корзину inf."""
+        hist = Histogram()
+        hist.observe(60000)
+        assert hist.to_dict()["buckets"]["inf"] == 1
+        assert hist.percentile(0.99) == 60000
+
+    def test_timer_records_stats(self):
+        """QueryTimer накапливает вызовы, строки и ошибки по ключу."""
+        reset_query_metrics()
+        for failed in (False, True):
+            timer = QueryTimer("rpc", "get_user_portfolios")
+            timer.acquired()
+            timer.rows = 3
+            timer.payload_bytes = 100
+            timer.failed = failed
+            timer.finish()
+
+        stats = get_query_metrics()["queries"]["rpc:get_user_portfolios"]
+        assert stats["calls"] == 2
+        assert stats["errors"] == 1
+        assert stats["rows"] == 6
+        assert stats["avg_payload_bytes"] == 100
+        reset_query_metrics()
@@ -0,0 +1,94 @@
+"""
+Unit тесты для асинхронного Redis-клиента кэша на Redis в памяти (fakeredis).
+"""
+import pytest
+from app.infrastructure.cache import redis_client
+from app.infrastructure.cache.redis_client import (
+    redis_delete_pattern,
+    redis_invalidate_tags,
+    redis_mark_stale_pattern,
+    redis_mget,
+    redis_mset_with_ttl,
+    redis_set_entry,
+    redis_tag_members,
+    redis_unlink_many,
+)
+
+
+@pytest.mark.unit
+class TestTags:
+    """Тесты скриптов тегов: запись с тегами и инвалидация по тегам."""
+
+    async def test_set_entry_adds_key_to_tags(self, fake_redis):
+        """Значение, метка свежести и теги пишутся вместе; TTL тега не уменьшается."""
+        await redis_set_entry("dashboard:1", b"v", 100, fresh_until=123.0, tags=["user:1"])
+        await redis_set_entry("dashboard:2", b"v", 50, tags=["user:1", "asset:7"])
+
+        assert await fake_redis.get("cv:fresh:dashboard:1") == b"123.0"
+        assert await fake_redis.exists("cv:fresh:dashboard:2") == 0
+        assert sorted(await redis_tag_members("user:1")) == ["dashboard:1", "dashboard:2"]
+        assert 90 < await fake_redis.ttl("cv:tag:user:1") <= 100
+        assert await redis_tag_members("asset:7") == ["dashboard:2"]
+
+    async def test_invalidate_unlinks_keys_and_tags(self, fake_redis):
+        """Без stale удаляются ключи тегов, их метки свежести и сами теги; ключи — без префикса, без повторов."""
+        await redis_set_entry("a", b"1", 100, fresh_until=1e12, tags=["t1", "t2"])
+        await redis_set_entry("b", b"2", 100, tags=["t2"])
+        await redis_set_entry("c", b"3", 100, tags=["t3"])
+
+        assert sorted(await redis_invalidate_tags(["t1", "t2"])) == ["a", "b"]
+        assert await fake_redis.exists("cv:a", "cv:fresh:a", "cv:b", "cv:tag:t1", "cv:tag:t2") == 0
+        assert await fake_redis.get("cv:c") == b"3"
+
+    async def test_invalidate_stale_keeps_marked_values(self, fake_redis):
+        """stale=True: ключи с меткой свежести помечаются устаревшими, без метки — удаляются; теги остаются."""
+        await redis_set_entry("a", b"1", 100, fresh_until=1e12, tags=["t"])
+        await redis_set_entry("b", b"2", 100, tags=["t"])
+
+        assert sorted(await redis_invalidate_tags(["t"], stale=True)) == ["a", "b"]
+        assert await fake_redis.get("cv:a") == b"1"
+        assert await fake_redis.get("cv:fresh:a") == b"0"
+        assert 0 < await fake_redis.ttl("cv:fresh:a") <= 100
+        assert await fake_redis.exists("cv:b") == 0
+        assert await fake_redis.exists("cv:tag:t") == 1
+
+    async def test_unavailable_redis(self, monkeypatch):
+        """Без подключения операции тегов ничего не делают."""
+        monkeypatch.setattr(redis_client, "_redis", None)
+        assert await redis_set_entry("a", b"1", 100, tags=["t"]) is False
+        assert await redis_invalidate_tags(["t"]) == []
+        assert await redis_tag_members("t") == []
+
+
+@pytest.mark.unit
+class TestBatching:
+    """Тесты пакетных операций: пачки по _BATCH_SIZE ключей в одном пайплайне."""
+
+    @pytest.fixture(autouse=True)
+    def small_batches(self, monkeypatch):
+        monkeypatch.setattr(redis_client, "_BATCH_SIZE", 2)
+        monkeypatch.setattr(redis_client, "_FLUSH_KEYS", 3)
+
+    async def test_mget_and_mset_across_batches(self, fake_redis):
+        """Значения нескольких пачек — в порядке ключей; TTL общий для всех."""
+        assert await redis_mset_with_ttl({f"k{i}": str(i) for i in range(5)}, ttl=30)
+        assert await redis_mget("k0", "missing", "k1", "k2", "k3", "k4") == [b"0", None, b"1", b"2", b"3", b"4"]
+        assert 0 < await fake_redis.ttl("cv:k4") <= 30
+
+    async def test_unlink_many_counts_per_key(self, fake_redis):
+        """По каждому ключу — 1, если он был удалён."""
+        await redis_mset_with_ttl({"a": "1", "c": "3"})
+        assert await redis_unlink_many(["a", "b", "c"]) == [1, 0, 1]
+        assert await fake_redis.exists("cv:a", "cv:c") == 0
+
+    async def test_patterns_flushed_in_batches(self, fake_redis):
+        """Удаление и пометка по шаблону проходят все ключи, метки свежести не считаются ключами."""
+        await redis_mset_with_ttl({f"d:{i}": "v" for i in range(7)})
+        await redis_mset_with_ttl({f"fresh:d:{i}": "1" for i in range(3)})
+        await redis_mset_with_ttl({"other": "v"})
+
+        assert await redis_mark_stale_pattern("d:*") == 7
+        assert await fake_redis.mget([f"cv:fresh:d:{i}" for i in range(3)]) == [b"0"] * 3
+        assert await fake_redis.exists(*[f"cv:d:{i}" for i in range(7)]) == 3
+        assert await redis_delete_pattern("d:*") == 3
+        assert await fake_redis.exists("cv:other") == 1
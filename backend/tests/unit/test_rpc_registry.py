@@ -0,0 +1,38 @@
+"""
+Unit тесты для реестра RPC-функций.
+"""
+import pytest
+from app.infrastructure.database.rpc_registry import (
+    READ_ONLY_RPCS,
+    MUTATING_RPCS,
+    is_read_only_rpc,
+    find_registry_mismatches,
+)
+
+
+@pytest.mark.unit
+class TestRpcRegistry:
+    """Тесты реестра read-only / изменяющих RPC."""
+
+    def test_registry_sets_disjoint(self):
+        """Функция не может быть одновременно read-only и изменяющей."""
+        assert not (READ_ONLY_RPCS & MUTATING_RPCS)
+
+    def test_unknown_rpc_is_not_read_only(self):
+        """Незарегистрированная функция считается изменяющей."""
+        assert is_read_only_rpc("get_dashboard_data_complete")
+        assert not is_read_only_rpc("get_next_pending_task")
+        assert not is_read_only_rpc("some_new_function")
+
+    def test_find_mismatches(self):
+        """Расхождения реестра с provolatile."""
+        volatility = {name: "s" for name in READ_ONLY_RPCS}
+        volatility.update({name: "v" for name in MUTATING_RPCS})
+        volatility["get_user_portfolios"] = "v"
+        volatility["update_task_status"] = "s"
+        del volatility["get_asset_splits"]
+
+        mismatches = find_registry_mismatches(volatility)
+        assert mismatches["missing"] == ["get_asset_splits"]
+        assert mismatches["volatile_read_only"] == ["get_user_portfolios"]
+        assert mismatches["stable_mutating"] == ["update_task_status"]
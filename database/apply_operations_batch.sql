@@ -32,6 +32,8 @@ DECLARE
     v_op_record RECORD;
     v_first_buy_date timestamp without time zone;
     v_min_date date;
+    v_tree_ids bigint[] := ARRAY[]::bigint[];
+    v_tree_dates date[] := ARRAY[]::date[];
     -- Для операций покупки/продажи/амортизации (транзакции)
     v_buy_op_type_id bigint;
     v_sell_op_type_id bigint;
@@ -804,12 +806,21 @@ BEGIN
         GROUP BY p_id
     LOOP
         BEGIN
-            PERFORM update_portfolio_values_from_date(v_portfolio_id, v_min_date);
+            PERFORM update_portfolio_values_from_date(v_portfolio_id, v_min_date, false);
+            v_tree_ids := v_tree_ids || v_portfolio_id;
+            v_tree_dates := v_tree_dates || v_min_date;
         EXCEPTION WHEN OTHERS THEN
             RAISE WARNING 'Ошибка при обновлении истории портфеля %: %', v_portfolio_id, SQLERRM;
         END;
     END LOOP;
 
+    -- Итоги поддеревьев: общие предки пересчитываются один раз
+    BEGIN
+        PERFORM refresh_portfolio_tree_values_batch(v_tree_ids, v_tree_dates);
+    EXCEPTION WHEN OTHERS THEN
+        RAISE WARNING 'Ошибка при обновлении итогов поддеревьев: %', SQLERRM;
+    END;
+
     -- ========== Авто-upsert цен для транзакций (перенесено из backend) ==========
     IF array_length(v_tx_ids, 1) > 0 THEN
         INSERT INTO asset_prices (asset_id, price, trade_date)
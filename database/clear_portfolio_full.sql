@@ -11,6 +11,7 @@ declare
     v_pa_ids bigint[];
     v_asset_ids bigint[];
     v_custom_asset_ids bigint[];
+    v_parent_id bigint;
 begin
     ------------------------------------------------------------------
     -- 1. Все портфели (рекурсивно)
@@ -34,6 +35,8 @@ begin
         raise exception 'Portfolio not found or access denied';
     end if;
 
+    select parent_portfolio_id into v_parent_id from portfolios where id = $1;
+
     ------------------------------------------------------------------
     -- 2. Все portfolio_assets
     ------------------------------------------------------------------
@@ -102,6 +105,15 @@ begin
         delete from portfolios where id = $1;
     end if;
 
+    ------------------------------------------------------------------
+    -- 9. Итоги поддеревьев (portfolio_tree_daily_values) оставшихся предков
+    ------------------------------------------------------------------
+    if not p_delete_self then
+        perform refresh_portfolio_tree_values($1);
+    elsif v_parent_id is not null then
+        perform refresh_portfolio_tree_values(v_parent_id);
+    end if;
+
     return true;
 end;
 $$;
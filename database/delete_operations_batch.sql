@@ -15,6 +15,7 @@ DECLARE
     v_deleted_transactions_count int := 0;
     v_tx_portfolio_ids bigint[];
     v_operations_targeted int := 0;
+    v_tree_ids bigint[] := ARRAY[]::bigint[];
 BEGIN
     IF array_length(p_operation_ids, 1) IS NULL THEN
         RETURN jsonb_build_object(
@@ -222,12 +223,24 @@ BEGIN
             BEGIN
                 PERFORM update_portfolio_values_from_date(
                     v_portfolio_id,
-                    v_min_date - 1
+                    v_min_date - 1,
+                    false
                 );
+                v_tree_ids := v_tree_ids || v_portfolio_id;
             EXCEPTION WHEN OTHERS THEN
                 RAISE WARNING 'Ошибка при обновлении истории портфеля %: %', v_portfolio_id, SQLERRM;
             END;
         END LOOP;
+
+        -- Итоги поддеревьев: общие предки пересчитываются один раз
+        BEGIN
+            PERFORM refresh_portfolio_tree_values_batch(
+                v_tree_ids,
+                array_fill(v_min_date - 1, ARRAY[cardinality(v_tree_ids)])
+            );
+        EXCEPTION WHEN OTHERS THEN
+            RAISE WARNING 'Ошибка при обновлении итогов поддеревьев: %', SQLERRM;
+        END;
     END IF;
     
     -- Проверяем неполученные выплаты для всех затронутых активов
@@ -1,4 +1,12 @@
-CREATE OR REPLACE FUNCTION get_dashboard_data_complete(p_user_id uuid)
+DROP FUNCTION IF EXISTS get_dashboard_data_complete(uuid);
+
+-- p_portfolio_ids — фрагменты дашборда: позиции, история и аналитика только для этих
+-- портфелей (NULL — для всех, пустой массив — ни для одного). Список портфелей, подключения,
+-- последние сделки и число пропущенных выплат возвращаются всегда целиком.
+CREATE OR REPLACE FUNCTION get_dashboard_data_complete(
+    p_user_id uuid,
+    p_portfolio_ids bigint[] DEFAULT NULL
+)
 RETURNS json AS $$
 WITH 
 portfolios_base AS (
@@ -11,6 +19,12 @@ portfolios_base AS (
     WHERE p.user_id = p_user_id
 ),
 
+fragments_base AS (
+    SELECT pb.id
+    FROM portfolios_base pb
+    WHERE p_portfolio_ids IS NULL OR pb.id = ANY(p_portfolio_ids)
+),
+
 connections_data AS (
     SELECT DISTINCT ON (ubc.portfolio_id)
         ubc.portfolio_id,
@@ -36,7 +50,7 @@ first_purchase_data AS (
 user_asset_ids AS (
     SELECT DISTINCT pa.asset_id AS asset_id
     FROM portfolio_assets pa
-    INNER JOIN portfolios_base pb ON pb.id = pa.portfolio_id
+    INNER JOIN fragments_base fb ON fb.id = pa.portfolio_id
     WHERE pa.asset_id IS NOT NULL
 ),
 
@@ -105,6 +119,7 @@ portfolio_assets_data AS (
                 END,
                 'profit', (((COALESCE(apf.curr_price, 0) + COALESCE(apf.curr_accrued, 0)) - COALESCE(pa.average_price, 0)) * COALESCE(pa.quantity, 0)),
                 'currency_ticker', qa.ticker,
+                'quote_asset_id', a.quote_asset_id,
                 'currency_rate_to_rub', COALESCE(curr.curr_price, 1),
                 'profit_rub', (((COALESCE(apf.curr_price, 0) + COALESCE(apf.curr_accrued, 0)) - COALESCE(pa.average_price, 0))
                     * COALESCE(pa.quantity, 0) * COALESCE(curr.curr_price, 1)),
@@ -122,7 +137,7 @@ portfolio_assets_data AS (
             ORDER BY pa.id
         ) AS assets
     FROM portfolio_assets pa
-    JOIN portfolios_base pb ON pb.id = pa.portfolio_id
+    JOIN fragments_base fb ON fb.id = pa.portfolio_id
     LEFT JOIN assets a ON a.id = pa.asset_id
     LEFT JOIN asset_types at ON at.id = a.asset_type_id
     LEFT JOIN asset_latest_prices apf ON apf.asset_id = pa.asset_id
@@ -160,12 +175,35 @@ portfolio_history_data AS (
             LIMIT 1
         ), 0) AS balance
     FROM portfolio_daily_values pv
-    JOIN portfolios_base pb ON pb.id = pv.portfolio_id
+    JOIN fragments_base fb ON fb.id = pv.portfolio_id
     GROUP BY pv.portfolio_id
 ),
 
+-- Итоги поддеревьев родительских портфелей (portfolio_tree_daily_values) в формате series:
+-- [date, value, invested, payouts, pnl, balance]. Зависят от потомков, поэтому не входят
+-- во фрагменты и возвращаются для всех портфелей.
+portfolio_tree_history AS (
+    SELECT 
+        ptv.portfolio_id,
+        jsonb_agg(
+            jsonb_build_array(
+                ptv.report_date,
+                COALESCE(ptv.total_value, 0),
+                COALESCE(ptv.total_invested, 0),
+                COALESCE(ptv.total_payouts, 0),
+                COALESCE(ptv.total_pnl, 0),
+                COALESCE(ptv.balance, 0)
+            )
+            ORDER BY ptv.report_date
+        ) AS tree_history
+    FROM portfolio_tree_daily_values ptv
+    JOIN portfolios_base pb ON pb.id = ptv.portfolio_id
+    GROUP BY ptv.portfolio_id
+),
+
 full_analytics_data AS (
-    SELECT get_user_portfolios_analytics(p_user_id) AS analytics_json
+    SELECT get_user_portfolios_analytics(p_user_id, p_portfolio_ids) AS analytics_json
+    WHERE p_portfolio_ids IS NULL OR cardinality(p_portfolio_ids) > 0
 ),
 
 portfolio_analytics_map AS (
@@ -279,6 +317,7 @@ SELECT jsonb_build_object(
                 'parent_portfolio_id', p.parent_portfolio_id,
                 'assets', COALESCE(pad.assets, '[]'::jsonb),
                 'history', COALESCE(phd.history, '[]'::jsonb),
+                'tree_history', pth.tree_history,
                 'analytics', COALESCE(paf.analytics, '{}'::jsonb),
                 'connection', COALESCE(cd.connection, '{}'::jsonb),
                 'balance', COALESCE(phd.balance, 0)
@@ -293,6 +332,7 @@ SELECT jsonb_build_object(
 FROM portfolios_base p
 LEFT JOIN portfolio_assets_data pad ON pad.portfolio_id = p.id
 LEFT JOIN portfolio_history_data phd ON phd.portfolio_id = p.id
+LEFT JOIN portfolio_tree_history pth ON pth.portfolio_id = p.id
 LEFT JOIN portfolio_analytics_final paf ON paf.portfolio_id = p.id
 LEFT JOIN connections_data cd ON cd.portfolio_id = p.id;
 $$ LANGUAGE sql;
@@ -71,7 +71,13 @@ BEGIN
 END;
 $rate$;
 
-CREATE OR REPLACE FUNCTION get_user_portfolios_analytics(p_user_id uuid)
+DROP FUNCTION IF EXISTS get_user_portfolios_analytics(uuid);
+
+-- p_portfolio_ids — только эти портфели пользователя (NULL — все; фрагменты дашборда)
+CREATE OR REPLACE FUNCTION get_user_portfolios_analytics(
+  p_user_id uuid,
+  p_portfolio_ids bigint[] DEFAULT NULL
+)
 RETURNS json
 LANGUAGE plpgsql STABLE
 AS $$
@@ -83,6 +89,7 @@ WITH p AS (
   SELECT id, name
   FROM portfolios
   WHERE user_id = p_user_id
+    AND (p_portfolio_ids IS NULL OR id = ANY(p_portfolio_ids))
 ),
 ops AS (
   SELECT
@@ -238,6 +238,23 @@ CREATE TABLE IF NOT EXISTS portfolio_daily_values (
   CONSTRAINT portfolio_daily_values_portfolio_id_fkey FOREIGN KEY (portfolio_id) REFERENCES portfolios(id) ON DELETE CASCADE
 );
 
+-- Итоги поддерева портфеля по дням (сам портфель + все потомки), только для портфелей
+-- с дочерними; ведёт refresh_portfolio_tree_values из update_portfolio_values_from_date
+CREATE TABLE IF NOT EXISTS portfolio_tree_daily_values (
+  portfolio_id bigint NOT NULL,
+  report_date date NOT NULL,
+  total_value numeric,
+  total_invested numeric,
+  total_payouts numeric,
+  total_realized numeric,
+  total_pnl numeric,
+  total_commissions numeric DEFAULT 0,
+  total_taxes numeric DEFAULT 0,
+  balance numeric DEFAULT 0,
+  CONSTRAINT portfolio_tree_daily_values_pkey PRIMARY KEY (portfolio_id, report_date),
+  CONSTRAINT portfolio_tree_daily_values_portfolio_id_fkey FOREIGN KEY (portfolio_id) REFERENCES portfolios(id) ON DELETE CASCADE
+);
+
 CREATE TABLE IF NOT EXISTS import_tasks (
   id bigint GENERATED ALWAYS AS IDENTITY NOT NULL,
   portfolio_id bigint NOT NULL,
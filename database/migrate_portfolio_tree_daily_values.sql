@@ -0,0 +1,24 @@
+-- Таблица итогов поддеревьев и первичное заполнение для уже развёрнутой БД.
+-- Выполнить после refresh_portfolio_tree_values.sql; дальше таблицу ведёт
+-- update_portfolio_values_from_date.
+CREATE TABLE IF NOT EXISTS portfolio_tree_daily_values (
+  portfolio_id bigint NOT NULL,
+  report_date date NOT NULL,
+  total_value numeric,
+  total_invested numeric,
+  total_payouts numeric,
+  total_realized numeric,
+  total_pnl numeric,
+  total_commissions numeric DEFAULT 0,
+  total_taxes numeric DEFAULT 0,
+  balance numeric DEFAULT 0,
+  CONSTRAINT portfolio_tree_daily_values_pkey PRIMARY KEY (portfolio_id, report_date),
+  CONSTRAINT portfolio_tree_daily_values_portfolio_id_fkey FOREIGN KEY (portfolio_id) REFERENCES portfolios(id) ON DELETE CASCADE
+);
+
+-- Один пакет: поддеревья пересчитываются снизу вверх, каждое один раз
+SELECT refresh_portfolio_tree_values_batch(array_agg(p.id))
+FROM portfolios p
+WHERE EXISTS (
+    SELECT 1 FROM portfolios c WHERE c.parent_portfolio_id = p.id
+);
@@ -80,12 +80,22 @@ BEGIN
         SELECT DISTINCT id FROM all_portfolios
     LOOP
         BEGIN
-            PERFORM update_portfolio_values_from_date(v_parent_id, v_from_date);
+            PERFORM update_portfolio_values_from_date(v_parent_id, v_from_date, false);
         EXCEPTION WHEN OTHERS THEN
             RAISE WARNING 'Ошибка при обновлении портфеля %: %', v_parent_id, SQLERRM;
         END;
     END LOOP;
 
+    -- Итоги поддеревьев source, target и их предков — один пересчёт на узел
+    BEGIN
+        PERFORM refresh_portfolio_tree_values_batch(
+            ARRAY[v_source_portfolio_id, p_target_portfolio_id],
+            ARRAY[v_from_date, v_from_date]
+        );
+    EXCEPTION WHEN OTHERS THEN
+        RAISE WARNING 'Ошибка при обновлении итогов поддеревьев: %', SQLERRM;
+    END;
+
     RETURN jsonb_build_object(
         'success', true,
         'message', 'Актив успешно перемещен',
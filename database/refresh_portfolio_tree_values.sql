@@ -0,0 +1,247 @@
+-- Итоги поддеревьев (portfolio_tree_daily_values) для портфелей и всех их предков с дат.
+-- Правила те же, что у суммирования истории детей на бэкенде (PortfolioTree, HistorySeries.sum):
+-- итог узла на дату — его собственная запись portfolio_daily_values на эту дату (без записи — 0)
+-- плюс ряды поддеревьев прямых детей, доведённые forward fill по дням от их первой даты до самой
+-- поздней даты среди детей и самого узла. Ряд поддерева ребёнка — его portfolio_tree_daily_values,
+-- если у него есть дочерние, иначе его portfolio_daily_values; поэтому узлы пересчитываются
+-- снизу вверх. Для портфелей без дочерних строки удаляются.
+--
+-- Каждый предок пересчитывается один раз — с минимальной из дат его потомков в пакете.
+-- Перед DELETE берутся advisory-блокировки всех пересчитываемых узлов в порядке id:
+-- пересчёты общих предков из параллельных транзакций (воркер цен, пакеты операций)
+-- выполняются по очереди, без дубликатов (portfolio_id, report_date) и без взаимоблокировок.
+-- Ждущая транзакция после блокировки читает уже закоммиченные строки соседей.
+CREATE OR REPLACE FUNCTION refresh_portfolio_tree_values_batch(
+    p_portfolio_ids bigint[],
+    p_from_dates date[] DEFAULT NULL
+)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_node_ids bigint[];
+    v_node_dates date[];
+    v_node_id bigint;
+    v_from_date date;
+    v_refreshed integer := 0;
+    i integer;
+BEGIN
+    IF p_portfolio_ids IS NULL OR array_length(p_portfolio_ids, 1) IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    WITH RECURSIVE ancestors AS (
+        SELECT
+            t.id,
+            COALESCE(t.from_date, '0001-01-01'::date) AS from_date,
+            0 AS depth,
+            ARRAY[t.id] AS path
+        FROM unnest(p_portfolio_ids, p_from_dates) AS t(id, from_date)
+        WHERE t.id IS NOT NULL
+        UNION ALL
+        SELECT p.parent_portfolio_id, a.from_date, a.depth + 1, a.path || p.parent_portfolio_id
+        FROM portfolios p
+        JOIN ancestors a ON a.id = p.id
+        WHERE p.parent_portfolio_id IS NOT NULL
+          AND p.parent_portfolio_id <> ALL(a.path)
+    ),
+    nodes AS (
+        SELECT id, MIN(from_date) AS from_date, MAX(depth) AS depth
+        FROM ancestors
+        GROUP BY id
+    )
+    -- Потомки раньше предков: depth узла больше depth любого его потомка из пакета
+    SELECT array_agg(id ORDER BY depth, id), array_agg(from_date ORDER BY depth, id)
+    INTO v_node_ids, v_node_dates
+    FROM nodes;
+
+    IF v_node_ids IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    FOR v_node_id IN SELECT unnest(v_node_ids) ORDER BY 1 LOOP
+        PERFORM pg_advisory_xact_lock(hashtext('portfolio_tree_' || v_node_id::text));
+    END LOOP;
+
+    FOR i IN 1 .. array_length(v_node_ids, 1) LOOP
+        v_node_id := v_node_ids[i];
+        v_from_date := v_node_dates[i];
+
+        DELETE FROM portfolio_tree_daily_values
+        WHERE portfolio_id = v_node_id
+          AND report_date >= v_from_date;
+
+        CONTINUE WHEN NOT EXISTS (
+            SELECT 1 FROM portfolios WHERE parent_portfolio_id = v_node_id
+        );
+
+        INSERT INTO portfolio_tree_daily_values (
+            portfolio_id,
+            report_date,
+            total_value,
+            total_invested,
+            total_payouts,
+            total_realized,
+            total_commissions,
+            total_taxes,
+            total_pnl,
+            balance
+        )
+        WITH children AS (
+            SELECT
+                c.id,
+                EXISTS (SELECT 1 FROM portfolios g WHERE g.parent_portfolio_id = c.id) AS has_children
+            FROM portfolios c
+            WHERE c.parent_portfolio_id = v_node_id
+        ),
+        child_series AS (
+            SELECT
+                c.id,
+                v.*,
+                MAX(v.report_date) FILTER (WHERE v.report_date <= v_from_date)
+                    OVER (PARTITION BY c.id) AS anchor_date
+            FROM children c
+            CROSS JOIN LATERAL (
+                SELECT
+                    ptv.report_date,
+                    ptv.total_value,
+                    ptv.total_invested,
+                    ptv.total_payouts,
+                    ptv.total_realized,
+                    ptv.total_commissions,
+                    ptv.total_taxes,
+                    ptv.total_pnl,
+                    ptv.balance
+                FROM portfolio_tree_daily_values ptv
+                WHERE c.has_children AND ptv.portfolio_id = c.id
+                UNION ALL
+                SELECT
+                    pdv.report_date,
+                    pdv.total_value,
+                    pdv.total_invested,
+                    pdv.total_payouts,
+                    pdv.total_realized,
+                    pdv.total_commissions,
+                    pdv.total_taxes,
+                    pdv.total_pnl,
+                    pdv.balance
+                FROM portfolio_daily_values pdv
+                WHERE NOT c.has_children AND pdv.portfolio_id = c.id
+            ) v
+        ),
+        -- Записи с последней не позже v_from_date: её значение продолжается на следующие дни
+        child_rows AS (
+            SELECT * FROM child_series
+            WHERE report_date >= COALESCE(anchor_date, report_date)
+        ),
+        bounds AS (
+            SELECT GREATEST(
+                (SELECT MAX(report_date) FROM child_series),
+                (SELECT MAX(report_date) FROM portfolio_daily_values WHERE portfolio_id = v_node_id)
+            ) AS max_date
+        ),
+        child_days AS (
+            SELECT f.id, g.day::date AS report_date
+            FROM (SELECT id, MIN(report_date) AS first_date FROM child_rows GROUP BY id) f
+            CROSS JOIN bounds b
+            CROSS JOIN generate_series(f.first_date, b.max_date, interval '1 day') AS g(day)
+        ),
+        -- grp — номер последней записи ребёнка на дату или раньше
+        child_filled AS (
+            SELECT
+                cd.id,
+                cd.report_date,
+                cr.total_value,
+                cr.total_invested,
+                cr.total_payouts,
+                cr.total_realized,
+                cr.total_commissions,
+                cr.total_taxes,
+                cr.total_pnl,
+                cr.balance,
+                COUNT(cr.report_date) OVER (PARTITION BY cd.id ORDER BY cd.report_date) AS grp
+            FROM child_days cd
+            LEFT JOIN child_rows cr ON cr.id = cd.id AND cr.report_date = cd.report_date
+        ),
+        children_sum AS (
+            SELECT
+                report_date,
+                SUM(total_value) AS total_value,
+                SUM(total_invested) AS total_invested,
+                SUM(total_payouts) AS total_payouts,
+                SUM(total_realized) AS total_realized,
+                SUM(total_commissions) AS total_commissions,
+                SUM(total_taxes) AS total_taxes,
+                SUM(total_pnl) AS total_pnl,
+                SUM(balance) AS balance
+            FROM (
+                SELECT
+                    report_date,
+                    MAX(total_value) OVER w AS total_value,
+                    MAX(total_invested) OVER w AS total_invested,
+                    MAX(total_payouts) OVER w AS total_payouts,
+                    MAX(total_realized) OVER w AS total_realized,
+                    MAX(total_commissions) OVER w AS total_commissions,
+                    MAX(total_taxes) OVER w AS total_taxes,
+                    MAX(total_pnl) OVER w AS total_pnl,
+                    MAX(balance) OVER w AS balance
+                FROM child_filled
+                WINDOW w AS (PARTITION BY id, grp)
+            ) ff
+            WHERE report_date >= v_from_date
+            GROUP BY report_date
+        ),
+        own_rows AS (
+            SELECT
+                pdv.report_date,
+                pdv.total_value,
+                pdv.total_invested,
+                pdv.total_payouts,
+                pdv.total_realized,
+                pdv.total_commissions,
+                pdv.total_taxes,
+                pdv.total_pnl,
+                pdv.balance
+            FROM portfolio_daily_values pdv
+            WHERE pdv.portfolio_id = v_node_id
+              AND pdv.report_date >= v_from_date
+        )
+        SELECT
+            v_node_id,
+            COALESCE(o.report_date, cs.report_date),
+            ROUND((COALESCE(o.total_value, 0) + COALESCE(cs.total_value, 0))::numeric, 2),
+            ROUND((COALESCE(o.total_invested, 0) + COALESCE(cs.total_invested, 0))::numeric, 2),
+            ROUND((COALESCE(o.total_payouts, 0) + COALESCE(cs.total_payouts, 0))::numeric, 2),
+            ROUND((COALESCE(o.total_realized, 0) + COALESCE(cs.total_realized, 0))::numeric, 2),
+            ROUND((COALESCE(o.total_commissions, 0) + COALESCE(cs.total_commissions, 0))::numeric, 2),
+            ROUND((COALESCE(o.total_taxes, 0) + COALESCE(cs.total_taxes, 0))::numeric, 2),
+            ROUND((COALESCE(o.total_pnl, 0) + COALESCE(cs.total_pnl, 0))::numeric, 2),
+            ROUND((COALESCE(o.balance, 0) + COALESCE(cs.balance, 0))::numeric, 2)
+        FROM own_rows o
+        FULL JOIN children_sum cs ON cs.report_date = o.report_date;
+
+        v_refreshed := v_refreshed + 1;
+    END LOOP;
+
+    RETURN v_refreshed;
+END;
+$$;
+
+COMMENT ON FUNCTION refresh_portfolio_tree_values_batch(bigint[], date[]) IS
+'Пересчитывает portfolio_tree_daily_values портфелей и их предков (каждого предка — один раз, '
+'с минимальной даты) под advisory-блокировками узлов. Возвращает число пересчитанных поддеревьев.';
+
+
+CREATE OR REPLACE FUNCTION refresh_portfolio_tree_values(
+    p_portfolio_id bigint,
+    p_from_date date DEFAULT '0001-01-01'
+)
+RETURNS integer
+LANGUAGE sql
+AS $$
+    SELECT refresh_portfolio_tree_values_batch(ARRAY[p_portfolio_id], ARRAY[p_from_date]);
+$$;
+
+COMMENT ON FUNCTION refresh_portfolio_tree_values(bigint, date) IS
+'Пересчитывает portfolio_tree_daily_values портфеля и его предков с p_from_date '
+'(вызывается из update_portfolio_values_from_date). Возвращает число пересчитанных поддеревьев.';
@@ -12,6 +12,7 @@ DECLARE
     v_portfolio_ids bigint[];
     v_portfolio_id bigint;
     v_updated boolean;
+    v_refreshed_ids bigint[] := ARRAY[]::bigint[];
     portfolio_asset_id bigint;
 BEGIN
     -- Если список активов пуст, выходим
@@ -68,8 +69,10 @@ BEGIN
             -- Обновляем portfolio_daily_values для портфеля
             v_updated := update_portfolio_values_from_date(
                 v_portfolio_id,
-                p_from_date
+                p_from_date,
+                false
             );
+            v_refreshed_ids := v_refreshed_ids || v_portfolio_id;
             
             -- Возвращаем результат
             portfolio_id := v_portfolio_id;
@@ -85,6 +88,18 @@ BEGIN
         END;
     END LOOP;
 
+    ------------------------------------------------------------------
+    -- 4. Итоги поддеревьев: общие предки пересчитываются один раз
+    ------------------------------------------------------------------
+    BEGIN
+        PERFORM refresh_portfolio_tree_values_batch(
+            v_refreshed_ids,
+            array_fill(p_from_date, ARRAY[cardinality(v_refreshed_ids)])
+        );
+    EXCEPTION WHEN OTHERS THEN
+        RAISE WARNING 'Ошибка при обновлении итогов поддеревьев: %', SQLERRM;
+    END;
+
     RETURN;
 END;
 $$;
@@ -1,6 +1,8 @@
+DROP FUNCTION IF EXISTS update_portfolio_values_from_date(bigint, date);
 CREATE OR REPLACE FUNCTION update_portfolio_values_from_date(
     p_portfolio_id bigint,
-    p_from_date date DEFAULT '0001-01-01'
+    p_from_date date DEFAULT '0001-01-01',
+    p_refresh_tree boolean DEFAULT true
 )
 RETURNS boolean
 LANGUAGE plpgsql
@@ -176,12 +178,19 @@ BEGIN
     FROM filtered_dates fd
     LEFT JOIN positions_aggregated pa ON pa.report_date = fd.report_date
     LEFT JOIN balance_accumulated ba ON ba.report_date = fd.report_date;
+
+    -- Итоги поддеревьев предков (portfolio_tree_daily_values) за тот же диапазон дат.
+    -- Пакетные вызовы передают false и пересчитывают предков один раз
+    -- через refresh_portfolio_tree_values_batch
+    IF p_refresh_tree THEN
+        PERFORM refresh_portfolio_tree_values(p_portfolio_id, p_from_date);
+    END IF;
     
     RETURN true;
 END;
 $$;
 
-COMMENT ON FUNCTION update_portfolio_values_from_date(bigint, date) IS
+COMMENT ON FUNCTION update_portfolio_values_from_date(bigint, date, boolean) IS
 'Обновляет portfolio_daily_values. Для каждой даты агрегирует ПОСЛЕДНИЕ известные значения '
 'каждого актива (LATERAL), что корректно работает с разреженными portfolio_asset_daily_values '
 'и портфелями, содержащими как системные, так и кастомные активы.';